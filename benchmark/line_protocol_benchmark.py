@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+''' Measures the CPU time per sample spent parsing the JSON messages, one metric per message,
+against the line protocol, many metrics per message, for the same samples. Both are also measured
+on the topics of the metrics/{namespace}/{line}/{station} template, where the messages leave out
+the namespace and dimensions.
+
+    python -m benchmark.line_protocol_benchmark [samples] [samples_per_message]
+'''
+
+import json
+import sys
+import time
+
+from src.line_protocol import parse_headless_lines, parse_line_protocol
+from src.request import PutMetricRequest
+from src.topic_template import TopicTemplate
+
+TOPIC_TEMPLATE = 'metrics/{namespace}/{line}/{station}'
+
+
+def create_samples(count):
+    return [("Namespace{}".format(i % 4), str(i % 7), str(i % 13), float(i), 1600000000 + i) for i in range(count)]
+
+
+def create_json_messages(samples):
+    return [json.dumps({"request": {
+        "namespace": namespace,
+        "metricData": {
+            "metricName": "Latency",
+            "dimensions": [{"name": "line", "value": line}, {"name": "station", "value": station}],
+            "value": value,
+            "unit": "Milliseconds",
+            "timestamp": timestamp
+        }
+    }}).encode('utf-8') for namespace, line, station, value, timestamp in samples]
+
+
+def create_line_messages(samples, samples_per_message):
+    lines = ["{},line={},station={} Latency={}|Milliseconds {}".format(*sample) for sample in samples]
+    return ['\n'.join(lines[start:start + samples_per_message]).encode('utf-8')
+            for start in range(0, len(lines), samples_per_message)]
+
+
+def get_topic(sample):
+    namespace, line, station, _, _ = sample
+    return 'metrics/{}/{}/{}'.format(namespace, line, station)
+
+
+def create_templated_json_messages(samples):
+    return [(get_topic(sample), json.dumps({
+        "metricName": "Latency",
+        "value": sample[3],
+        "unit": "Milliseconds",
+        "timestamp": sample[4]
+    }).encode('utf-8')) for sample in samples]
+
+
+def create_headless_messages(samples, samples_per_message):
+    # The samples of a message share a topic, as a producer publishing for one station would
+    by_topic = {}
+    for sample in samples:
+        by_topic.setdefault(get_topic(sample), []).append("Latency={}|Milliseconds {}".format(sample[3], sample[4]))
+    return [(topic, '\n'.join(lines[start:start + samples_per_message]).encode('utf-8'))
+            for topic, lines in by_topic.items() for start in range(0, len(lines), samples_per_message)]
+
+
+def run_json(messages):
+    start = time.process_time()
+    for message in messages:
+        PutMetricRequest(json.loads(message))
+    return time.process_time() - start
+
+
+def run_line_protocol(messages):
+    start = time.process_time()
+    for message in messages:
+        parse_line_protocol(message)
+    return time.process_time() - start
+
+
+def run_templated_json(messages):
+    topic_template = TopicTemplate(TOPIC_TEMPLATE)
+    start = time.process_time()
+    for topic, message in messages:
+        PutMetricRequest(topic_template.expand(topic, json.loads(message)))
+    return time.process_time() - start
+
+
+def run_headless_lines(messages):
+    topic_template = TopicTemplate(TOPIC_TEMPLATE)
+    start = time.process_time()
+    for topic, message in messages:
+        parse_headless_lines(message, *topic_template.match(topic))
+    return time.process_time() - start
+
+
+def report(label, elapsed, messages, sample_count):
+    print("{:<16}: {:>6.2f} us CPU/sample, {:>4.0f} bytes/sample".format(
+        label, elapsed / sample_count * 1e6, sum(len(message) for message in messages) / sample_count))
+
+
+def main():
+    sample_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    samples_per_message = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    samples = create_samples(sample_count)
+    json_messages = create_json_messages(samples)
+    line_messages = create_line_messages(samples, samples_per_message)
+
+    templated_json_messages = create_templated_json_messages(samples)
+    headless_messages = create_headless_messages(samples, samples_per_message)
+
+    report("json", run_json(json_messages), json_messages, sample_count)
+    report("line protocol", run_line_protocol(line_messages), line_messages, sample_count)
+    report("templated json", run_templated_json(templated_json_messages),
+           [message for _, message in templated_json_messages], sample_count)
+    report("templated lines", run_headless_lines(headless_messages),
+           [message for _, message in headless_messages], sample_count)
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,8 @@
-from src.cloudwatch_metric_connector import main
+import time
+
+start_time = time.monotonic()
+
+from src.cloudwatch_metric_connector import main  # noqa: E402
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main(start_time)
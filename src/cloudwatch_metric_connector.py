@@ -2,156 +2,465 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import json
-import re
-from threading import Thread
+import signal
+import time
+from threading import Event, Lock, Thread
 
 import awsiot.greengrasscoreipc.client as client
-from awsiot.greengrasscoreipc.model import (IoTCoreMessage,
+from awsiot.greengrasscoreipc.model import (ConfigurationUpdateEvents,
+                                            IoTCoreMessage,
                                             SubscriptionResponseMessage)
 
 from src import ipc_utils, utils
-from src.metric.manager import MetricsManager
+from src.configuration import Configuration
+from src.dedup import Deduplicator
+from src.ingest import ShardedIngestEngine
+from src.line_protocol import parse_headless_lines, parse_line_protocol
+from src.metric.backpressure import BackpressureMonitor
+from src.metric.buffer import DrainPolicy
+from src.metric.cardinality import CardinalityLimiter
+from src.metric.router import MetricsRouter
+from src.metric.schedule import FlushSchedule
+from src.metric.sink import EmfFileSink
 from src.request import PutMetricRequest
-
-ipc = ipc_utils.IPCUtils()
-config = ipc.get_configuration()
+from src.sampling import Sampler
+from src.scheduler import create_scheduler
+from src.shutdown import ShutdownCoordinator
+from src.statsd import StatsdListener, parse_statsd_address
+from src.status import ErrorAggregator, StatusPublisher
+from src.topic_template import TopicTemplate
 
 logger = utils.logger
 
-# Setup Configuration
-if utils.PUBLISH_REGION_KEY in config and config[utils.PUBLISH_REGION_KEY] != "":
-    PUBLISH_REGION = config[utils.PUBLISH_REGION_KEY]
-else:
-    PUBLISH_REGION = utils.DEFAULT_PUBLISH_REGION
-
-if utils.PUBLISH_INTERVAL_SEC_KEY in config:
-    try:
-        publish_interval = int(config[utils.PUBLISH_INTERVAL_SEC_KEY])
-    except (ValueError, TypeError):
-        logger.warning("Invalid PublishInterval type. Using the default PublishInterval value: %s"
-                    , utils.DEFAULT_PUBLISH_INTERVAL_SEC)
-        publish_interval = utils.DEFAULT_PUBLISH_INTERVAL_SEC
-
-    if publish_interval > utils.MAX_PUBLISH_INTERVAL_SEC:
-        logger.warning("PublishInterval can not be more than %s seconds, setting it to max value"
-                    , utils.MAX_PUBLISH_INTERVAL_SEC)
-        publish_interval = utils.MAX_PUBLISH_INTERVAL_SEC
-    if publish_interval < 0:
-        logger.warning("Invalid PublishInterval value. Using the default PublishInterval value: %s"
-                    , utils.DEFAULT_PUBLISH_INTERVAL_SEC)
-        publish_interval = utils.DEFAULT_PUBLISH_INTERVAL_SEC
-    PUBLISH_INTERVAL_SEC = publish_interval
-else:
-    PUBLISH_INTERVAL_SEC = utils.DEFAULT_PUBLISH_INTERVAL_SEC
-
-if utils.MAX_METRICS_KEY in config:
-    try:
-        max_metrics = int(config[utils.MAX_METRICS_KEY])
-    except (ValueError, TypeError):
-        logger.warning("Invalid MaxMetricsToRetain type. Using the default MaxMetricsToRetain value: %s"
-                    , utils.DEFAULT_MAX_METRICS)
-        max_metrics = utils.DEFAULT_MAX_METRICS
-
-    if max_metrics < utils.MIN_MAX_METRICS:
-        logger.warning("MaxMetricsToRetain can not be less than %s metrics, setting it to least value"
-                    , utils.MIN_MAX_METRICS)
-        max_metrics = utils.MIN_MAX_METRICS
-    MAX_METRICS = max_metrics
-else:
-    MAX_METRICS = utils.DEFAULT_MAX_METRICS
-
-if utils.INPUT_TOPIC_KEY in config and config[utils.INPUT_TOPIC_KEY] != "":
-    INPUT_TOPIC = config[utils.INPUT_TOPIC_KEY]
-else:
-    INPUT_TOPIC = utils.DEFAULT_INPUT_TOPIC
-
-if utils.OUTPUT_TOPIC_KEY in config and config[utils.OUTPUT_TOPIC_KEY] != "":
-    OUTPUT_TOPIC = config[utils.OUTPUT_TOPIC_KEY]
-else:
-    OUTPUT_TOPIC = utils.DEFAULT_OUTPUT_TOPIC
-
-if utils.PUBSUB_TO_IOT_CORE_KEY in config and config[utils.PUBSUB_TO_IOT_CORE_KEY] != "":
-    PUBSUB_TO_IOT_CORE = config[utils.PUBSUB_TO_IOT_CORE_KEY]
-else:
-    PUBSUB_TO_IOT_CORE = utils.DEFAULT_PUBSUB_TO_IOT_CORE
-
-pubsub_to_iot_core = False
-if re.match(r'true', str(PUBSUB_TO_IOT_CORE), flags=re.IGNORECASE):
-    pubsub_to_iot_core = True
-
-logger.info("Using Configuration:")
-logger.info("%s: %s", utils.PUBLISH_REGION_KEY, PUBLISH_REGION)
-logger.info("%s: %s", utils.PUBLISH_INTERVAL_SEC_KEY, PUBLISH_INTERVAL_SEC)
-logger.info("%s: %s", utils.MAX_METRICS_KEY, MAX_METRICS)
-logger.info("%s: %s", utils.INPUT_TOPIC_KEY, INPUT_TOPIC)
-logger.info("%s: %s", utils.OUTPUT_TOPIC_KEY, OUTPUT_TOPIC)
-logger.info("%s: %s", utils.PUBSUB_TO_IOT_CORE_KEY, PUBSUB_TO_IOT_CORE)
-
-metrics_manager = MetricsManager(
-    PUBLISH_REGION, PUBLISH_INTERVAL_SEC, MAX_METRICS)
-
-
-def main():
-
-    # Subscribe to IoT Core topic
-    if pubsub_to_iot_core:
-        ipc.subscribe_to_iot_topic(INPUT_TOPIC, IoTCoreStreamHandler())
-
-    # Subscribe to local Pub Sub topic
-    ipc.subscribe_to_pubsub_topic(INPUT_TOPIC, PubSubStreamHandler())
-
-
-def put_metrics(metric_request):
-    metric_request.add_dimension('coreName', utils.GG_CORE_NAME)
-    metrics_manager.add_metric(
-        metric_request.namespace, metric_request.metric_datum)
+
+class CloudWatchMetricConnector:
+    ''' Wires the IPC subscriptions to the MetricsRouter. Nothing is connected or subscribed
+    until start() is called, so importing this module has no side effects.
+
+    Binary messages on the PubSub input topic are parsed as the compact line protocol of
+    src.line_protocol, with many metrics per message.
+
+    With TopicTemplates set, the wildcard topic of each template is subscribed to as well, on
+    AWS IoT Core too with PubSubToIoTCore. The namespace and dimensions of the metrics published
+    there come from the topic, see src.topic_template.
+
+    With SampleRates set, the samples of the listed namespaces and metrics are kept with a
+    probability, before their message is parsed where possible, and the kept ones are weighted by
+    the inverse of their rate.
+
+    With IngestWorkers set, JSON messages are parsed by a ShardedIngestEngine in worker processes
+    instead of on the IPC callback threads.
+
+    With StatsdAddress set, a StatsdListener aggregates the StatsD datagrams received on that UDP
+    port or Unix datagram socket into the StatsdNamespace, once per PublishInterval.
+
+    With AsyncioWorkers set, the timers, background flushes and status publishing run on an
+    AsyncioScheduler instead of a thread each. The engine is chosen at start up, a change of
+    AsyncioWorkers is applied on the next restart.
+
+    Configuration updates are applied live: the MetricsRouter settings are updated in place and
+    the input topic subscriptions are replaced, buffered metrics are kept.
+    arguments:
+    ipc -- IPCUtils used for subscriptions and status responses
+    configuration -- parsed component Configuration
+    '''
+
+    def __init__(self, ipc, configuration):
+        self.ipc = ipc
+        self.configuration = configuration
+        self.scheduler = create_scheduler(configuration.asyncio_workers)
+        self.status_publisher = StatusPublisher(
+            ipc, configuration.output_topic, configuration.pubsub_to_iot_core, self.scheduler)
+        self.error_aggregator = ErrorAggregator(
+            self.status_publisher, configuration.error_report_window_sec, self.scheduler)
+        self.backpressure_monitor = BackpressureMonitor(
+            self.status_publisher, *self.__get_backpressure_settings(configuration), self.scheduler)
+        self.flush_schedule = FlushSchedule(
+            configuration.flush_alignment, configuration.flush_jitter / 100, utils.GG_CORE_NAME,
+            max_latency=configuration.max_flush_latency_sec)
+        self.drain_policy = DrainPolicy(*self.__get_drain_policy_settings(configuration))
+        self.emf_sink = EmfFileSink(
+            configuration.emf_file_path, configuration.emf_file_max_bytes, configuration.emf_file_backup_count)
+        self.metrics_manager = MetricsRouter(
+            configuration.publish_region, configuration.publish_interval_sec, configuration.max_metrics,
+            status_publisher=self.status_publisher, backpressure_monitor=self.backpressure_monitor,
+            emf_sink=self.emf_sink, scheduler=self.scheduler, flush_schedule=self.flush_schedule,
+            drain_policy=self.drain_policy, **self.__get_metrics_manager_settings(configuration))
+        self.deduplicator = self.__create_deduplicator(configuration)
+        self.cardinality_limiter = self.__create_cardinality_limiter(configuration)
+        self.sampler = self.__create_sampler(configuration)
+        self.ingest_engine = None
+        self.statsd_listener = None
+        self.pubsub_operation = None
+        self.iot_operation = None
+        self.template_operations = []
+        self.configuration_operation = None
+        self.__configuration_lock = Lock()
+
+    def start(self):
+        # Build the CloudWatch client while the subscriptions are being set up,
+        # so that the first flush does not pay for it.
+        if self.configuration.prewarm_client:
+            Thread(target=self.metrics_manager.prewarm_client, daemon=True).start()
+
+        self.ingest_engine = self.__start_ingest_engine(self.configuration)
+        self.statsd_listener = self.__start_statsd_listener(self.configuration)
+        self.__subscribe_to_input_topic(self.configuration)
+        self.template_operations = self.__subscribe_to_topic_templates(self.configuration)
+        self.configuration_operation = self.ipc.subscribe_to_configuration_update(ConfigurationUpdateHandler(self))
+
+    def stop_ingest(self):
+        with self.__configuration_lock:
+            for operation in (self.pubsub_operation, self.iot_operation, self.configuration_operation,
+                              *self.template_operations):
+                if operation is not None:
+                    self.ipc.close_subscription(operation)
+            self.pubsub_operation = self.iot_operation = self.configuration_operation = None
+            self.template_operations = []
+            ingest_engine, self.ingest_engine = self.ingest_engine, None
+            statsd_listener, self.statsd_listener = self.statsd_listener, None
+        # Messages already handed to the workers still make it to the buffers
+        if ingest_engine is not None:
+            ingest_engine.stop()
+        if statsd_listener is not None:
+            statsd_listener.stop()
+        self.metrics_manager.close()
+
+    def __start_ingest_engine(self, configuration):
+        if configuration.ingest_workers <= 0:
+            return None
+        ingest_engine = ShardedIngestEngine(configuration.ingest_workers, self)
+        ingest_engine.start()
+        return ingest_engine
+
+    def __start_statsd_listener(self, configuration):
+        address = parse_statsd_address(configuration.statsd_address)
+        if address is None:
+            return None
+        statsd_listener = StatsdListener(
+            address, configuration.statsd_namespace, configuration.publish_interval_sec,
+            configuration.sketch_relative_accuracy / 100, self, self.scheduler)
+        try:
+            statsd_listener.start()
+        except OSError:
+            logger.exception("Could not listen for StatsD metrics on %s: ", configuration.statsd_address)
+            return None
+        return statsd_listener
+
+    def sample_message(self, message):
+        ''' Returns the rate a raw (bytes) or decoded message is kept at, or None if it is dropped. '''
+        sampler = self.sampler
+        if sampler is None:
+            return 1.0
+        return sampler.sample_message(message)
+
+    def submit_message(self, message, sample_rate=1.0):
+        ''' Parses a raw (bytes) or decoded message and puts its metrics, in the ingest workers if
+        they are enabled. Returns False if the caller has to parse it itself.
+        '''
+        ingest_engine = self.ingest_engine
+        if ingest_engine is None:
+            return False
+        ingest_engine.submit(message, sample_rate)
+        return True
+
+    def __subscribe_to_input_topic(self, configuration):
+        # Subscribe to IoT Core topic
+        if configuration.pubsub_to_iot_core:
+            self.iot_operation = self.ipc.subscribe_to_iot_topic(
+                configuration.input_topic, IoTCoreStreamHandler(self))
+
+        # Subscribe to local Pub Sub topic
+        self.pubsub_operation = self.ipc.subscribe_to_pubsub_topic(
+            configuration.input_topic, PubSubStreamHandler(self))
+
+    def __subscribe_to_topic_templates(self, configuration):
+        operations = []
+        for template in configuration.topic_templates:
+            topic_template = TopicTemplate(template)
+            if configuration.pubsub_to_iot_core:
+                operations.append(self.ipc.subscribe_to_iot_topic(
+                    topic_template.topic, IoTCoreStreamHandler(self, topic_template)))
+            operations.append(self.ipc.subscribe_to_pubsub_topic(
+                topic_template.topic, PubSubStreamHandler(self, topic_template)))
+        return operations
+
+    def reload_configuration(self):
+        config = self.ipc.get_configuration()
+        if config is None:
+            logger.warning("Could not fetch the updated configuration, keeping the current one")
+            return
+        self.apply_configuration(Configuration(config))
+
+    def apply_configuration(self, configuration):
+        with self.__configuration_lock:
+            previous = self.configuration
+            self.configuration = configuration
+            configuration.log()
+
+            self.metrics_manager.update_settings(
+                configuration.publish_region, configuration.publish_interval_sec, configuration.max_metrics,
+                **self.__get_metrics_manager_settings(configuration))
+            self.emf_sink.update_settings(
+                configuration.emf_file_path, configuration.emf_file_max_bytes, configuration.emf_file_backup_count)
+
+            self.status_publisher.output_topic = configuration.output_topic
+            self.status_publisher.pubsub_to_iot_core = configuration.pubsub_to_iot_core
+            self.error_aggregator.update_settings(configuration.error_report_window_sec)
+            self.backpressure_monitor.update_settings(*self.__get_backpressure_settings(configuration))
+            self.flush_schedule.update_settings(*self.__get_flush_schedule_settings(configuration))
+            self.drain_policy.update_settings(*self.__get_drain_policy_settings(configuration))
+            if configuration.asyncio_workers != previous.asyncio_workers:
+                logger.warning("%s changed from %s to %s, restart the component to apply it"
+                               , utils.ASYNCIO_WORKERS_KEY, previous.asyncio_workers, configuration.asyncio_workers)
+            if (configuration.deduplication_window_sec != previous.deduplication_window_sec
+                    or configuration.deduplication_capacity != previous.deduplication_capacity):
+                self.deduplicator = self.__create_deduplicator(configuration)
+            if configuration.max_series_per_metric != previous.max_series_per_metric:
+                self.cardinality_limiter = self.__create_cardinality_limiter(configuration)
+            if configuration.sample_rates != previous.sample_rates:
+                self.sampler = self.__create_sampler(configuration)
+            if configuration.ingest_workers != previous.ingest_workers and self.pubsub_operation is not None:
+                # New messages go to the new workers while the old ones drain
+                ingest_engine, self.ingest_engine = self.ingest_engine, self.__start_ingest_engine(configuration)
+                if ingest_engine is not None:
+                    Thread(target=ingest_engine.stop, daemon=True).start()
+            if self.pubsub_operation is not None:
+                if (configuration.statsd_address != previous.statsd_address
+                        or configuration.statsd_namespace != previous.statsd_namespace
+                        or configuration.sketch_relative_accuracy != previous.sketch_relative_accuracy):
+                    # The old listener releases the socket and puts its window before the new one binds it
+                    if self.statsd_listener is not None:
+                        self.statsd_listener.stop()
+                    self.statsd_listener = self.__start_statsd_listener(configuration)
+                elif self.statsd_listener is not None:
+                    self.statsd_listener.update_settings(configuration.publish_interval_sec)
+
+            if (configuration.input_topic != previous.input_topic
+                    or configuration.pubsub_to_iot_core != previous.pubsub_to_iot_core):
+                # Subscribe to the new topic before closing the old one so that ingest never stops
+                pubsub_operation, iot_operation = self.pubsub_operation, self.iot_operation
+                self.iot_operation = None
+                self.__subscribe_to_input_topic(configuration)
+                for operation in (pubsub_operation, iot_operation):
+                    if operation is not None:
+                        self.ipc.close_subscription(operation)
+            if (self.pubsub_operation is not None
+                    and (configuration.topic_templates != previous.topic_templates
+                         or configuration.pubsub_to_iot_core != previous.pubsub_to_iot_core)):
+                template_operations = self.template_operations
+                self.template_operations = self.__subscribe_to_topic_templates(configuration)
+                for operation in template_operations:
+                    self.ipc.close_subscription(operation)
+
+    def __get_metrics_manager_settings(self, configuration):
+        # Settings of the MetricsRouter that follow configuration updates, besides region, interval and size
+        return {
+            'namespace_idle_timeout': configuration.namespace_idle_timeout_sec,
+            'max_namespaces': configuration.max_namespaces,
+            'max_buffer_bytes': configuration.max_buffer_bytes,
+            'namespace_priorities': configuration.namespace_priorities,
+            'max_concurrent_uploads': configuration.max_concurrent_uploads,
+            'region_routes': configuration.region_routes,
+            'namespace_sinks': configuration.namespace_sinks,
+            'sketch_metrics': configuration.sketch_metrics,
+            'sketch_relative_accuracy': configuration.sketch_relative_accuracy / 100
+        }
+
+    def __get_backpressure_settings(self, configuration):
+        # An empty topic sends the events to the output topic, which follows configuration updates
+        return (configuration.backpressure_topic or None, configuration.backpressure_high_watermark / 100,
+                configuration.backpressure_low_watermark / 100)
+
+    def __get_flush_schedule_settings(self, configuration):
+        return configuration.flush_alignment, configuration.flush_jitter / 100, configuration.max_flush_latency_sec
+
+    def __get_drain_policy_settings(self, configuration):
+        return configuration.drain_order, configuration.backfill_share / 100, configuration.max_metric_age_sec
+
+    def __create_deduplicator(self, configuration):
+        if configuration.deduplication_window_sec <= 0:
+            return None
+        return Deduplicator(configuration.deduplication_window_sec, configuration.deduplication_capacity)
+
+    def __create_sampler(self, configuration):
+        if not configuration.sample_rates:
+            return None
+        return Sampler({namespace: {metric_name: rate / 100 for metric_name, rate in metric_rates.items()}
+                        for namespace, metric_rates in configuration.sample_rates.items()})
+
+    def __create_cardinality_limiter(self, configuration):
+        if configuration.max_series_per_metric <= 0:
+            return None
+        return CardinalityLimiter(configuration.max_series_per_metric, self.status_publisher)
+
+    def put_metrics(self, metric_request):
+        deduplicator = self.deduplicator
+        if deduplicator is not None and deduplicator.is_duplicate(metric_request):
+            logger.debug("Dropping duplicate metric %s of namespace %s"
+                         , metric_request.metric_name, metric_request.namespace)
+            return
+        cardinality_limiter = self.cardinality_limiter
+        if cardinality_limiter is not None:
+            cardinality_limiter.limit(metric_request)
+        metric_request.add_dimension('coreName', utils.GG_CORE_NAME)
+        self.metrics_manager.add_metric(
+            metric_request.namespace, metric_request.metric_datum, metric_request.priority,
+            metric_request.cumulative)
+
+    def put_line_protocol(self, payload, topic=None):
+        ''' Puts the metrics of a line protocol message. The invalid lines are reported at once. '''
+        metric_requests, errors = parse_line_protocol(payload, sampler=self.sampler)
+        for metric_request in metric_requests:
+            self.put_metrics(metric_request)
+        if errors:
+            self.report_error(
+                ValueError('{} invalid lines, first one: {}'.format(len(errors), errors[0])), topic, payload)
+
+    def put_templated_message(self, topic_template, topic, message):
+        ''' Puts the metrics of a message published on a topic matching topic_template: a decoded
+        or raw JSON message, or headless lines of the line protocol.
+        '''
+        if isinstance(message, (bytes, bytearray, str)) and message.lstrip()[:1] not in (b'{', '{'):
+            namespace, dimensions = topic_template.match(topic)
+            metric_requests, errors = parse_headless_lines(message, namespace, dimensions, sampler=self.sampler)
+            for metric_request in metric_requests:
+                self.put_metrics(metric_request)
+            if errors:
+                self.report_error(
+                    ValueError('{} invalid lines, first one: {}'.format(len(errors), errors[0])), topic, message)
+            return
+        if not isinstance(message, dict):
+            message = json.loads(message)
+        namespace, dimensions = topic_template.match(topic)
+        sampler = self.sampler
+        sample_rate = 1.0
+        if sampler is not None and isinstance(message, dict):
+            sample_rate = sampler.sample(namespace, message.get(utils.FIELD_METRIC_NAME))
+            if sample_rate is None:
+                return
+        metric_request = PutMetricRequest.from_template(namespace, dimensions, message)
+        metric_request.apply_sample_rate(sample_rate)
+        self.put_metrics(metric_request)
+
+    def report_error(self, e, topic=None, payload=None):
+        ''' Reports the error of a message on the status topic, summarized with the other errors of
+        the window by the ErrorAggregator.
+        arguments:
+        e -- the exception raised by the message
+        topic -- topic the message was published on, the input topic by default
+        payload -- the message, of which a truncated sample is reported
+        '''
+        self.error_aggregator.add(e, topic or self.configuration.input_topic, payload)
+
+
+def main(start_time=None):
+    if start_time is None:
+        start_time = time.monotonic()
+    utils.start_logging()
+    logger.info("Connector modules imported in %.3f seconds", time.monotonic() - start_time)
+
+    ipc = ipc_utils.IPCUtils()
+    configuration = Configuration(ipc.get_configuration())
+    configuration.log()
+
+    connector = CloudWatchMetricConnector(ipc, configuration)
+    connector.start()
+    logger.info("Subscribed to %s in %.3f seconds since start",
+                configuration.input_topic, time.monotonic() - start_time)
+
+    # Keep the thread alive until Greengrass stops the component, or the process will exit.
+    shutdown_requested = Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: shutdown_requested.set())
+    while not shutdown_requested.wait(10):
+        pass
+
+    logger.info('Shutdown requested.')
+    ShutdownCoordinator(connector).shutdown()
+    utils.stop_logging()
 
 
 class PubSubStreamHandler(client.SubscribeToTopicStreamHandler):
-    def __init__(self):
+    def __init__(self, connector, topic_template=None):
         super().__init__()
+        self.connector = connector
+        self.topic_template = topic_template
 
     def on_stream_event(self, event: SubscriptionResponseMessage) -> None:
+        topic = message = None
         try:
-            message = event.json_message.message
+            received = event.json_message if event.json_message is not None else event.binary_message
+            message = received.message
+            topic = received.context.topic if received.context is not None else None
+            if self.topic_template is not None:
+                self.connector.put_templated_message(self.topic_template, topic, message)
+                return
+            if event.json_message is None:
+                self.connector.put_line_protocol(message, topic)
+                return
             logger.debug("Received new message: %s", message)
+            sample_rate = self.connector.sample_message(message)
+            if sample_rate is None or self.connector.submit_message(message, sample_rate):
+                return
             metric_request = PutMetricRequest(message)
-            put_metrics(metric_request)
+            metric_request.apply_sample_rate(sample_rate)
+            self.connector.put_metrics(metric_request)
+        except ValueError as e:
+            # Malformed messages are reported on the status topic, their traceback tells nothing more
+            logger.warning("Dropping an invalid metric message: %s", e)
+            self.connector.report_error(e, topic, message)
         except Exception as e:
             logger.exception("Error putting metrics to Cloudwatch: ")
-            response = utils.generate_error_response(
-                str(e.__class__), str(e), "")
-            Thread(
-                target=ipc.publish_message,
-                args=(OUTPUT_TOPIC, response, pubsub_to_iot_core),
-            ).start()
-            logger.debug(json.dumps(response))
+            self.connector.report_error(e, topic, message)
 
     def on_stream_error(self, error: Exception) -> bool:
         logger.exception("Received a stream error: ")
         return False  # Return True to close stream, False to keep stream open.
 
 
+class ConfigurationUpdateHandler(client.SubscribeToConfigurationUpdateStreamHandler):
+    def __init__(self, connector):
+        super().__init__()
+        self.connector = connector
+
+    def on_stream_event(self, event: ConfigurationUpdateEvents) -> None:
+        # Fetching the configuration is an IPC call itself, it must not block the stream callback
+        Thread(target=self.connector.reload_configuration).start()
+
+    def on_stream_error(self, error: Exception) -> bool:
+        logger.exception("Received a configuration update stream error: ")
+        return False  # Return True to close stream, False to keep stream open.
+
+
 class IoTCoreStreamHandler(client.SubscribeToIoTCoreStreamHandler):
-    def __init__(self):
+    def __init__(self, connector, topic_template=None):
         super().__init__()
+        self.connector = connector
+        self.topic_template = topic_template
 
     def on_stream_event(self, event: IoTCoreMessage) -> None:
         try:
+            if self.topic_template is not None:
+                self.connector.put_templated_message(
+                    self.topic_template, event.message.topic_name, event.message.payload)
+                return
+            sample_rate = self.connector.sample_message(event.message.payload)
+            if sample_rate is None or self.connector.submit_message(event.message.payload, sample_rate):
+                return
             message = event.message.payload.decode('utf-8')
             dict_message = json.loads(message)
             logger.debug("Received new message: %s", message)
             metric_request = PutMetricRequest(dict_message)
-            put_metrics(metric_request)
+            metric_request.apply_sample_rate(sample_rate)
+            self.connector.put_metrics(metric_request)
+        except ValueError as e:
+            # Malformed messages are reported on the status topic, their traceback tells nothing more
+            logger.warning("Dropping an invalid metric message: %s", e)
+            self.connector.report_error(e, event.message.topic_name, event.message.payload)
         except Exception as e:
             logger.exception("Error putting metrics to Cloudwatch: ")
-            response = utils.generate_error_response(
-                str(e.__class__), str(e), "")
-            Thread(
-                target=ipc.publish_message,
-                args=(OUTPUT_TOPIC, response, pubsub_to_iot_core),
-            ).start()
-            logger.debug(json.dumps(response))
+            self.connector.report_error(e, event.message.topic_name, event.message.payload)
 
     def on_stream_error(self, error: Exception) -> bool:
         logger.exception("Received a stream error: ")
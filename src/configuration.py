@@ -0,0 +1,359 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import re
+
+from src import utils
+from src.metric.buffer import parse_drain_order
+from src.metric.priority import parse_priority
+from src.metric.sketch import ALL_METRICS
+from src.metric.sink import parse_sink
+from src.statsd import parse_statsd_address
+from src.topic_template import TopicTemplate
+
+logger = utils.logger
+
+
+def parse_bool(value):
+    return re.match(r'true', str(value), flags=re.IGNORECASE) is not None
+
+
+class Configuration:
+    ''' Component configuration, parsed from the dict returned by the GetConfiguration IPC call.
+    Missing, empty or invalid values fall back to their defaults.
+    '''
+
+    def __init__(self, config):
+        if config is None:
+            config = {}
+
+        self.publish_region = self.__parse_region(config)
+        self.publish_interval_sec = self.__parse_publish_interval(config)
+        self.max_metrics = self.__parse_max_metrics(config)
+        self.max_buffer_bytes = self.__get_int(
+            config, utils.MAX_BUFFER_BYTES_KEY, utils.DEFAULT_MAX_BUFFER_BYTES, 0, utils.MAX_MAX_BUFFER_BYTES)
+        self.input_topic = self.__get_string(
+            config, utils.INPUT_TOPIC_KEY, utils.DEFAULT_INPUT_TOPIC)
+        self.output_topic = self.__get_string(
+            config, utils.OUTPUT_TOPIC_KEY, utils.DEFAULT_OUTPUT_TOPIC)
+        self.pubsub_to_iot_core_value = self.__get_string(
+            config, utils.PUBSUB_TO_IOT_CORE_KEY, utils.DEFAULT_PUBSUB_TO_IOT_CORE)
+        self.pubsub_to_iot_core = parse_bool(self.pubsub_to_iot_core_value)
+        self.topic_templates = self.__parse_topic_templates(config)
+        self.prewarm_client = parse_bool(self.__get_string(
+            config, utils.PREWARM_CLIENT_KEY, utils.DEFAULT_PREWARM_CLIENT))
+        self.shutdown_timeout_sec = self.__get_int(
+            config, utils.SHUTDOWN_TIMEOUT_SEC_KEY, utils.DEFAULT_SHUTDOWN_TIMEOUT_SEC,
+            0, utils.MAX_SHUTDOWN_TIMEOUT_SEC)
+        self.namespace_priorities = self.__parse_namespace_priorities(config)
+        self.region_routes = self.__parse_region_routes(config)
+        self.namespace_sinks = self.__parse_namespace_sinks(config)
+        self.sketch_metrics = self.__parse_sketch_metrics(config)
+        self.sample_rates = self.__parse_sample_rates(config)
+        self.sketch_relative_accuracy = self.__get_float(
+            config, utils.SKETCH_RELATIVE_ACCURACY_KEY, utils.DEFAULT_SKETCH_RELATIVE_ACCURACY,
+            utils.MIN_SKETCH_RELATIVE_ACCURACY, utils.MAX_SKETCH_RELATIVE_ACCURACY)
+        self.emf_file_path = self.__get_string(config, utils.EMF_FILE_PATH_KEY, utils.DEFAULT_EMF_FILE_PATH)
+        self.emf_file_max_bytes = self.__get_int(
+            config, utils.EMF_FILE_MAX_BYTES_KEY, utils.DEFAULT_EMF_FILE_MAX_BYTES, 0, utils.MAX_EMF_FILE_MAX_BYTES)
+        self.emf_file_backup_count = self.__get_int(
+            config, utils.EMF_FILE_BACKUP_COUNT_KEY, utils.DEFAULT_EMF_FILE_BACKUP_COUNT,
+            0, utils.MAX_EMF_FILE_BACKUP_COUNT)
+        self.max_concurrent_uploads = self.__get_int(
+            config, utils.MAX_CONCURRENT_UPLOADS_KEY, utils.DEFAULT_MAX_CONCURRENT_UPLOADS,
+            0, utils.MAX_MAX_CONCURRENT_UPLOADS)
+        self.namespace_idle_timeout_sec = self.__get_int(
+            config, utils.NAMESPACE_IDLE_TIMEOUT_SEC_KEY, utils.DEFAULT_NAMESPACE_IDLE_TIMEOUT_SEC,
+            0, utils.MAX_NAMESPACE_IDLE_TIMEOUT_SEC)
+        self.max_namespaces = self.__get_int(
+            config, utils.MAX_NAMESPACES_KEY, utils.DEFAULT_MAX_NAMESPACES, 0, utils.MAX_MAX_NAMESPACES)
+        self.deduplication_window_sec = self.__get_int(
+            config, utils.DEDUPLICATION_WINDOW_SEC_KEY, utils.DEFAULT_DEDUPLICATION_WINDOW_SEC,
+            0, utils.MAX_DEDUPLICATION_WINDOW_SEC)
+        self.deduplication_capacity = self.__get_int(
+            config, utils.DEDUPLICATION_CAPACITY_KEY, utils.DEFAULT_DEDUPLICATION_CAPACITY,
+            1, utils.MAX_DEDUPLICATION_CAPACITY)
+        self.ingest_workers = self.__get_int(
+            config, utils.INGEST_WORKERS_KEY, utils.DEFAULT_INGEST_WORKERS, 0, utils.MAX_INGEST_WORKERS)
+        self.flush_alignment = parse_bool(self.__get_string(
+            config, utils.FLUSH_ALIGNMENT_KEY, utils.DEFAULT_FLUSH_ALIGNMENT))
+        self.flush_jitter = self.__get_int(
+            config, utils.FLUSH_JITTER_KEY, utils.DEFAULT_FLUSH_JITTER, 0, utils.MAX_FLUSH_JITTER)
+        self.max_flush_latency_sec = self.__get_int(
+            config, utils.MAX_FLUSH_LATENCY_SEC_KEY, utils.DEFAULT_MAX_FLUSH_LATENCY_SEC,
+            0, utils.MAX_MAX_FLUSH_LATENCY_SEC)
+        self.drain_order = self.__parse_drain_order(config)
+        self.backfill_share = self.__get_int(
+            config, utils.BACKFILL_SHARE_KEY, utils.DEFAULT_BACKFILL_SHARE, 0, utils.MAX_BACKFILL_SHARE)
+        self.max_metric_age_sec = self.__get_int(
+            config, utils.MAX_METRIC_AGE_SEC_KEY, utils.DEFAULT_MAX_METRIC_AGE_SEC,
+            utils.MIN_MAX_METRIC_AGE_SEC, utils.DEFAULT_MAX_METRIC_AGE_SEC)
+        self.statsd_address = self.__parse_statsd_address(config)
+        self.statsd_namespace = self.__get_string(
+            config, utils.STATSD_NAMESPACE_KEY, utils.DEFAULT_STATSD_NAMESPACE)
+        self.error_report_window_sec = self.__get_int(
+            config, utils.ERROR_REPORT_WINDOW_SEC_KEY, utils.DEFAULT_ERROR_REPORT_WINDOW_SEC,
+            0, utils.MAX_ERROR_REPORT_WINDOW_SEC)
+        self.asyncio_workers = self.__get_int(
+            config, utils.ASYNCIO_WORKERS_KEY, utils.DEFAULT_ASYNCIO_WORKERS, 0, utils.MAX_ASYNCIO_WORKERS)
+        self.max_series_per_metric = self.__get_int(
+            config, utils.MAX_SERIES_PER_METRIC_KEY, utils.DEFAULT_MAX_SERIES_PER_METRIC,
+            0, utils.MAX_MAX_SERIES_PER_METRIC)
+        self.backpressure_topic = self.__get_string(config, utils.BACKPRESSURE_TOPIC_KEY, "")
+        self.backpressure_high_watermark, self.backpressure_low_watermark = \
+            self.__parse_backpressure_watermarks(config)
+
+    def log(self):
+        logger.info("Using Configuration:")
+        logger.info("%s: %s", utils.PUBLISH_REGION_KEY, self.publish_region)
+        logger.info("%s: %s", utils.PUBLISH_INTERVAL_SEC_KEY, self.publish_interval_sec)
+        logger.info("%s: %s", utils.MAX_METRICS_KEY, self.max_metrics)
+        logger.info("%s: %s", utils.MAX_BUFFER_BYTES_KEY, self.max_buffer_bytes)
+        logger.info("%s: %s", utils.INPUT_TOPIC_KEY, self.input_topic)
+        logger.info("%s: %s", utils.OUTPUT_TOPIC_KEY, self.output_topic)
+        logger.info("%s: %s", utils.PUBSUB_TO_IOT_CORE_KEY, self.pubsub_to_iot_core_value)
+        logger.info("%s: %s", utils.TOPIC_TEMPLATES_KEY, self.topic_templates)
+        logger.info("%s: %s", utils.PREWARM_CLIENT_KEY, self.prewarm_client)
+        logger.info("%s: %s", utils.SHUTDOWN_TIMEOUT_SEC_KEY, self.shutdown_timeout_sec)
+        logger.info("%s: %s", utils.NAMESPACE_PRIORITIES_KEY, self.namespace_priorities)
+        logger.info("%s: %s", utils.REGION_ROUTES_KEY, self.region_routes)
+        logger.info("%s: %s", utils.NAMESPACE_SINKS_KEY, self.namespace_sinks)
+        logger.info("%s: %s", utils.SKETCH_METRICS_KEY, self.sketch_metrics)
+        logger.info("%s: %s", utils.SAMPLE_RATES_KEY, self.sample_rates)
+        logger.info("%s: %s", utils.SKETCH_RELATIVE_ACCURACY_KEY, self.sketch_relative_accuracy)
+        logger.info("%s: %s", utils.EMF_FILE_PATH_KEY, self.emf_file_path)
+        logger.info("%s: %s", utils.EMF_FILE_MAX_BYTES_KEY, self.emf_file_max_bytes)
+        logger.info("%s: %s", utils.EMF_FILE_BACKUP_COUNT_KEY, self.emf_file_backup_count)
+        logger.info("%s: %s", utils.MAX_CONCURRENT_UPLOADS_KEY, self.max_concurrent_uploads)
+        logger.info("%s: %s", utils.NAMESPACE_IDLE_TIMEOUT_SEC_KEY, self.namespace_idle_timeout_sec)
+        logger.info("%s: %s", utils.MAX_NAMESPACES_KEY, self.max_namespaces)
+        logger.info("%s: %s", utils.DEDUPLICATION_WINDOW_SEC_KEY, self.deduplication_window_sec)
+        logger.info("%s: %s", utils.DEDUPLICATION_CAPACITY_KEY, self.deduplication_capacity)
+        logger.info("%s: %s", utils.INGEST_WORKERS_KEY, self.ingest_workers)
+        logger.info("%s: %s", utils.FLUSH_ALIGNMENT_KEY, self.flush_alignment)
+        logger.info("%s: %s", utils.FLUSH_JITTER_KEY, self.flush_jitter)
+        logger.info("%s: %s", utils.MAX_FLUSH_LATENCY_SEC_KEY, self.max_flush_latency_sec)
+        logger.info("%s: %s", utils.DRAIN_ORDER_KEY, self.drain_order)
+        logger.info("%s: %s", utils.BACKFILL_SHARE_KEY, self.backfill_share)
+        logger.info("%s: %s", utils.MAX_METRIC_AGE_SEC_KEY, self.max_metric_age_sec)
+        logger.info("%s: %s", utils.STATSD_ADDRESS_KEY, self.statsd_address)
+        logger.info("%s: %s", utils.STATSD_NAMESPACE_KEY, self.statsd_namespace)
+        logger.info("%s: %s", utils.ERROR_REPORT_WINDOW_SEC_KEY, self.error_report_window_sec)
+        logger.info("%s: %s", utils.ASYNCIO_WORKERS_KEY, self.asyncio_workers)
+        logger.info("%s: %s", utils.MAX_SERIES_PER_METRIC_KEY, self.max_series_per_metric)
+        logger.info("%s: %s", utils.BACKPRESSURE_TOPIC_KEY, self.backpressure_topic)
+        logger.info("%s: %s", utils.BACKPRESSURE_HIGH_WATERMARK_KEY, self.backpressure_high_watermark)
+        logger.info("%s: %s", utils.BACKPRESSURE_LOW_WATERMARK_KEY, self.backpressure_low_watermark)
+
+    def __get_string(self, config, key, default):
+        if key in config and config[key] != "":
+            return config[key]
+        return default
+
+    def __get_int(self, config, key, default, min_value, max_value):
+        if key not in config or config[key] == "":
+            return default
+
+        try:
+            value = int(config[key])
+        except (ValueError, TypeError):
+            logger.warning("Invalid %s type. Using the default %s value: %s", key, key, default)
+            return default
+
+        if value < min_value or value > max_value:
+            logger.warning("%s must be between %s and %s. Using the default %s value: %s"
+                           , key, min_value, max_value, key, default)
+            return default
+        return value
+
+    def __get_float(self, config, key, default, min_value, max_value):
+        if key not in config or config[key] == "":
+            return default
+
+        try:
+            value = float(config[key])
+        except (ValueError, TypeError):
+            logger.warning("Invalid %s type. Using the default %s value: %s", key, key, default)
+            return default
+
+        if not min_value <= value <= max_value:
+            logger.warning("%s must be between %s and %s. Using the default %s value: %s"
+                           , key, min_value, max_value, key, default)
+            return default
+        return value
+
+    def __get_dict(self, config, key):
+        value = config.get(key)
+        if value is None or value == "":
+            return {}
+
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        if not isinstance(value, dict):
+            logger.warning("Invalid %s value, it must be an object. Ignoring it", key)
+            return {}
+        return value
+
+    def __parse_namespace_priorities(self, config):
+        namespace_priorities = {}
+        for namespace, priority_name in self.__get_dict(config, utils.NAMESPACE_PRIORITIES_KEY).items():
+            priority = parse_priority(priority_name)
+            if priority is None:
+                logger.warning("Invalid priority %s for namespace %s, using normal", priority_name, namespace)
+                continue
+            namespace_priorities[namespace] = priority
+        return namespace_priorities
+
+    def __parse_sketch_metrics(self, config):
+        sketch_metrics = {}
+        for namespace, metric_names in self.__get_dict(config, utils.SKETCH_METRICS_KEY).items():
+            if isinstance(metric_names, str):
+                metric_names = [metric_names]
+            if not isinstance(metric_names, list) or not all(isinstance(name, str) for name in metric_names):
+                logger.warning("Invalid sketched metrics %s for namespace %s, ignoring them", metric_names, namespace)
+                continue
+            if metric_names:
+                sketch_metrics[namespace] = metric_names
+        return sketch_metrics
+
+    def __parse_sample_rates(self, config):
+        sample_rates = {}
+        for namespace, rates in self.__get_dict(config, utils.SAMPLE_RATES_KEY).items():
+            # A single rate applies to every metric of the namespace
+            if not isinstance(rates, dict):
+                rates = {ALL_METRICS: rates}
+            metric_rates = {}
+            for metric_name, rate in rates.items():
+                if isinstance(rate, bool) or not isinstance(rate, (int, float)) \
+                        or not utils.MIN_SAMPLE_RATE <= rate <= utils.MAX_SAMPLE_RATE:
+                    logger.warning("Invalid sample rate %s for metric %s of namespace %s, it must be between %s and %s"
+                                   , rate, metric_name, namespace, utils.MIN_SAMPLE_RATE, utils.MAX_SAMPLE_RATE)
+                    continue
+                metric_rates[metric_name] = rate
+            if metric_rates:
+                sample_rates[namespace] = metric_rates
+        return sample_rates
+
+    def __parse_namespace_sinks(self, config):
+        namespace_sinks = {}
+        for namespace, sink_name in self.__get_dict(config, utils.NAMESPACE_SINKS_KEY).items():
+            sink = parse_sink(sink_name)
+            if sink is None:
+                logger.warning("Invalid sink %s for namespace %s, using PutMetricData", sink_name, namespace)
+                continue
+            namespace_sinks[namespace] = sink
+        return namespace_sinks
+
+    def __parse_drain_order(self, config):
+        value = self.__get_string(config, utils.DRAIN_ORDER_KEY, utils.DEFAULT_DRAIN_ORDER)
+        drain_order = parse_drain_order(value)
+        if drain_order is None:
+            logger.warning("Invalid %s %s. Using the default %s value: %s"
+                           , utils.DRAIN_ORDER_KEY, value, utils.DRAIN_ORDER_KEY, utils.DEFAULT_DRAIN_ORDER)
+            return utils.DEFAULT_DRAIN_ORDER
+        return drain_order
+
+    def __parse_topic_templates(self, config):
+        templates = config.get(utils.TOPIC_TEMPLATES_KEY)
+        if templates is None or templates == "":
+            return []
+        if isinstance(templates, str):
+            try:
+                templates = json.loads(templates)
+            except ValueError:
+                templates = [templates]
+        if isinstance(templates, str):
+            templates = [templates]
+        if not isinstance(templates, list):
+            logger.warning("Invalid %s value, it must be a list of topics. Ignoring it", utils.TOPIC_TEMPLATES_KEY)
+            return []
+
+        topic_templates = []
+        for template in templates:
+            try:
+                TopicTemplate(template)
+            except ValueError as e:
+                logger.warning("Ignoring the topic template %s: %s", template, e)
+                continue
+            # A template listed twice would put its metrics twice
+            if template not in topic_templates:
+                topic_templates.append(template)
+        return topic_templates
+
+    def __parse_statsd_address(self, config):
+        value = self.__get_string(config, utils.STATSD_ADDRESS_KEY, "")
+        if value != "" and parse_statsd_address(str(value)) is None:
+            logger.warning("Invalid %s %s, the StatsD listener is disabled", utils.STATSD_ADDRESS_KEY, value)
+            return ""
+        return str(value)
+
+    def __parse_region_routes(self, config):
+        region_routes = {}
+        for namespace, regions in self.__get_dict(config, utils.REGION_ROUTES_KEY).items():
+            if isinstance(regions, str):
+                regions = [regions]
+            if (not isinstance(regions, list) or not regions
+                    or not all(isinstance(region, str) and region for region in regions)):
+                logger.warning("Invalid regions %s for namespace %s, using %s", regions, namespace,
+                               self.publish_region)
+                continue
+            # Keep the order, a region listed twice would store the metrics twice
+            region_routes[namespace] = list(dict.fromkeys(regions))
+        return region_routes
+
+    def __parse_backpressure_watermarks(self, config):
+        high_watermark = self.__get_int(
+            config, utils.BACKPRESSURE_HIGH_WATERMARK_KEY, utils.DEFAULT_BACKPRESSURE_HIGH_WATERMARK, 1, 100)
+        low_watermark = self.__get_int(
+            config, utils.BACKPRESSURE_LOW_WATERMARK_KEY, utils.DEFAULT_BACKPRESSURE_LOW_WATERMARK, 0, 99)
+        if low_watermark >= high_watermark:
+            logger.warning("%s must be lower than %s. Using the default values: %s and %s",
+                           utils.BACKPRESSURE_LOW_WATERMARK_KEY, utils.BACKPRESSURE_HIGH_WATERMARK_KEY,
+                           utils.DEFAULT_BACKPRESSURE_LOW_WATERMARK, utils.DEFAULT_BACKPRESSURE_HIGH_WATERMARK)
+            return utils.DEFAULT_BACKPRESSURE_HIGH_WATERMARK, utils.DEFAULT_BACKPRESSURE_LOW_WATERMARK
+        return high_watermark, low_watermark
+
+    def __parse_region(self, config):
+        return self.__get_string(config, utils.PUBLISH_REGION_KEY, utils.DEFAULT_PUBLISH_REGION)
+
+    def __parse_publish_interval(self, config):
+        if utils.PUBLISH_INTERVAL_SEC_KEY not in config:
+            return utils.DEFAULT_PUBLISH_INTERVAL_SEC
+
+        try:
+            publish_interval = int(config[utils.PUBLISH_INTERVAL_SEC_KEY])
+        except (ValueError, TypeError):
+            logger.warning("Invalid PublishInterval type. Using the default PublishInterval value: %s"
+                           , utils.DEFAULT_PUBLISH_INTERVAL_SEC)
+            publish_interval = utils.DEFAULT_PUBLISH_INTERVAL_SEC
+
+        if publish_interval > utils.MAX_PUBLISH_INTERVAL_SEC:
+            logger.warning("PublishInterval can not be more than %s seconds, setting it to max value"
+                           , utils.MAX_PUBLISH_INTERVAL_SEC)
+            publish_interval = utils.MAX_PUBLISH_INTERVAL_SEC
+        if publish_interval < 0:
+            logger.warning("Invalid PublishInterval value. Using the default PublishInterval value: %s"
+                           , utils.DEFAULT_PUBLISH_INTERVAL_SEC)
+            publish_interval = utils.DEFAULT_PUBLISH_INTERVAL_SEC
+        return publish_interval
+
+    def __parse_max_metrics(self, config):
+        if utils.MAX_METRICS_KEY not in config:
+            return utils.DEFAULT_MAX_METRICS
+
+        try:
+            max_metrics = int(config[utils.MAX_METRICS_KEY])
+        except (ValueError, TypeError):
+            logger.warning("Invalid MaxMetricsToRetain type. Using the default MaxMetricsToRetain value: %s"
+                           , utils.DEFAULT_MAX_METRICS)
+            max_metrics = utils.DEFAULT_MAX_METRICS
+
+        if max_metrics < utils.MIN_MAX_METRICS:
+            logger.warning("MaxMetricsToRetain can not be less than %s metrics, setting it to least value"
+                           , utils.MIN_MAX_METRICS)
+            max_metrics = utils.MIN_MAX_METRICS
+        return max_metrics
@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import math
+import time
+from threading import Lock
+
+from src import utils
+
+logger = utils.logger
+
+# False positive rate of each Bloom filter generation, at its capacity
+BLOOM_FILTER_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    ''' Fixed size set of keys which may report a key it never saw, at error_rate once it holds
+    capacity keys, but never misses one it saw.
+    arguments:
+    capacity -- number of keys the filter is sized for
+    error_rate -- false positive rate at capacity
+    '''
+
+    def __init__(self, capacity, error_rate):
+        self.__size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.__hash_count = max(1, round(self.__size / capacity * math.log(2)))
+        self.__bits = bytearray((self.__size + 7) // 8)
+        self.count = 0
+
+    def __indexes(self, key):
+        # Double hashing: k indexes out of two independent 64 bits hashes
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.__size for i in range(self.__hash_count)]
+
+    def __contains__(self, key):
+        return all(self.__bits[index >> 3] & (1 << (index & 7)) for index in self.__indexes(key))
+
+    def add(self, key):
+        for index in self.__indexes(key):
+            self.__bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+
+class Deduplicator:
+    ''' Drops the messages seen within the last window_sec, such as MQTT QoS 1 redeliveries or the
+    retries of a producer. A message is identified by its messageId, or else by a hash of its
+    namespace, metric name, dimensions, timestamp and value; a message without a messageId nor a
+    timestamp can not be told apart from a new sample and is always accepted.
+
+    Keys are held in two rotating Bloom filter generations, so the memory is fixed: a generation
+    is retired once it is window_sec old or holds capacity keys, whichever comes first. Under a
+    higher rate than capacity per window the effective window shrinks accordingly.
+    arguments:
+    window_sec -- time (s) during which a message is remembered
+    capacity -- number of messages remembered per window
+    '''
+
+    def __init__(self, window_sec, capacity):
+        self.window_sec = window_sec
+        self.capacity = capacity
+        self.__lock = Lock()
+        self.__current = BloomFilter(capacity, BLOOM_FILTER_ERROR_RATE)
+        self.__previous = BloomFilter(capacity, BLOOM_FILTER_ERROR_RATE)
+        self.__rotated_at = time.monotonic()
+        self.duplicate_count = 0
+
+    def is_duplicate(self, metric_request):
+        ''' Returns True if the message was already seen, else remembers it. '''
+        key = self.__get_key(metric_request)
+        if key is None:
+            return False
+
+        with self.__lock:
+            now = time.monotonic()
+            if now - self.__rotated_at >= self.window_sec or self.__current.count >= self.capacity:
+                self.__previous, self.__current = self.__current, BloomFilter(self.capacity, BLOOM_FILTER_ERROR_RATE)
+                self.__rotated_at = now
+
+            if key in self.__current or key in self.__previous:
+                self.duplicate_count += 1
+                return True
+            self.__current.add(key)
+            return False
+
+    def __get_key(self, metric_request):
+        if metric_request.message_id is not None:
+            return b'id:' + metric_request.message_id.encode('utf-8')
+        if not metric_request.has_timestamp:
+            return None
+
+        metric_datum = metric_request.metric_datum
+        dimensions = sorted((dimension['Name'], dimension['Value']) for dimension in metric_datum['Dimensions'])
+        # Sampled datums carry their value in Values
+        value = metric_datum.get('Value', metric_datum.get('Values'))
+        return json.dumps([metric_request.namespace, metric_datum['MetricName'], dimensions,
+                           metric_datum['Timestamp'], value]).encode('utf-8')
@@ -0,0 +1,293 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import marshal
+import multiprocessing
+import pickle
+import queue
+from collections import deque
+from threading import Event, Lock, Thread
+
+from src import utils
+from src.request import PutMetricRequest
+
+logger = utils.logger
+
+# Messages sent to a worker process at once: one pickling and pipe write per batch instead of
+# per message. A batch is only formed from the messages already waiting, so a quiet topic is not
+# delayed.
+MAX_INGEST_BATCH_SIZE = 256
+# Samples of a series merged into one datum, within the 100 values an EMF record holds per metric
+# and the 150 of PutMetricData
+MAX_MERGED_SAMPLES = 100
+# Samples are merged within the minute, the resolution CloudWatch stores the metrics at
+MERGE_PERIOD_SEC = 60
+# Time (s) given to the workers to parse the messages still queued when ingest stops
+INGEST_DRAIN_TIMEOUT_SEC = 5
+# Time (s) the collector waits for a parsed batch before it checks that the worker is still alive
+INGEST_WORKER_CHECK_SEC = 1
+
+
+def parse_message(message):
+    ''' Returns the PutMetricRequest of a raw or decoded message, or the exception raised parsing it. '''
+    try:
+        if isinstance(message, bytes):
+            message = json.loads(message.decode('utf-8'))
+        return PutMetricRequest(message)
+    except Exception as e:
+        return e
+
+
+def merge_samples(metric_requests):
+    ''' Returns the tuple of a request whose datum carries the Values and Counts of the samples of
+    one series, or the tuple of the only request.
+    '''
+    metric_request = metric_requests[0]
+    if len(metric_requests) == 1:
+        return metric_request.to_tuple()
+    counts = {}
+    for sample in metric_requests:
+        metric_datum = sample.metric_datum
+        if 'Value' in metric_datum:
+            counts[metric_datum['Value']] = counts.get(metric_datum['Value'], 0) + 1
+        else:
+            # Sampled datums carry their weight in Counts
+            for value, count in zip(metric_datum['Values'], metric_datum['Counts']):
+                counts[value] = counts.get(value, 0) + count
+    metric_datum = {key: value for key, value in metric_request.metric_datum.items()
+                    if key not in ('Value', 'Values', 'Counts')}
+    metric_datum['Values'] = list(counts)
+    metric_datum['Counts'] = [float(count) for count in counts.values()]
+    metric_request.metric_datum = metric_datum
+    return metric_request.to_tuple()
+
+
+def merge_requests(metric_requests, merge_timestamped=True):
+    ''' Merges the samples each series has in a batch, per minute and priority class, so that the
+    connector process puts one datum where it would have put many. Cumulative samples are kept as
+    they are, and so are the samples the Deduplicator tells apart: those with a message id, and
+    those with a timestamp unless merge_timestamped. Returns the tuples of the requests, in the
+    order of the first sample of each datum.
+    '''
+    parsed = []
+    series = {}
+    for metric_request in metric_requests:
+        if metric_request.cumulative or metric_request.message_id is not None \
+                or (metric_request.has_timestamp and not merge_timestamped):
+            parsed.append(metric_request.to_tuple())
+            continue
+        metric_datum = metric_request.metric_datum
+        series_key = (metric_request.namespace, metric_datum['MetricName'],
+                      tuple((dimension['Name'], dimension['Value']) for dimension in metric_datum['Dimensions']),
+                      metric_datum['Unit'], metric_request.priority, metric_datum['Timestamp'] // MERGE_PERIOD_SEC)
+        samples = series.get(series_key)
+        if samples is None or len(samples) >= MAX_MERGED_SAMPLES:
+            samples = series[series_key] = []
+            parsed.append(samples)
+        samples.append(metric_request)
+    return [merge_samples(item) if isinstance(item, list) else item for item in parsed]
+
+
+def parse_batch(batch, sample_rates=None, merge_timestamped=True):
+    ''' Parses a batch of messages, weights them by the rate they were sampled at if sample_rates
+    is given, and merges the samples of each series with merge_requests(). The requests are
+    returned marshalled, which the connector process decodes faster than pickled objects, along
+    with the exceptions raised by the invalid messages.
+    '''
+    metric_requests, errors = [], []
+    for index, message in enumerate(batch):
+        result = parse_message(message)
+        if isinstance(result, Exception):
+            errors.append(result)
+            continue
+        if sample_rates is not None:
+            result.apply_sample_rate(sample_rates[index])
+        metric_requests.append(result)
+    return marshal.dumps(merge_requests(metric_requests, merge_timestamped)), errors
+
+
+def unpack_batch(parsed_batch):
+    ''' Returns the PutMetricRequests and the exceptions of a batch parsed by parse_batch(). '''
+    parsed, errors = parsed_batch
+    from_tuple = PutMetricRequest.from_tuple
+    return [from_tuple(result) for result in marshal.loads(parsed)], errors
+
+
+def get_picklable_error(e):
+    ''' Returns the exception, or a plain one with its message if it does not survive pickling:
+    the queue of a worker would drop it along with the whole batch, or fail to rebuild it.
+    '''
+    try:
+        pickle.loads(pickle.dumps(e))
+        return e
+    except Exception:
+        return ValueError(str(e)) if isinstance(e, ValueError) else Exception(str(e))
+
+
+def run_parse_worker(input_queue, output_queue):
+    ''' Entry point of the worker processes: parses batches until it gets None. '''
+    while True:
+        batch = input_queue.get()
+        if batch is None:
+            output_queue.put(None)
+            return
+        parsed, errors = parse_batch(*batch)
+        output_queue.put((parsed, [get_picklable_error(e) for e in errors]))
+
+
+class ShardedIngestEngine:
+    ''' Parses, validates and merges metric messages in a pool of worker processes, out of the GIL
+    of the IPC callback threads. The connector process is left with queueing the messages and
+    putting the merged datums: a series sampled many times per minute costs it one datum per
+    batch instead of one per message. Messages of series that are all distinct still cost their
+    datum each, plus the transfer to and from the workers, so they only gain from the workers when
+    spare cores parse them; benchmark.ingest_benchmark measures both cases on the target host.
+
+    Batches go to the workers in turn and their results are collected in the same turn, by a single
+    thread, so the metrics are put in the order they were submitted whatever the worker count.
+
+    A worker that dies is respawned, and the batches it had not returned are parsed by the
+    collector itself, so that no message is lost or put out of order.
+
+    The workers are spawned rather than forked, as forking a process running the IPC client
+    threads is not safe.
+    arguments:
+    worker_count -- number of worker processes
+    connector -- CloudWatchMetricConnector the parsed requests are put to
+    '''
+
+    def __init__(self, worker_count, connector):
+        self.worker_count = worker_count
+        self.__connector = connector
+        self.__context = multiprocessing.get_context('spawn')
+        # Appended by the IPC callback threads without a lock, the dispatcher is woken up when it waits
+        self.__pending = deque()
+        self.__wakeup = Event()
+        # Batches sent to each worker and not collected yet, replayed if it dies. The lock keeps
+        # them in step with the queues of the worker, which change when it is respawned
+        self.__shard_lock = Lock()
+        self.__in_flight = [deque() for _ in range(worker_count)]
+        self.__input_queues = [None] * worker_count
+        self.__output_queues = [None] * worker_count
+        self.__workers = [None] * worker_count
+        for shard in range(worker_count):
+            self.__create_worker(shard)
+        self.__threads = [Thread(target=self.__dispatch, daemon=True), Thread(target=self.__collect, daemon=True)]
+
+    def __create_worker(self, shard):
+        self.__input_queues[shard] = self.__context.Queue()
+        self.__output_queues[shard] = self.__context.Queue()
+        self.__workers[shard] = self.__context.Process(
+            target=run_parse_worker, args=(self.__input_queues[shard], self.__output_queues[shard]), daemon=True)
+
+    def start(self):
+        for worker in self.__workers:
+            worker.start()
+        for thread in self.__threads:
+            thread.start()
+        logger.info("Started %s ingest worker processes", self.worker_count)
+
+    def submit(self, message, sample_rate=1.0):
+        ''' Queues a raw (bytes) or decoded (dict) message for parsing, kept at sample_rate. '''
+        self.__pending.append((message, sample_rate))
+        if not self.__wakeup.is_set():
+            self.__wakeup.set()
+
+    def stop(self, timeout=INGEST_DRAIN_TIMEOUT_SEC):
+        ''' Parses and puts the messages already submitted, then stops the workers. '''
+        self.__pending.append(None)
+        self.__wakeup.set()
+        for thread in self.__threads:
+            thread.join(timeout)
+        for worker in self.__workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+    def __dispatch(self):
+        pending = self.__pending
+        shard = 0
+        while True:
+            self.__wakeup.wait()
+            # Cleared before the queue is drained, a message submitted meanwhile sets it again
+            self.__wakeup.clear()
+            stopping = False
+            while pending and not stopping:
+                batch = []
+                while pending and len(batch) < MAX_INGEST_BATCH_SIZE:
+                    message = pending.popleft()
+                    if message is None:
+                        stopping = True
+                        break
+                    batch.append(message)
+                if batch:
+                    messages, sample_rates = zip(*batch)
+                    # The rates are only sent along when some of the messages were sampled, and the
+                    # samples with a timestamp are only merged when they are not deduplicated
+                    self.__send(shard, (messages, sample_rates if min(sample_rates) < 1 else None,
+                                        self.__connector.deduplicator is None))
+                    shard = (shard + 1) % self.worker_count
+            if stopping:
+                # The collector stops at the first None it gets in turn, after the last batch
+                for offset in range(self.worker_count):
+                    self.__send((shard + offset) % self.worker_count, None)
+                return
+
+    def __send(self, shard, batch):
+        with self.__shard_lock:
+            self.__in_flight[shard].append(batch)
+            self.__input_queues[shard].put(batch)
+
+    def __collect(self):
+        shard = 0
+        while True:
+            # A worker found dead before the wait has already sent all the batches it parsed
+            alive = self.__workers[shard].is_alive()
+            try:
+                parsed_batch = self.__output_queues[shard].get(timeout=INGEST_WORKER_CHECK_SEC)
+            except queue.Empty:
+                if alive:
+                    continue
+                if not self.__replace_worker(shard):
+                    return
+                shard = (shard + 1) % self.worker_count
+                continue
+            self.__in_flight[shard].popleft()
+            if parsed_batch is None:
+                return
+            shard = (shard + 1) % self.worker_count
+            self.__put_batch(parsed_batch)
+
+    def __replace_worker(self, shard):
+        ''' Respawns a dead worker and parses the batches it had not returned on the calling thread.
+        Returns False if they included the end of the ingest.
+        '''
+        with self.__shard_lock:
+            logger.error("Ingest worker process %s exited with code %s, respawning it and parsing its %s "
+                         "pending batches in the connector process", self.__workers[shard].pid,
+                         self.__workers[shard].exitcode, len(self.__in_flight[shard]))
+            in_flight = self.__in_flight[shard]
+            self.__in_flight[shard] = deque()
+            self.__create_worker(shard)
+            self.__workers[shard].start()
+        for batch in in_flight:
+            if batch is None:
+                self.__send(shard, None)
+                return False
+            self.__put_batch(parse_batch(*batch))
+        return True
+
+    def __put_batch(self, parsed_batch):
+        metric_requests, errors = unpack_batch(parsed_batch)
+        for result in metric_requests + errors:
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                self.__connector.put_metrics(result)
+            except ValueError as e:
+                logger.warning("Dropping an invalid metric message: %s", e)
+                self.__connector.report_error(e)
+            except Exception as e:
+                logger.exception("Error putting metrics to Cloudwatch: ")
+                self.__connector.report_error(e)
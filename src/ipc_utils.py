@@ -3,13 +3,13 @@
 
 import concurrent.futures
 import json
-import time
 
 import awsiot.greengrasscoreipc
 from awsiot.greengrasscoreipc.model import (QOS, GetConfigurationRequest,
                                             JsonMessage, PublishMessage,
                                             PublishToIoTCoreRequest,
                                             PublishToTopicRequest,
+                                            SubscribeToConfigurationUpdateRequest,
                                             SubscribeToIoTCoreRequest,
                                             SubscribeToTopicRequest,
                                             UnauthorizedError)
@@ -20,13 +20,30 @@ logger = utils.logger
 
 TIMEOUT = 10
 
+ipc_client = None
+
+
+def get_ipc_client():
+    ''' Connects to the Greengrass nucleus on first use, so that importing this module stays cheap. '''
+    global ipc_client
+    if ipc_client is None:
+        try:
+            ipc_client = awsiot.greengrasscoreipc.connect()
+            logger.info("Created IPC client...")
+        except Exception:
+            logger.exception(
+                "Exception occured during the creation of an IPC client: "
+            )
+            exit(1)
+    return ipc_client
+
 
 class IPCUtils:
 
     def get_configuration(self):
         try:
             request = GetConfigurationRequest()
-            operation = ipc_client.new_get_configuration()
+            operation = get_ipc_client().new_get_configuration()
             operation.activate(request).result(TIMEOUT)
             result = operation.get_response().result(TIMEOUT)
             return result.value
@@ -47,7 +64,7 @@ class IPCUtils:
         publish_message.json_message = JsonMessage()
         publish_message.json_message.message = message
         request.publish_message = publish_message
-        operation = ipc_client.new_publish_to_topic()
+        operation = get_ipc_client().new_publish_to_topic()
         operation.activate(request)
         futureResponse = operation.get_response()
         try:
@@ -69,7 +86,7 @@ class IPCUtils:
         request.topic_name = topic
         request.payload = json.dumps(message).encode('utf-8')
         request.qos = qos
-        operation = ipc_client.new_publish_to_iot_core()
+        operation = get_ipc_client().new_publish_to_iot_core()
         operation.activate(request)
         futureResponse = operation.get_response()
         try:
@@ -88,7 +105,7 @@ class IPCUtils:
     def subscribe_to_pubsub_topic(self, topic, handler):
         request = SubscribeToTopicRequest()
         request.topic = topic
-        operation = ipc_client.new_subscribe_to_topic(handler)
+        operation = get_ipc_client().new_subscribe_to_topic(handler)
         future = operation.activate(request)
 
         try:
@@ -103,19 +120,13 @@ class IPCUtils:
         except Exception:
             logger.exception(
                 'Exception while subscribing to pubsub topic: %s', topic)
-
-        # Keep the thread alive, or the process will exit.
-        try:
-            while True:
-                time.sleep(10)
-        except InterruptedError:
-            logger.info('Subscribe interrupted.')
+        return operation
 
     def subscribe_to_iot_topic(self, topic, handler):
         request = SubscribeToIoTCoreRequest()
         request.topic_name = topic
         request.qos = QOS.AT_MOST_ONCE
-        operation = ipc_client.new_subscribe_to_iot_core(handler)
+        operation = get_ipc_client().new_subscribe_to_iot_core(handler)
         future = operation.activate(request)
 
         try:
@@ -130,14 +141,28 @@ class IPCUtils:
         except Exception:
             logger.exception(
                 'Exception while subscribing to IoT core topic: %s', topic)
+        return operation
+
+    def subscribe_to_configuration_update(self, handler):
+        request = SubscribeToConfigurationUpdateRequest()
+        request.key_path = []
+        operation = get_ipc_client().new_subscribe_to_configuration_update(handler)
+        future = operation.activate(request)
+
+        try:
+            future.result(TIMEOUT)
+            logger.debug('Successfully subscribed to configuration updates')
+        except concurrent.futures.TimeoutError:
+            logger.exception(
+                'Timeout occurred while subscribing to configuration updates')
+        except Exception:
+            logger.exception(
+                'Exception while subscribing to configuration updates')
+        return operation
 
+    def close_subscription(self, operation):
+        try:
+            operation.close().result(TIMEOUT)
+        except Exception:
+            logger.exception('Exception while closing subscription')
 
-# Get the ipc client
-try:
-    ipc_client = awsiot.greengrasscoreipc.connect()
-    logger.info("Created IPC client...")
-except Exception:
-    logger.exception(
-        "Exception occured during the creation of an IPC client: "
-    )
-    exit(1)
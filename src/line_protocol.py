@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+''' Compact line protocol for the IPC binary messages, with any number of metrics per message:
+
+    <namespace>[,<dimension>=<value>...] <metric>=<value>[|<unit>][,<metric>=<value>[|<unit>]...] [<timestamp>]
+
+for instance
+
+    Factory,line=L1,station=S4 Temperature=21.5|None,Pressure=101.3 1700000000.5
+
+Lines are separated by newlines, blank lines and lines starting with # are skipped. Names and
+values can not contain commas, spaces or equal signs. The unit defaults to Count and the
+timestamp, in seconds, to the time the message is parsed.
+'''
+
+import math
+import time
+
+from src.request import PutMetricRequest
+from src.utils import MAX_DIMENSIONS_PER_METRIC, VALID_UNIT_VALUES
+
+DEFAULT_UNIT = 'Count'
+# Distinct namespace and dimension sets whose parsing is remembered, the cache starts over beyond it
+MAX_CACHED_HEADS = 4096
+
+# Producers repeat the same namespace and dimensions line after line, and message after message.
+# The cached dimension dicts are shared by the metrics, which only ever replace or extend them.
+_heads = {}
+
+
+def parse_head(head):
+    ''' Returns the namespace and dimensions of the first field of a line. '''
+    tags = head.split(',')
+    namespace = tags[0]
+    if not namespace:
+        raise ValueError('namespace is empty')
+    if len(tags) > MAX_DIMENSIONS_PER_METRIC + 1:
+        raise ValueError('more than ({}) dimensions'.format(MAX_DIMENSIONS_PER_METRIC))
+    dimensions = []
+    for tag in tags[1:]:
+        name, _, value = tag.partition('=')
+        if not name or not value:
+            raise ValueError('dimension ({}) is not name=value'.format(tag))
+        dimensions.append({'Name': name, 'Value': value})
+    return namespace, dimensions
+
+
+def parse_metrics(field, namespace, dimensions, timestamp, has_timestamp, sampler=None):
+    ''' Returns the PutMetricRequest of each metric of the metrics field of a line. With a Sampler,
+    the metrics it drops are skipped before their value is parsed.
+    '''
+    metric_requests = []
+    isfinite = math.isfinite
+    from_tuple = PutMetricRequest.from_tuple
+    for metric in field.split(','):
+        name, _, value = metric.partition('=')
+        value, _, unit = value.partition('|')
+        if not name:
+            raise ValueError('metric ({}) has no name'.format(metric))
+        sample_rate = 1.0 if sampler is None else sampler.sample(namespace, name)
+        if sample_rate is None:
+            continue
+        value = float(value)
+        if not isfinite(value):
+            raise ValueError('value of metric ({}) is not finite'.format(name))
+        if not unit:
+            unit = DEFAULT_UNIT
+        elif unit not in VALID_UNIT_VALUES:
+            raise ValueError('unit ({}) of metric ({}) is not valid'.format(unit, name))
+        metric_datum = {
+            'MetricName': name,
+            'Value': value,
+            # Each metric gets its own list, the connector appends the coreName dimension
+            'Dimensions': dimensions[:],
+            'Unit': unit,
+            'Timestamp': timestamp
+        }
+        metric_request = from_tuple((namespace, metric_datum, None, False, None, has_timestamp))
+        if sample_rate < 1:
+            metric_request.apply_sample_rate(sample_rate)
+        metric_requests.append(metric_request)
+    return metric_requests
+
+
+def parse_line_protocol(payload, now=None, sampler=None):
+    ''' Parses a message of the line protocol. Returns the PutMetricRequest of every metric of the
+    valid lines, and the error of each invalid line.
+    '''
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8')
+    if now is None:
+        now = time.time()
+
+    metric_requests = []
+    errors = []
+    heads = _heads
+    for line_number, line in enumerate(payload.split('\n'), 1):
+        fields = line.split()
+        if not fields or fields[0][0] == '#':
+            continue
+        try:
+            if len(fields) == 3:
+                timestamp = float(fields[2])
+                has_timestamp = True
+            elif len(fields) == 2:
+                timestamp = now
+                has_timestamp = False
+            else:
+                raise ValueError('expected 2 or 3 space separated fields, got ({})'.format(len(fields)))
+
+            head = heads.get(fields[0])
+            if head is None:
+                head = parse_head(fields[0])
+                if len(heads) >= MAX_CACHED_HEADS:
+                    heads.clear()
+                heads[fields[0]] = head
+            namespace, dimensions = head
+
+            # A line is kept or rejected as a whole
+            metric_requests.extend(parse_metrics(fields[1], namespace, dimensions, timestamp, has_timestamp, sampler))
+        except ValueError as e:
+            errors.append(ValueError('line {}: {}'.format(line_number, e)))
+    return metric_requests, errors
+
+
+def parse_headless_lines(payload, namespace, dimensions, now=None, sampler=None):
+    ''' Parses a message whose lines have no namespace and dimensions field, those come from the
+    topic the message was published on:
+
+        <metric>=<value>[|<unit>][,<metric>=<value>[|<unit>]...] [<timestamp>]
+
+    Returns the PutMetricRequest of every metric of the valid lines, and the error of each
+    invalid line.
+    '''
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8')
+    if now is None:
+        now = time.time()
+
+    metric_requests = []
+    errors = []
+    for line_number, line in enumerate(payload.split('\n'), 1):
+        fields = line.split()
+        if not fields or fields[0][0] == '#':
+            continue
+        try:
+            if len(fields) == 2:
+                metric_requests.extend(parse_metrics(fields[0], namespace, dimensions, float(fields[1]), True, sampler))
+            elif len(fields) == 1:
+                metric_requests.extend(parse_metrics(fields[0], namespace, dimensions, now, False, sampler))
+            else:
+                raise ValueError('expected 1 or 2 space separated fields, got ({})'.format(len(fields)))
+        except ValueError as e:
+            errors.append(ValueError('line {}: {}'.format(line_number, e)))
+    return metric_requests, errors
@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+''' Logging pipeline keeping the formatting and writing of the log records off the ingest and
+publishing threads: the records are queued by an AsyncQueueHandler, behind a RateLimitFilter, and
+written by a logging.handlers.QueueListener thread.
+'''
+
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler
+from threading import Lock
+
+# Distinct messages whose rate is tracked, the tracking starts over beyond it
+MAX_RATE_LIMITED_MESSAGES = 1024
+
+
+class RateLimitFilter(logging.Filter):
+    ''' Lets through at most burst records of each message, identified by its level and format
+    string, per window. The records over it are dropped before they are formatted, and their
+    number is appended to the first record of the message let through afterwards.
+    arguments:
+    burst -- records of a message let through per window
+    window_sec -- length (s) of a window
+    clock -- returns a monotonic time (s), so that tests can use a virtual clock
+    '''
+
+    def __init__(self, burst, window_sec, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.window_sec = window_sec
+        self.__clock = clock
+        self.__lock = Lock()
+        # message key -> [window start, records let through, records suppressed]
+        self.__messages = {}
+
+    def filter(self, record):
+        key = (record.levelno, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        now = self.__clock()
+        with self.__lock:
+            state = self.__messages.get(key)
+            if state is None or now - state[0] >= self.window_sec:
+                suppressed = state[2] if state is not None else 0
+                if state is None and len(self.__messages) >= MAX_RATE_LIMITED_MESSAGES:
+                    self.__messages.clear()
+                self.__messages[key] = [now, 1, 0]
+            elif state[1] < self.burst:
+                state[1] += 1
+                suppressed = 0
+            else:
+                state[2] += 1
+                return False
+
+        if suppressed:
+            # Formatted here, once per window, as the arguments are replaced
+            message = record.getMessage()
+            record.msg = '%s (%s similar messages were suppressed)'
+            record.args = (message, suppressed)
+        return True
+
+    def get_suppressed(self):
+        ''' Returns the number of records suppressed in the current window of each message. '''
+        with self.__lock:
+            return {key[1]: state[2] for key, state in self.__messages.items() if state[2]}
+
+
+class AsyncQueueHandler(QueueHandler):
+    ''' Queues the log records as they are, for the QueueListener thread to format them, tracebacks
+    included. Arguments are therefore formatted a little later than the call, which only matters
+    for arguments modified right after it. When the queue is full the records are dropped and
+    counted rather than blocking the caller.
+    arguments:
+    log_queue -- bounded queue.Queue read by the QueueListener
+    '''
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped_count = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Not locked, a lost increment only skews the statistic
+            self.dropped_count += 1
@@ -0,0 +1,95 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from threading import Lock
+
+from src import utils
+from src.scheduler import ThreadScheduler
+
+logger = utils.logger
+
+# How often (s) the fill level is polled while above the high watermark, so that the low
+# watermark event is sent once uploads drain the buffer even if producers stay quiet.
+POLL_INTERVAL_SEC = 1
+
+FIELD_BACKPRESSURE = 'backpressure'
+FIELD_STATE = 'state'
+FIELD_FILL_LEVEL = 'fill_level'
+FIELD_BUFFERED_METRICS = 'buffered_metrics'
+FIELD_BUFFERED_BYTES = 'buffered_bytes'
+FIELD_EVICTED_METRICS = 'evicted_metrics'
+FIELD_EXPIRED_METRICS = 'expired_metrics'
+FIELD_REJECTED_METRICS = 'rejected_metrics'
+
+STATE_HIGH = 'high'
+STATE_LOW = 'low'
+
+
+class BackpressureMonitor:
+    ''' Publishes a high watermark event when the metrics buffer fills above high_watermark,
+    and a low watermark event once it drains below low_watermark, so that producers can
+    adapt their emit rate. Events carry the fill level and the drop counters.
+    arguments:
+    status_publisher -- StatusPublisher used to publish the events
+    topic -- topic of the events, None publishes to the output topic
+    high_watermark -- fill level (0-1) above which producers are asked to slow down
+    low_watermark -- fill level (0-1) below which producers may resume their rate
+    scheduler -- ThreadScheduler or AsyncioScheduler running the poll timer
+    '''
+
+    def __init__(self, status_publisher, topic, high_watermark, low_watermark, scheduler=None):
+        self.__status_publisher = status_publisher
+        self.__scheduler = scheduler if scheduler is not None else ThreadScheduler()
+        self.__lock = Lock()
+        self.__poll_timer = None
+        self.__fill_level_provider = None
+        self.__stats_provider = None
+        self.high = False
+        self.update_settings(topic, high_watermark, low_watermark)
+
+    def update_settings(self, topic, high_watermark, low_watermark):
+        self.topic = topic
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+
+    def check(self, fill_level_provider, stats_provider):
+        ''' fill_level_provider returns the current fill level (0-1) of the buffer, stats_provider
+        the dict of fill level and counters carried by the events.
+        '''
+        fill_level = fill_level_provider()
+        if (fill_level < self.high_watermark) if not self.high else (fill_level > self.low_watermark):
+            return
+
+        with self.__lock:
+            self.__fill_level_provider = fill_level_provider
+            self.__stats_provider = stats_provider
+            fill_level = fill_level_provider()
+            if not self.high and fill_level >= self.high_watermark:
+                self.high = True
+                self.__publish(STATE_HIGH, stats_provider())
+                self.__start_poll_timer()
+            elif self.high and fill_level <= self.low_watermark:
+                self.high = False
+                self.__publish(STATE_LOW, stats_provider())
+
+    def stop(self):
+        with self.__lock:
+            if self.__poll_timer is not None:
+                self.__poll_timer.cancel()
+                self.__poll_timer = None
+
+    def __start_poll_timer(self):
+        if not self.high:
+            return
+        self.__poll_timer = self.__scheduler.call_later(POLL_INTERVAL_SEC, self.__poll)
+
+    def __poll(self):
+        self.check(self.__fill_level_provider, self.__stats_provider)
+        with self.__lock:
+            if self.__poll_timer is not None:
+                self.__start_poll_timer()
+
+    def __publish(self, state, stats):
+        logger.info("Metrics buffer crossed the %s watermark: %s", state, stats)
+        event = {FIELD_BACKPRESSURE: dict(stats, **{FIELD_STATE: state})}
+        self.__status_publisher.publish(event, self.topic)
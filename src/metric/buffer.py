@@ -0,0 +1,317 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import heapq
+import sys
+import time
+from threading import Lock
+
+from src.metric.priority import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_WEIGHTS
+
+# Memory held by a buffer entry besides the datum itself: the heap entry,
+# its insertion counter, its size and the heap list slot.
+ENTRY_OVERHEAD_BYTES = sys.getsizeof([0.0, 0, 0, {}]) + 2 * sys.getsizeof(2 ** 40) + 8
+# A heap holding more than twice its live entries, plus this margin, is rebuilt without the dead ones
+HEAP_COMPACTION_MARGIN = 64
+
+DRAIN_OLDEST = 'oldest'
+DRAIN_NEWEST = 'newest'
+DRAIN_INTERLEAVED = 'interleaved'
+DRAIN_ORDERS = (DRAIN_OLDEST, DRAIN_NEWEST, DRAIN_INTERLEAVED)
+
+
+def parse_drain_order(value):
+    ''' Returns the drain order for a name such as "Newest", or None if it is not valid. '''
+    if not isinstance(value, str) or value.lower() not in DRAIN_ORDERS:
+        return None
+    return value.lower()
+
+
+def get_datum_size(metric_datum):
+    ''' Approximate memory (bytes) held by a metric datum built by PutMetricRequest once it is
+    buffered. Dict keys are shared literals and are not counted.
+    '''
+    size = ENTRY_OVERHEAD_BYTES + sys.getsizeof(metric_datum)
+    for key, value in metric_datum.items():
+        size += sys.getsizeof(value)
+        if key in ('Values', 'Counts'):
+            size += sum(sys.getsizeof(element) for element in value)
+        elif key == 'Dimensions':
+            for dimension in value:
+                size += sys.getsizeof(dimension)
+                for dimension_field in dimension.values():
+                    size += sys.getsizeof(dimension_field)
+    return size
+
+
+class DrainPolicy:
+    ''' Order in which buffered datums are uploaded, shared by the buffers of all namespaces.
+    With DRAIN_OLDEST the oldest timestamp goes first. With DRAIN_NEWEST the newest goes first,
+    so that after an outage dashboards recover before the backlog is uploaded. DRAIN_INTERLEAVED
+    fills each batch with the newest datums, and with the oldest ones up to backfill_share of it,
+    so that history keeps trickling in at a capped share of the upload capacity.
+
+    Datums whose timestamp is older than max_age are expired rather than uploaded, as CloudWatch
+    rejects them.
+    arguments:
+    order -- one of DRAIN_ORDERS
+    backfill_share -- fraction (0-1) of each batch given to the oldest datums when interleaved
+    max_age -- age (s) beyond which a buffered datum is expired, 0 keeps datums whatever their age
+    '''
+
+    def __init__(self, order=DRAIN_OLDEST, backfill_share=0, max_age=0):
+        self.update_settings(order, backfill_share, max_age)
+
+    def update_settings(self, order, backfill_share, max_age=0):
+        # Buffers apply new settings on their next batch
+        self.order = order
+        self.backfill_share = backfill_share
+        self.max_age = max_age
+
+    def get_expiry_cutoff(self):
+        ''' Timestamp below which datums are expired, None if they never are. '''
+        return time.time() - self.max_age if self.max_age > 0 else None
+
+
+class BufferTotals:
+    ''' Count and memory footprint of the datums held by a set of MetricBuffers, kept up to date by
+    the buffers as they put and remove datums, so that bounds shared by all namespaces are checked
+    without summing every buffer.
+    '''
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.count = 0
+        self.size_bytes = 0
+
+    def add(self, count, size_bytes):
+        with self.__lock:
+            self.count += count
+            self.size_bytes += size_bytes
+
+
+class MetricBuffer:
+    ''' Thread safe buffer of metric datums. It keeps one heap per priority class: datums are
+    taken from the highest class first and evicted from the lowest class first, oldest timestamp
+    first within a class. Counts and memory footprint are maintained incrementally, as well as
+    the number of datums evicted and expired so far.
+
+    Expiry costs nothing per datum: the oldest first heap of each class is popped while its head
+    is past the cutoff, before each batch and eviction. A datum put already past the cutoff is
+    expired right away.
+
+    Datums are uploaded in the order of drain_policy. The newest first orders keep a second,
+    newest first, heap per class over the same entries; an entry taken from one heap is marked
+    dead and skipped when it surfaces in the other one. The oldest first order, the default,
+    does not pay for it.
+    arguments:
+    drain_policy -- DrainPolicy of the uploads, oldest first if None
+    totals -- BufferTotals the datums of this buffer are counted in, if any
+    '''
+
+    def __init__(self, drain_policy=None, totals=None):
+        self.__drain_policy = drain_policy if drain_policy is not None else DrainPolicy()
+        self.__totals = totals
+        self.__heaps = [[] for _ in PRIORITY_WEIGHTS]
+        self.__newest_heaps = None
+        self.__class_counts = [0 for _ in PRIORITY_WEIGHTS]
+        self.__class_bytes = [0 for _ in PRIORITY_WEIGHTS]
+        self.__lock = Lock()
+        self.__counter = 0
+        self.__count = 0
+        self.__size_bytes = 0
+        self.evicted_count = 0
+        self.expired_count = 0
+
+    def qsize(self):
+        return self.__count
+
+    def size_bytes(self):
+        return self.__size_bytes
+
+    def detach_totals(self):
+        ''' Stops counting the datums of this buffer in its BufferTotals, and takes the datums it
+        holds out of them.
+        '''
+        with self.__lock:
+            if self.__totals is not None:
+                self.__totals.add(-self.__count, -self.__size_bytes)
+                self.__totals = None
+
+    def evictable_bytes(self, priority=PRIORITY_HIGH):
+        ''' Bytes held by datums of the given priority class or lower. '''
+        return sum(self.__class_bytes[priority:])
+
+    def lowest_priority(self):
+        ''' The lowest priority class with buffered datums, or None if the buffer is empty. '''
+        for priority in reversed(range(len(self.__heaps))):
+            if self.__class_counts[priority]:
+                return priority
+        return None
+
+    def put(self, metric_datum, datum_size=None, priority=PRIORITY_NORMAL):
+        ''' Buffers a datum. Returns False if it was expired instead. '''
+        cutoff = self.__drain_policy.get_expiry_cutoff()
+        if cutoff is not None and metric_datum['Timestamp'] < cutoff:
+            with self.__lock:
+                self.expired_count += 1
+            return False
+        if datum_size is None:
+            datum_size = get_datum_size(metric_datum)
+        with self.__lock:
+            # Re-initialize the metric ordering if the buffer was drained, along with
+            # the dead entries left in the heaps
+            if self.__count == 0:
+                self.__counter = 0
+                self.__clear_heaps()
+            self.__counter += 1
+            entry = [metric_datum['Timestamp'], self.__counter, datum_size, metric_datum]
+            heapq.heappush(self.__heaps[priority], entry)
+            if self.__newest_heaps is not None:
+                heapq.heappush(self.__newest_heaps[priority], (-entry[0], -entry[1], entry))
+            self.__count += 1
+            self.__class_counts[priority] += 1
+            self.__size_bytes += datum_size
+            self.__class_bytes[priority] += datum_size
+            if self.__totals is not None:
+                self.__totals.add(1, datum_size)
+        return True
+
+    def get_batch(self, batch_size):
+        ''' Removes up to batch_size datums, highest priority class first and in the order of the
+        drain policy within a class. Returns a list of (metric_datum, datum_size, priority)
+        entries, which can be put back as they are.
+        '''
+        order, backfill_share = self.__drain_policy.order, self.__drain_policy.backfill_share
+        cutoff = self.__drain_policy.get_expiry_cutoff()
+        with self.__lock:
+            self.__expire(cutoff)
+            self.__set_drain_order(order)
+            batch = []
+            if order == DRAIN_INTERLEAVED:
+                # The live share first, then the backfill share, then whatever is left of the batch
+                backfill_size = round(batch_size * backfill_share)
+                self.__fill_batch(batch, batch_size - backfill_size, True)
+                self.__fill_batch(batch, batch_size, False)
+            else:
+                self.__fill_batch(batch, batch_size, order == DRAIN_NEWEST)
+            self.__compact_heaps()
+            return batch
+
+    def __expire(self, cutoff):
+        # Returns the number and bytes of the datums expired
+        expired = expired_bytes = 0
+        if cutoff is None:
+            return expired, expired_bytes
+        for priority, heap in enumerate(self.__heaps):
+            while self.__class_counts[priority] and (heap[0][3] is None or heap[0][0] < cutoff):
+                if heap[0][3] is None:
+                    heapq.heappop(heap)
+                    continue
+                _, datum_size = self.__pop(priority)
+                expired += 1
+                expired_bytes += datum_size
+        self.expired_count += expired
+        return expired, expired_bytes
+
+    def __fill_batch(self, batch, batch_size, newest):
+        for priority in range(len(self.__heaps)):
+            while self.__class_counts[priority] and len(batch) < batch_size:
+                metric_datum, datum_size = self.__pop(priority, newest)
+                batch.append((metric_datum, datum_size, priority))
+
+    def __set_drain_order(self, order):
+        if order == DRAIN_OLDEST and self.__newest_heaps is not None:
+            self.__newest_heaps = None
+            self.__compact_heaps(force=True)
+        elif order != DRAIN_OLDEST and self.__newest_heaps is None:
+            self.__newest_heaps = [[(-entry[0], -entry[1], entry) for entry in heap if entry[3] is not None]
+                                   for heap in self.__heaps]
+            for heap in self.__newest_heaps:
+                heapq.heapify(heap)
+
+    def __clear_heaps(self):
+        self.__heaps = [[] for _ in PRIORITY_WEIGHTS]
+        if self.__newest_heaps is not None:
+            self.__newest_heaps = [[] for _ in PRIORITY_WEIGHTS]
+
+    def __compact_heaps(self, force=False):
+        # Drop the dead entries once they outnumber the live ones, so that memory stays bounded
+        for priority, live_count in enumerate(self.__class_counts):
+            heap = self.__heaps[priority]
+            if force or len(heap) > 2 * live_count + HEAP_COMPACTION_MARGIN:
+                heap = self.__heaps[priority] = [entry for entry in heap if entry[3] is not None]
+                heapq.heapify(heap)
+            if self.__newest_heaps is not None:
+                heap = self.__newest_heaps[priority]
+                if len(heap) > 2 * live_count + HEAP_COMPACTION_MARGIN:
+                    heap = self.__newest_heaps[priority] = [item for item in heap if item[2][3] is not None]
+                    heapq.heapify(heap)
+
+    def expire(self):
+        ''' Drops the datums past the expiry cutoff, whatever their class. Returns the number of
+        datums and of bytes released.
+        '''
+        cutoff = self.__drain_policy.get_expiry_cutoff()
+        with self.__lock:
+            expired, expired_bytes = self.__expire(cutoff)
+            if expired:
+                self.__compact_heaps()
+            return expired, expired_bytes
+
+    def evict(self, count, priority=PRIORITY_HIGH):
+        ''' Drops up to count datums of the given priority class or lower, lowest class and
+        oldest first. Returns the number of datums dropped, expired ones included.
+        '''
+        cutoff = self.__drain_policy.get_expiry_cutoff()
+        with self.__lock:
+            # Expired datums are let go first, whatever their class
+            dropped, _ = self.__expire(cutoff)
+            while dropped < count and self.__pop_lowest(priority) is not None:
+                dropped += 1
+            self.__compact_heaps()
+            return dropped
+
+    def evict_bytes(self, bytes_to_free, priority=PRIORITY_HIGH):
+        ''' Drops datums of the given priority class or lower, lowest class and oldest first,
+        until at least bytes_to_free bytes are released or none is left. Returns the number of
+        bytes released, expired datums included.
+        '''
+        cutoff = self.__drain_policy.get_expiry_cutoff()
+        with self.__lock:
+            _, freed_bytes = self.__expire(cutoff)
+            while freed_bytes < bytes_to_free:
+                datum_size = self.__pop_lowest(priority)
+                if datum_size is None:
+                    break
+                freed_bytes += datum_size
+            self.__compact_heaps()
+            return freed_bytes
+
+    def __pop_lowest(self, priority):
+        for lowest in reversed(range(priority, len(self.__heaps))):
+            if self.__class_counts[lowest]:
+                _, datum_size = self.__pop(lowest)
+                self.evicted_count += 1
+                return datum_size
+        return None
+
+    def __pop(self, priority, newest=False):
+        # Skip the entries already taken from the other heap
+        if newest:
+            entry = heapq.heappop(self.__newest_heaps[priority])[2]
+            while entry[3] is None:
+                entry = heapq.heappop(self.__newest_heaps[priority])[2]
+        else:
+            entry = heapq.heappop(self.__heaps[priority])
+            while entry[3] is None:
+                entry = heapq.heappop(self.__heaps[priority])
+        _, _, datum_size, metric_datum = entry
+        entry[3] = None
+        self.__count -= 1
+        self.__class_counts[priority] -= 1
+        self.__size_bytes -= datum_size
+        self.__class_bytes[priority] -= datum_size
+        if self.__totals is not None:
+            self.__totals.add(-1, -datum_size)
+        return metric_datum, datum_size
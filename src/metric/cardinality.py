@@ -0,0 +1,148 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+from threading import Lock
+
+from src import utils
+
+logger = utils.logger
+
+# Dimension value of the series the overflowing dimension sets of a metric are folded into
+OTHER_DIMENSION_VALUE = '__other__'
+# Metrics and dimension sets tracked per window across all namespaces. Beyond them, the new ones
+# are folded until the window ends: forgetting admitted sets early would let a producer cycling
+# through metric names reset the cap of every metric
+MAX_TRACKED_METRICS = 10000
+MAX_TRACKED_SERIES = 100000
+# Admitted dimension sets are forgotten after this time (s), so that series that come and go
+# over a long time are not folded forever
+CARDINALITY_WINDOW_SEC = 3600
+# Offending metrics tracked and reported, and minimum time (s) between two reports
+OFFENDER_SKETCH_CAPACITY = 100
+MAX_REPORTED_OFFENDERS = 10
+REPORT_INTERVAL_SEC = 60
+
+FIELD_CARDINALITY_LIMIT = 'cardinality_limit'
+FIELD_MAX_SERIES_PER_METRIC = 'max_series_per_metric'
+FIELD_OFFENDERS = 'offenders'
+FIELD_NAMESPACE = 'namespace'
+FIELD_METRIC_NAME = 'metric_name'
+FIELD_FOLDED_METRICS = 'folded_metrics'
+
+
+class SpaceSaving:
+    ''' Space-Saving heavy hitters sketch: approximate counts of the most frequent items in
+    bounded memory. Any item seen more than total/capacity times is guaranteed to be tracked,
+    and its count is overestimated by at most the error kept alongside it.
+    arguments:
+    capacity -- number of items tracked
+    '''
+
+    def __init__(self, capacity):
+        self.__capacity = capacity
+        self.__counters = {}
+
+    def add(self, item, count=1):
+        counter = self.__counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.__counters) < self.__capacity:
+            self.__counters[item] = [count, 0]
+        else:
+            # The new item takes over the least counted one and inherits its count as error
+            victim = min(self.__counters, key=lambda key: self.__counters[key][0])
+            victim_count = self.__counters.pop(victim)[0]
+            self.__counters[item] = [victim_count + count, victim_count]
+
+    def top(self, k):
+        ''' Returns up to k (item, count, error) tuples, most frequent first. '''
+        items = sorted(self.__counters.items(), key=lambda item: item[1][0], reverse=True)[:k]
+        return [(item, counter[0], counter[1]) for item, counter in items]
+
+    def clear(self):
+        self.__counters = {}
+
+
+class CardinalityLimiter:
+    ''' Caps the distinct dimension sets of each metric of a namespace. Once a metric has
+    max_series_per_metric dimension sets in the current window, metrics with a new set are folded
+    into a single series whose dimension values are all OTHER_DIMENSION_VALUE. The metrics folded
+    the most are tracked by a Space-Saving sketch and reported on the status topic, at most every
+    REPORT_INTERVAL_SEC.
+
+    Memory is bounded whatever the input and the configured cap: at most MAX_TRACKED_METRICS
+    metrics and MAX_TRACKED_SERIES dimension set hashes in all, and OFFENDER_SKETCH_CAPACITY
+    counters. Admitted sets are only forgotten when the window ends; a metric that finds either
+    bound reached in the current window is folded as if it were over its own cap.
+
+    Samples of cumulative counters are left alone: folding them would mix the running totals of
+    several series into one, and turn their differences into bogus deltas. Their series are
+    bounded by the CumulativeCounterTracker of the namespace instead.
+    arguments:
+    max_series_per_metric -- distinct dimension sets admitted per metric and window
+    status_publisher -- StatusPublisher used to report the offending metrics
+    '''
+
+    def __init__(self, max_series_per_metric, status_publisher):
+        self.max_series_per_metric = max_series_per_metric
+        self.__status_publisher = status_publisher
+        self.__lock = Lock()
+        self.__metrics = {}
+        self.__series_count = 0
+        self.__offenders = SpaceSaving(OFFENDER_SKETCH_CAPACITY)
+        self.__window_start = time.monotonic()
+        self.__last_report = None
+        self.folded_count = 0
+
+    def get_tracked_metrics(self):
+        return len(self.__metrics)
+
+    def limit(self, metric_request):
+        ''' Folds the dimensions of the request if its metric has too many dimension sets. '''
+        metric_datum = metric_request.metric_datum
+        if not metric_datum['Dimensions'] or metric_request.cumulative:
+            return
+        metric_key = (metric_request.namespace, metric_datum['MetricName'])
+        series_hash = hash(frozenset((dimension['Name'], dimension['Value'])
+                                     for dimension in metric_datum['Dimensions']))
+
+        with self.__lock:
+            now = time.monotonic()
+            if now - self.__window_start >= CARDINALITY_WINDOW_SEC:
+                self.__metrics.clear()
+                self.__series_count = 0
+                self.__window_start = now
+
+            admitted = self.__metrics.get(metric_key)
+            if admitted is None and len(self.__metrics) < MAX_TRACKED_METRICS:
+                admitted = self.__metrics[metric_key] = set()
+            if admitted is not None:
+                if series_hash in admitted:
+                    return
+                if len(admitted) < self.max_series_per_metric and self.__series_count < MAX_TRACKED_SERIES:
+                    admitted.add(series_hash)
+                    self.__series_count += 1
+                    return
+
+            self.folded_count += 1
+            self.__offenders.add(metric_key)
+            report = self.__last_report is None or now - self.__last_report >= REPORT_INTERVAL_SEC
+            if report:
+                self.__last_report = now
+                offenders = self.__offenders.top(MAX_REPORTED_OFFENDERS)
+                self.__offenders.clear()
+
+        metric_datum['Dimensions'] = [{'Name': dimension['Name'], 'Value': OTHER_DIMENSION_VALUE}
+                                      for dimension in metric_datum['Dimensions']]
+        if report:
+            self.__report(offenders)
+
+    def __report(self, offenders):
+        logger.warning("Metrics over %s dimension sets were folded into %s: %s"
+                       , self.max_series_per_metric, OTHER_DIMENSION_VALUE, offenders)
+        self.__status_publisher.publish({FIELD_CARDINALITY_LIMIT: {
+            FIELD_MAX_SERIES_PER_METRIC: self.max_series_per_metric,
+            FIELD_OFFENDERS: [{FIELD_NAMESPACE: namespace, FIELD_METRIC_NAME: metric_name, FIELD_FOLDED_METRICS: count}
+                              for (namespace, metric_name), count, _ in offenders]
+        }})
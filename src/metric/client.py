@@ -1,18 +1,22 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
-import logging
-
-import boto3
-from botocore import credentials, exceptions, config
-from botocore.session import get_session
 from src import utils
+from src.metric.sink import MetricSink
 
 logger = utils.logger
 
 
-class CloudWatchClient:
+class CloudWatchClient(MetricSink):
+    ''' PutMetricData sink, publishing to the CloudWatch API of a region. '''
+
     def __init__(self, region):
+        # boto3 takes a noticeable share of the start up time on small devices,
+        # so it is only imported once the first client is built.
+        import boto3
+        from botocore import config, credentials, exceptions
+        from botocore.session import get_session
+
         # Only look for Credentials from ContainerProvider
         container_creds_resolver = credentials.CredentialResolver([credentials.ContainerProvider()])
         container_creds = container_creds_resolver.load_credentials()
@@ -31,7 +35,7 @@ class CloudWatchClient:
         put_metric_args = {'Namespace': namespace, 'MetricData': metric_data}
         try:
             response = self.client.put_metric_data(**put_metric_args)
-            logger.info(
+            logger.debug(
                 "Cloudwatch metrics published successfully with response: %s", response)
             if type(response) is dict and response.get('ResponseMetadata'):
                 if type(response['ResponseMetadata']) is dict and response['ResponseMetadata'].get('RequestId'):
@@ -39,5 +43,5 @@ class CloudWatchClient:
             # if there is no request id, just send back whole response
             return response
         except Exception:
-            logging.exception("Error was encountered publishing to cloudwatch: ")
+            logger.exception("Error was encountered publishing to cloudwatch: ")
             raise
@@ -0,0 +1,71 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from collections import OrderedDict
+from threading import Lock
+
+# Series whose last value is remembered per namespace, the least recently updated one is forgotten beyond it
+MAX_COUNTER_SERIES = 10000
+
+
+def get_series_key(metric_datum):
+    return (metric_datum['MetricName'], metric_datum.get('Unit'),
+            tuple((dimension['Name'], dimension['Value']) for dimension in metric_datum.get('Dimensions', [])))
+
+
+class CounterState:
+    __slots__ = ('last_value', 'delta', 'latest_datum')
+
+    def __init__(self, last_value):
+        self.last_value = last_value
+        self.delta = 0
+        self.latest_datum = None
+
+
+class CumulativeCounterTracker:
+    ''' Turns the samples of cumulative counters, such as bytes sent since boot, into the deltas
+    accumulated between two flushes. The last value of each series is kept across flushes; a value
+    lower than the last one is taken as a counter reset, and then counts as the delta itself. The
+    first sample of a series only sets its baseline.
+    arguments:
+    max_series -- number of series remembered, the least recently updated one is forgotten beyond it
+    '''
+
+    def __init__(self, max_series=MAX_COUNTER_SERIES):
+        self.__max_series = max_series
+        self.__lock = Lock()
+        self.__series = OrderedDict()
+
+    def add(self, metric_datum):
+        series_key = get_series_key(metric_datum)
+        value = metric_datum['Value']
+        with self.__lock:
+            state = self.__series.get(series_key)
+            if state is None:
+                self.__series[series_key] = CounterState(value)
+                if len(self.__series) > self.__max_series:
+                    self.__series.popitem(last=False)
+                return
+            self.__series.move_to_end(series_key)
+
+            state.delta += value - state.last_value if value >= state.last_value else value
+            state.last_value = value
+            if state.latest_datum is None or metric_datum['Timestamp'] >= state.latest_datum['Timestamp']:
+                state.latest_datum = metric_datum
+
+    def get_size(self):
+        return len(self.__series)
+
+    def drain(self):
+        ''' Returns a datum carrying the delta of each series updated since the last drain. '''
+        metric_data = []
+        with self.__lock:
+            for state in self.__series.values():
+                if state.latest_datum is None:
+                    continue
+                metric_datum = dict(state.latest_datum)
+                metric_datum['Value'] = state.delta
+                metric_data.append(metric_datum)
+                state.delta = 0
+                state.latest_datum = None
+        return metric_data
@@ -1,13 +1,28 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
-from functools import reduce
+import queue as Queue
+import time
+from threading import Lock, Thread
 
 from src import utils
-from src.metric import publisher
+from src.metric import client as CloudWatch
+from src.metric import backpressure, publisher
+from src.metric.buffer import BufferTotals, get_datum_size
+from src.metric.priority import PRIORITY_NORMAL, WeightedFairUploadSlots
+from src.metric.sink import SINK_EMF
+from src.metric.sketch import SketchAggregator
+from src.scheduler import ThreadScheduler
 
 logger = utils.logger
 
+# Number of namespaces flushed in parallel while shutting down
+MAX_SHUTDOWN_FLUSH_THREADS = 8
+# Idle namespaces are looked for at most this often (s)
+MAX_REAP_INTERVAL_SEC = 60
+# Time (s) given to a retired namespace to upload what it still buffers
+RETIRED_NAMESPACE_FLUSH_TIMEOUT_SEC = 10
+
 
 class MetricsManager:
     ''' This class stores all metrics in memory. metrics are keyed by namespace. Each namespace points 
@@ -17,35 +32,414 @@ class MetricsManager:
     put_metric_interval -- time period (s) between two successive put metric calls to cloudwatch
     max_bucket_size -- total number of metrics present in memory. This includes total metric objects
             across all namespaces
+    status_publisher -- optional StatusPublisher used to report the result of each upload
+    namespace_idle_timeout -- time (s) after which a namespace without new metrics is flushed and
+            removed, 0 keeps namespaces forever
+    max_namespaces -- upper bound on live namespaces, the least recently used one is flushed and
+            removed to make room for a new one. 0 means unbounded
+    max_buffer_bytes -- upper bound on the memory (bytes) held by buffered metrics across all
+            namespaces, 0 disables it. It applies on top of max_bucket_size
+    namespace_priorities -- dict of namespace to priority class, other namespaces are normal
+    max_concurrent_uploads -- upload slots shared by all namespaces, granted by weighted fair
+            queuing on their priority class. 0 disables the limit
+    backpressure_monitor -- optional BackpressureMonitor told about the fill level of the bucket
+    namespace_sinks -- dict of namespace to sink type, other namespaces use PutMetricData
+    emf_sink -- EmfFileSink of the namespaces routed to the EMF sink, they use PutMetricData without it
+    sketch_metrics -- dict of namespace to the names of its metrics absorbed into quantile sketches
+    sketch_relative_accuracy -- relative error (0-1) of the quantile sketches
+    scheduler -- ThreadScheduler or AsyncioScheduler running the flush timers and background flushes
+    flush_schedule -- FlushSchedule placing the flushes of the namespaces
+    drain_policy -- DrainPolicy ordering the uploads of the namespaces
 
     This class is responsible for managing the metric_bucket whose upper bound is an input.
     metrics are paritioned by namespaces, which means that all bucket operations are specific 
     to namespaces. This also implies that if metric bucket is full and a metric with a new 
     namespace is added, it will be rejected. If a metric with existing namespace is added, it
-    replaces the oldest entry in its namespace.
+    replaces the oldest entry in its namespace. With a byte budget, as many of the oldest entries
+    of the namespace as needed to fit the new metric are replaced.
+
+    Priority classes come from the namespace, or from the metric itself. When the bucket is full,
+    metrics of a strictly lower class in any namespace are evicted before the namespace of the
+    new metric has to replace its own, and a metric never replaces one of a higher class.
+
+    The deltas of cumulative counters and the sketches are buffered when their namespace flushes,
+    within the same bounds and with the same evictions as the other metrics.
+
+    A single CloudWatch client is shared by all namespaces using the PutMetricData sink. It is built
+    on first use, or ahead of time by prewarm_client().
+
+    update_settings() applies a new region, interval, bucket size or byte budget to the live
+    publishers without dropping their buffered metrics, unless the bucket or the budget shrinks
+    below its current size.
+
+    close() stops accepting metrics, after which flush_all() drains every namespace concurrently.
+
+    A metric that races with the removal of its idle namespace may land in the retired publisher
+    after its final flush; namespaces are only retired after namespace_idle_timeout without
+    metrics, so this is not expected in practice.
     '''
 
-    def __init__(self, region, put_metric_interval, max_bucket_size):
+    def __init__(self, region, put_metric_interval, max_bucket_size, status_publisher=None,
+                 namespace_idle_timeout=0, max_namespaces=0, max_buffer_bytes=0,
+                 namespace_priorities=None, max_concurrent_uploads=0, backpressure_monitor=None,
+                 namespace_sinks=None, emf_sink=None, sketch_metrics=None, sketch_relative_accuracy=0.01,
+                 scheduler=None, flush_schedule=None, drain_policy=None):
         self.metrics_bucket = {}
+        # Datums buffered by the live namespaces, kept by their buffers as they put and remove them
+        self.__buffer_totals = BufferTotals()
+        self.__scheduler = scheduler if scheduler is not None else ThreadScheduler()
+        self.__flush_schedule = flush_schedule
+        self.__drain_policy = drain_policy
         self.__region = region
         self.__put_metric_interval = put_metric_interval
         self.__max_bucket_size = max_bucket_size
+        self.__status_publisher = status_publisher
+        self.__cw_client = None
+        self.__cw_client_lock = Lock()
+        self.__bucket_lock = Lock()
+        self.__closed = False
+        self.rejected_after_close = 0
+        self.__namespace_idle_timeout = namespace_idle_timeout
+        self.__max_namespaces = max_namespaces
+        self.__max_buffer_bytes = max_buffer_bytes
+        self.__namespace_priorities = namespace_priorities or {}
+        self.__upload_slots = WeightedFairUploadSlots(max_concurrent_uploads)
+        self.__backpressure_monitor = backpressure_monitor
+        self.__namespace_sinks = namespace_sinks or {}
+        self.__emf_sink = emf_sink
+        self.__sketch_metrics = sketch_metrics or {}
+        self.__sketch_relative_accuracy = sketch_relative_accuracy
+        self.__evicted_by_retired_namespaces = 0
+        self.__expired_by_retired_namespaces = 0
+        self.rejected_metrics = 0
+        self.__reaper_timer = None
+        self.__start_reaper_timer()
+
+    def prewarm_client(self):
+        try:
+            self.__get_cw_client()
+            logger.info("CloudWatch client for region %s is ready", self.__region)
+        except Exception:
+            logger.exception("Failed to pre-warm the CloudWatch client, it will be created on first use: ")
+
+    def __get_cw_client(self):
+        with self.__cw_client_lock:
+            if self.__cw_client is None:
+                self.__cw_client = CloudWatch.CloudWatchClient(self.__region)
+            return self.__cw_client
+
+    def update_settings(self, region, put_metric_interval, max_bucket_size,
+                        namespace_idle_timeout=0, max_namespaces=0, max_buffer_bytes=0,
+                        namespace_priorities=None, max_concurrent_uploads=0, namespace_sinks=None,
+                        sketch_metrics=None, sketch_relative_accuracy=0.01):
+        with self.__bucket_lock:
+            self.__max_namespaces = max_namespaces
+            if namespace_idle_timeout != self.__namespace_idle_timeout:
+                self.__namespace_idle_timeout = namespace_idle_timeout
+                self.__start_reaper_timer()
+
+            if region != self.__region:
+                self.__update_region(region)
+
+            if (namespace_priorities or {}) != self.__namespace_priorities:
+                # Metrics already buffered keep the class they were buffered with
+                self.__namespace_priorities = namespace_priorities or {}
+                for namespace, metric_publisher in self.metrics_bucket.items():
+                    metric_publisher.priority = self.__get_namespace_priority(namespace)
+
+            if max_concurrent_uploads != self.__upload_slots.max_slots:
+                self.__upload_slots.set_max_slots(max_concurrent_uploads)
+
+            if (namespace_sinks or {}) != self.__namespace_sinks:
+                self.__namespace_sinks = namespace_sinks or {}
+                for namespace, metric_publisher in self.metrics_bucket.items():
+                    metric_publisher.set_cw_client(self.__get_sink(namespace))
+
+            if ((sketch_metrics or {}) != self.__sketch_metrics
+                    or sketch_relative_accuracy != self.__sketch_relative_accuracy):
+                self.__sketch_metrics = sketch_metrics or {}
+                self.__sketch_relative_accuracy = sketch_relative_accuracy
+                for namespace, metric_publisher in self.metrics_bucket.items():
+                    metric_publisher.set_sketch_aggregator(self.__get_sketch_aggregator(namespace))
+
+            if put_metric_interval != self.__put_metric_interval:
+                self.__put_metric_interval = put_metric_interval
+                for metric_publisher in self.metrics_bucket.values():
+                    metric_publisher.set_put_metric_interval(put_metric_interval)
+
+            if max_bucket_size != self.__max_bucket_size:
+                self.__max_bucket_size = max_bucket_size
+                self.__trim_metrics_bucket()
+
+            if max_buffer_bytes != self.__max_buffer_bytes:
+                self.__max_buffer_bytes = max_buffer_bytes
+                self.__trim_buffer_bytes()
+
+    def __update_region(self, region):
+        with self.__cw_client_lock:
+            try:
+                cw_client = CloudWatch.CloudWatchClient(region) if self.metrics_bucket else None
+            except Exception:
+                logger.exception("Failed to create a CloudWatch client for region %s, still publishing to %s: "
+                                 , region, self.__region)
+                return
+            self.__region = region
+            self.__cw_client = cw_client
+
+        for namespace, metric_publisher in self.metrics_bucket.items():
+            if not self.__uses_emf_sink(namespace):
+                metric_publisher.set_cw_client(cw_client)
+
+    def __uses_emf_sink(self, namespace):
+        return self.__emf_sink is not None and self.__namespace_sinks.get(namespace) == SINK_EMF
+
+    def __get_sketch_aggregator(self, namespace):
+        metric_names = self.__sketch_metrics.get(namespace)
+        if not metric_names:
+            return None
+        return SketchAggregator(metric_names, self.__sketch_relative_accuracy)
+
+    def __get_sink(self, namespace):
+        return self.__emf_sink if self.__uses_emf_sink(namespace) else self.__get_cw_client()
+
+    def __trim_metrics_bucket(self):
+        excess = self.__get_metrics_bucket_size() - self.__max_bucket_size
+        if excess <= 0:
+            return
+
+        logger.warning("MaxMetricsToRetain was reduced, dropping %s oldest metrics", excess)
+        # Drop from the largest namespaces first, oldest entries go first as in replace_metric()
+        for metric_publisher in sorted(self.metrics_bucket.values(), key=lambda p: p.get_size(), reverse=True):
+            excess -= metric_publisher.drop_oldest(excess)
+            if excess <= 0:
+                break
+
+    def __trim_buffer_bytes(self):
+        if self.__max_buffer_bytes <= 0:
+            return
+        excess = self.get_buffer_size_bytes() - self.__max_buffer_bytes
+        if excess <= 0:
+            return
+
+        logger.warning("MaxBufferBytes was reduced, dropping the oldest %s bytes of metrics", excess)
+        for metric_publisher in sorted(self.metrics_bucket.values(), key=lambda p: p.get_size_bytes(), reverse=True):
+            excess -= metric_publisher.drop_oldest_bytes(excess)
+            if excess <= 0:
+                break
 
     def __create_new_metric(self, namespace):
-        self.metrics_bucket[namespace] = publisher.MetricPublisher(
-            namespace, self.__region, self.__put_metric_interval)
+        retired_publisher = None
+        with self.__bucket_lock:
+            metric_publisher = self.metrics_bucket.get(namespace)
+            if metric_publisher is None:
+                if 0 < self.__max_namespaces <= len(self.metrics_bucket):
+                    lru_namespace = min(self.metrics_bucket,
+                                        key=lambda n: self.metrics_bucket[n].last_metric_time)
+                    logger.warning("Reached %s namespaces, removing least recently used namespace %s"
+                                   , self.__max_namespaces, lru_namespace)
+                    retired_publisher = self.__retire_namespace(lru_namespace)
+                metric_publisher = publisher.MetricPublisher(
+                    namespace, self.__region, self.__put_metric_interval,
+                    status_publisher=self.__status_publisher, cw_client=self.__get_sink(namespace),
+                    priority=self.__get_namespace_priority(namespace), upload_slots=self.__upload_slots,
+                    sketch_aggregator=self.__get_sketch_aggregator(namespace), scheduler=self.__scheduler,
+                    flush_schedule=self.__flush_schedule, drain_policy=self.__drain_policy,
+                    buffer_aggregate=self.__buffer_aggregate, buffer_totals=self.__buffer_totals)
+                self.metrics_bucket[namespace] = metric_publisher
 
-    def add_metric(self, namespace, metric_datum):
-        if self.metrics_bucket.get(namespace) is None:
-            self.__create_new_metric(namespace)
+        if retired_publisher is not None:
+            # Do not make the producer wait for the upload of another namespace
+            self.__scheduler.submit(self.__flush_retired_publisher, retired_publisher)
+        return metric_publisher
 
-        metric_publisher = self.metrics_bucket[namespace]
-        metric_publisher.replace_metric(
-            metric_datum) if self.__get_metrics_bucket_size() > self.__max_bucket_size else metric_publisher.add_metric(
-            metric_datum)
+    def __get_namespace_priority(self, namespace):
+        return self.__namespace_priorities.get(namespace, PRIORITY_NORMAL)
 
-    def __get_metrics_bucket_size(self):
-        if not self.metrics_bucket.values():
-            return 0
+    def __start_reaper_timer(self):
+        if self.__reaper_timer is not None:
+            self.__reaper_timer.cancel()
+            self.__reaper_timer = None
+        if self.__namespace_idle_timeout > 0 and not self.__closed:
+            self.__reaper_timer = self.__scheduler.call_later(
+                min(self.__namespace_idle_timeout, MAX_REAP_INTERVAL_SEC), self.__start_timer_and_reap)
+
+    def __start_timer_and_reap(self):
+        with self.__bucket_lock:
+            self.__start_reaper_timer()
+        self.reap_idle_namespaces()
+
+    def reap_idle_namespaces(self):
+        now = time.monotonic()
+        with self.__bucket_lock:
+            idle_namespaces = [namespace for namespace, metric_publisher in self.metrics_bucket.items()
+                               if now - metric_publisher.last_metric_time >= self.__namespace_idle_timeout]
+            retired_publishers = [self.__retire_namespace(namespace) for namespace in idle_namespaces]
+
+        if idle_namespaces:
+            logger.info("Removing idle namespaces: %s", idle_namespaces)
+        for retired_publisher in retired_publishers:
+            self.__flush_retired_publisher(retired_publisher)
+        return idle_namespaces
+
+    def __retire_namespace(self, namespace):
+        metric_publisher = self.metrics_bucket.pop(namespace)
+        metric_publisher.stop()
+        # What it still buffers is flushed outside the bounds of the live namespaces
+        metric_publisher.detach_buffer_totals()
+        self.__upload_slots.forget(namespace)
+        self.__evicted_by_retired_namespaces += metric_publisher.get_evicted_count()
+        self.__expired_by_retired_namespaces += metric_publisher.get_expired_count()
+        return metric_publisher
+
+    def __flush_retired_publisher(self, metric_publisher):
+        try:
+            left = metric_publisher.flush_all(time.monotonic() + RETIRED_NAMESPACE_FLUSH_TIMEOUT_SEC)
+            if left:
+                logger.warning("%s metrics of a removed namespace could not be published", left)
+        except Exception:
+            logger.exception("Error flushing a removed namespace: ")
+
+    def close(self):
+        with self.__bucket_lock:
+            self.__closed = True
+            self.__start_reaper_timer()
+            if self.__backpressure_monitor is not None:
+                self.__backpressure_monitor.stop()
+            for metric_publisher in self.metrics_bucket.values():
+                metric_publisher.stop()
+
+    def flush_all(self, deadline):
+        ''' Flushes all namespaces concurrently until the monotonic deadline.
+        Returns a dict of namespace to the number of metrics that could not be uploaded.
+        '''
+        pending = Queue.Queue()
+        # Higher priority namespaces are the first to get a flush thread
+        for namespace, metric_publisher in sorted(self.metrics_bucket.items(), key=lambda item: item[1].priority):
+            if metric_publisher.get_size() > 0:
+                pending.put((namespace, metric_publisher))
+
+        def drain():
+            while time.monotonic() < deadline:
+                try:
+                    namespace, metric_publisher = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    metric_publisher.flush_all(deadline)
+                except Exception:
+                    logger.exception("Error flushing namespace %s on shutdown: ", namespace)
+
+        # Daemon threads, a flush stuck in the SDK must not outlive the deadline
+        workers = [Thread(target=drain, daemon=True)
+                   for _ in range(min(MAX_SHUTDOWN_FLUSH_THREADS, pending.qsize()))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(max(0, deadline - time.monotonic()))
+
+        leftover = {}
+        for namespace, metric_publisher in list(self.metrics_bucket.items()):
+            if metric_publisher.get_size() > 0:
+                leftover[namespace] = metric_publisher.get_size()
+        return leftover
 
-        return reduce((lambda x, y: x + y.get_size()), self.metrics_bucket.values(), 0)
+    def add_metric(self, namespace, metric_datum, priority=None, cumulative=False):
+        ''' Buffers a metric. A cumulative metric is a sample of a monotonic counter, only the delta
+        of its series is buffered at the next flush.
+        '''
+        if self.__closed:
+            self.rejected_after_close += 1
+            return
+
+        if not self.__add_metric(namespace, metric_datum, priority, cumulative):
+            self.rejected_metrics += 1
+        if self.__backpressure_monitor is not None:
+            self.__backpressure_monitor.check(self.get_fill_level, self.get_backpressure_stats)
+
+    def get_fill_level(self):
+        ''' Fill level (0-1) of the bucket, against whichever of the count and byte bounds is closer. '''
+        fill_level = self.__get_metrics_bucket_size() / self.__max_bucket_size if self.__max_bucket_size else 0
+        if self.__max_buffer_bytes > 0:
+            fill_level = max(fill_level, self.get_buffer_size_bytes() / self.__max_buffer_bytes)
+        return min(fill_level, 1.0)
+
+    def get_backpressure_stats(self):
+        metric_publishers = list(self.metrics_bucket.values())
+        return {
+            backpressure.FIELD_FILL_LEVEL: round(self.get_fill_level(), 3),
+            backpressure.FIELD_BUFFERED_METRICS: self.__get_metrics_bucket_size(),
+            backpressure.FIELD_BUFFERED_BYTES: self.get_buffer_size_bytes(),
+            backpressure.FIELD_EVICTED_METRICS: self.__evicted_by_retired_namespaces + sum(
+                p.get_evicted_count() for p in metric_publishers),
+            backpressure.FIELD_EXPIRED_METRICS: self.__expired_by_retired_namespaces + sum(
+                p.get_expired_count() for p in metric_publishers),
+            backpressure.FIELD_REJECTED_METRICS: self.rejected_metrics
+        }
+
+    def __add_metric(self, namespace, metric_datum, priority, cumulative):
+        ''' Returns False if the metric was dropped. '''
+        metric_publisher = self.metrics_bucket.get(namespace)
+        if metric_publisher is None:
+            metric_publisher = self.__create_new_metric(namespace)
+        if cumulative:
+            metric_publisher.add_cumulative_metric(metric_datum)
+            return True
+        if metric_publisher.sketch_metric(metric_datum):
+            return True
+        return self.__buffer_metric(metric_publisher, metric_datum, priority)
+
+    def __buffer_aggregate(self, metric_publisher, metric_datum):
+        ''' Buffers the delta of a cumulative counter or the sketch drained by a publisher at its
+        flush, within the same bounds as the other metrics. The publisher uploads it itself.
+        '''
+        if not self.__buffer_metric(metric_publisher, metric_datum, None, flush=False):
+            self.rejected_metrics += 1
+
+    def __buffer_metric(self, metric_publisher, metric_datum, priority, **publisher_kwargs):
+        ''' Buffers a metric within the bucket size and the byte budget. Returns False if it was dropped. '''
+        # Only hand the priority down when the metric overrides the class of its namespace
+        if priority is None:
+            priority = metric_publisher.priority
+        else:
+            publisher_kwargs['priority'] = priority
+
+        if self.__max_buffer_bytes > 0:
+            datum_size = get_datum_size(metric_datum)
+            bytes_to_free = self.get_buffer_size_bytes() + datum_size - self.__max_buffer_bytes
+            if bytes_to_free > 0:
+                bytes_to_free -= self.__evict_lower_priority(priority, bytes_to_free)
+                if bytes_to_free > 0:
+                    return metric_publisher.replace_metric(metric_datum, bytes_to_free, datum_size, **publisher_kwargs)
+            elif self.__get_metrics_bucket_size() > self.__max_bucket_size:
+                if not self.__evict_lower_priority(priority, 0):
+                    return metric_publisher.replace_metric(metric_datum, 0, datum_size, **publisher_kwargs)
+            metric_publisher.add_metric(metric_datum, datum_size, **publisher_kwargs)
+            return True
+
+        if self.__get_metrics_bucket_size() > self.__max_bucket_size and not self.__evict_lower_priority(priority, 0):
+            return metric_publisher.replace_metric(metric_datum, **publisher_kwargs)
+        metric_publisher.add_metric(metric_datum, **publisher_kwargs)
+        return True
+
+    def __evict_lower_priority(self, priority, bytes_to_free):
+        ''' Evicts metrics of a strictly lower class than priority from any namespace, lowest class
+        first. Evicts one metric when bytes_to_free is 0. Returns the bytes (or metrics) released.
+        '''
+        released = 0
+        while True:
+            victims = [metric_publisher for metric_publisher in list(self.metrics_bucket.values())
+                       if (metric_publisher.lowest_priority() or 0) > priority]
+            if not victims:
+                return released
+            victim = max(victims, key=lambda p: (p.lowest_priority(), p.get_size_bytes()))
+            if bytes_to_free == 0:
+                return victim.drop_oldest(1, priority + 1)
+            released += victim.drop_oldest_bytes(bytes_to_free - released, priority + 1)
+            if released >= bytes_to_free:
+                return released
+
+    def get_buffer_size_bytes(self):
+        return self.__buffer_totals.size_bytes
+
+    def __get_metrics_bucket_size(self):
+        return self.__buffer_totals.count
@@ -0,0 +1,92 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from contextlib import contextmanager
+from threading import Condition
+
+# Priority classes, a lower value is a higher priority
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+PRIORITY_CLASSES = {
+    'high': PRIORITY_HIGH,
+    'normal': PRIORITY_NORMAL,
+    'low': PRIORITY_LOW
+}
+
+# Share of the upload slots each class gets when they compete for them
+PRIORITY_WEIGHTS = {
+    PRIORITY_HIGH: 4,
+    PRIORITY_NORMAL: 2,
+    PRIORITY_LOW: 1
+}
+
+
+def parse_priority(value):
+    ''' Returns the priority class for a name such as "high", or None if it is not valid. '''
+    if not isinstance(value, str):
+        return None
+    return PRIORITY_CLASSES.get(value.lower())
+
+
+class WeightedFairUploadSlots:
+    ''' Bounds the number of concurrent PutMetricData calls across all namespaces. When callers
+    have to wait, slots are granted by weighted fair queuing: each namespace advances its own
+    virtual finish time by 1/weight per upload and the smallest finish time goes first, so higher
+    priority namespaces get proportionally more uploads without starving the others.
+    arguments:
+    max_slots -- number of uploads allowed at the same time, 0 disables the limit
+    '''
+
+    def __init__(self, max_slots):
+        self.max_slots = max_slots
+        self.__condition = Condition()
+        self.__in_use = 0
+        self.__virtual_time = 0.0
+        self.__finish_times = {}
+        self.__waiting = []
+        self.__sequence = 0
+
+    @contextmanager
+    def slot(self, namespace, priority):
+        acquired = self.acquire(namespace, priority)
+        try:
+            yield
+        finally:
+            if acquired:
+                self.release()
+
+    def acquire(self, namespace, priority):
+        if self.max_slots <= 0:
+            return False
+        with self.__condition:
+            finish_time = max(self.__virtual_time, self.__finish_times.get(namespace, 0.0)) \
+                + 1.0 / PRIORITY_WEIGHTS[priority]
+            self.__finish_times[namespace] = finish_time
+            self.__sequence += 1
+            ticket = (finish_time, self.__sequence)
+            self.__waiting.append(ticket)
+            while 0 < self.max_slots <= self.__in_use or min(self.__waiting) != ticket:
+                self.__condition.wait()
+            self.__waiting.remove(ticket)
+            self.__in_use += 1
+            self.__virtual_time = finish_time
+            # The next waiter may fit in a free slot as well
+            self.__condition.notify_all()
+            return True
+
+    def set_max_slots(self, max_slots):
+        # Waiters re-check the bound, a raised or disabled limit lets them through right away
+        with self.__condition:
+            self.max_slots = max_slots
+            self.__condition.notify_all()
+
+    def release(self):
+        with self.__condition:
+            self.__in_use = max(0, self.__in_use - 1)
+            self.__condition.notify_all()
+
+    def forget(self, namespace):
+        with self.__condition:
+            self.__finish_times.pop(namespace, None)
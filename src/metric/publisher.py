@@ -1,17 +1,19 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
-import queue as Queue
-from threading import Thread, Timer
+import time
+from threading import Lock
 
-from botocore.exceptions import ConnectionError
-from src import ipc_utils, utils
+from src import utils
 from src.metric import client as CloudWatch
+from src.metric.buffer import MetricBuffer
+from src.metric.counter import CumulativeCounterTracker
+from src.metric.priority import PRIORITY_NORMAL
+from src.metric.schedule import ArrivalRateEstimator, FlushSchedule
+from src.scheduler import ThreadScheduler
 
 RESPONSE_FIELD_CW_ID = 'cloudwatch_rid'
 RESPONSE_FILED_NAMESPACE = 'namespace'
-ipc = ipc_utils.IPCUtils()
-
 
 METRIC_BATCH_SIZE = 20
 # This is derived from 150 TPS limit of CW, since there are potentially 2 threads dequeing
@@ -29,29 +31,145 @@ logger = utils.logging.getLogger()
 
 
 class MetricPublisher:
-    def __init__(self, namespace, region, put_metric_interval):
+    def __init__(self, namespace, region, put_metric_interval, status_publisher=None, cw_client=None,
+                 priority=PRIORITY_NORMAL, upload_slots=None, sketch_aggregator=None, scheduler=None,
+                 flush_schedule=None, drain_policy=None, buffer_aggregate=None, buffer_totals=None):
         self.__namespace = namespace
-        self.__metric_list = Queue.PriorityQueue(0)
-        self.__cw_client = CloudWatch.CloudWatchClient(region)
+        self.__scheduler = scheduler if scheduler is not None else ThreadScheduler()
+        self.__flush_schedule = flush_schedule if flush_schedule is not None else FlushSchedule()
+        self.__created_at = self.__flush_schedule.now()
+        self.__arrival_rate = ArrivalRateEstimator(time.monotonic())
+        self.priority = priority
+        self.__upload_slots = upload_slots
+        self.__sketch_aggregator = sketch_aggregator
+        self.__counter_tracker = CumulativeCounterTracker()
+        self.__buffer_aggregate = buffer_aggregate
+        self.__metric_list = MetricBuffer(drain_policy, buffer_totals)
+        self.__cw_client = cw_client if cw_client is not None else CloudWatch.CloudWatchClient(region)
+        self.__status_publisher = status_publisher
         self.__put_metric_interval = put_metric_interval
+        self.__timer_lock = Lock()
+        self.__stopped = False
+        self.timer = None
+        self.last_metric_time = time.monotonic()
         self.__start_flush_timer()
-        self.__counter = 0
 
     def get_size(self):
         return self.__metric_list.qsize()
 
-    def replace_metric(self, metric_datum):
-        try:
-            self.__metric_list.get_nowait()
-            self.add_metric(metric_datum)
-        except Queue.Empty as e:
-            # queue is empty, nothing to replace
-            pass
+    def get_size_bytes(self):
+        return self.__metric_list.size_bytes()
+
+    def lowest_priority(self):
+        return self.__metric_list.lowest_priority()
+
+    def detach_buffer_totals(self):
+        self.__metric_list.detach_totals()
+
+    def get_evicted_count(self):
+        return self.__metric_list.evicted_count
+
+    def get_expired_count(self):
+        return self.__metric_list.expired_count
+
+    def set_put_metric_interval(self, put_metric_interval):
+        # Re-arm the flush timer with the new interval, buffered metrics are kept
+        self.__put_metric_interval = put_metric_interval
+        self.__start_flush_timer()
+
+    def set_cw_client(self, cw_client):
+        self.__cw_client = cw_client
+
+    def set_sketch_aggregator(self, sketch_aggregator):
+        # The samples absorbed so far are queued as they are
+        self.__drain_aggregates()
+        self.__sketch_aggregator = sketch_aggregator
+
+    def sketch_metric(self, metric_datum):
+        ''' Absorbs the metric into the sketch of its series if the series is sketched. Returns
+        False if the metric has to be buffered as usual.
+        '''
+        sketch_aggregator = self.__sketch_aggregator
+        if sketch_aggregator is None or self.__put_metric_interval == 0 or not sketch_aggregator.accepts(metric_datum):
+            return False
+        self.last_metric_time = time.monotonic()
+        sketch_aggregator.add(metric_datum)
+        return True
+
+    def add_cumulative_metric(self, metric_datum):
+        ''' Tracks a sample of a cumulative counter, the delta of its series is queued at the next flush. '''
+        self.last_metric_time = time.monotonic()
+        self.__counter_tracker.add(metric_datum)
+        if self.__put_metric_interval == 0:
+            self.__drain_aggregates()
+            self.flush_metrics(DEFAULT_MAX_BATCHES_TO_UPLOAD)
+
+    def __drain_aggregates(self):
+        # Queue the deltas of the cumulative counters and the sketches absorbed since the last flush,
+        # through buffer_aggregate when the owner bounds the buffers
+        metric_data = self.__counter_tracker.drain()
+        if self.__sketch_aggregator is not None:
+            metric_data.extend(self.__sketch_aggregator.drain())
+        for metric_datum in metric_data:
+            if self.__buffer_aggregate is not None:
+                self.__buffer_aggregate(self, metric_datum)
+            else:
+                self.__metric_list.put(metric_datum, priority=self.priority)
+
+    def stop(self):
+        # Cancel the periodic flush for good, the owner is expected to drain the queue with flush_all()
+        with self.__timer_lock:
+            self.__stopped = True
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def flush_all(self, deadline):
+        ''' Flushes until the queue is empty, no progress is made or the monotonic deadline passes.
+        Returns the number of metrics left in the queue.
+        '''
+        self.__drain_aggregates()
+        while self.__metric_list.qsize() > 0 and time.monotonic() < deadline:
+            size_before_flush = self.__metric_list.qsize()
+            self.flush_metrics(DEFAULT_MAX_BATCHES_TO_UPLOAD, deadline)
+            if self.__metric_list.qsize() >= size_before_flush:
+                break
+        return self.__metric_list.qsize()
+
+    def drop_oldest(self, count, priority=None):
+        ''' Drops up to count metrics of the given priority class or lower, lowest class first. '''
+        return self.__metric_list.evict(count, self.__get_priority(priority, 0))
 
-    def add_metric(self, metric_datum):
-        self.__put_metric_in_queue(metric_datum)
+    def drop_oldest_bytes(self, bytes_to_free, priority=None):
+        return self.__metric_list.evict_bytes(bytes_to_free, self.__get_priority(priority, 0))
 
-        if self.__metric_list.qsize() >= METRIC_BATCH_SIZE or self.__put_metric_interval == 0:
+    def replace_metric(self, metric_datum, bytes_to_free=0, datum_size=None, priority=None, flush=True):
+        ''' Replaces the oldest metric, or as many oldest metrics as needed to release bytes_to_free.
+        Expired metrics are replaced first, then only metrics of the same priority class or lower,
+        lowest class first. If the namespace does not hold enough of them, the new metric is dropped
+        and False is returned.
+        '''
+        self.last_metric_time = time.monotonic()
+        priority = self.__get_priority(priority)
+        # Expired metrics make room first, whatever their class
+        expired, expired_bytes = self.__metric_list.expire()
+        if bytes_to_free > 0:
+            bytes_to_free -= expired_bytes
+            replaced = bytes_to_free <= 0 or (self.__metric_list.evictable_bytes(priority) >= bytes_to_free
+                                              and self.__metric_list.evict_bytes(bytes_to_free, priority) > 0)
+        else:
+            replaced = expired > 0 or self.__metric_list.evict(1, priority) == 1
+        if replaced:
+            self.add_metric(metric_datum, datum_size, priority, flush)
+        return replaced
+
+    def add_metric(self, metric_datum, datum_size=None, priority=None, flush=True):
+        ''' Buffers a metric, and uploads full batches right away unless flush is False. '''
+        self.last_metric_time = time.monotonic()
+        self.__arrival_rate.arrivals += 1
+        self.__metric_list.put(metric_datum, datum_size, self.__get_priority(priority))
+
+        if flush and (self.__metric_list.qsize() >= METRIC_BATCH_SIZE or self.__put_metric_interval == 0):
             # This is a safety check for not blowing up CW when we have thousands
             # of metrics in buffer to get flushed.
             # Since this is a sync call, customer RPS can derive number of calls to CW
@@ -62,37 +180,39 @@ class MetricPublisher:
 
             self.flush_metrics(max_batches_to_upload)
 
+    def __get_priority(self, priority, default=None):
+        if priority is not None:
+            return priority
+        return self.priority if default is None else default
+
     def __start_flush_timer(self):
-        if self.__put_metric_interval > 0:
-            self.timer = Timer(self.__put_metric_interval,
-                               self.__start_timer_and_flush_metrics)
-            self.timer.start()
-
-    def __put_metric_in_queue(self, metric_datum):
-        # Re-initialize the metric ordering if the queue is empty after the previous flush metrics call
-        if self.__metric_list.qsize() == 0:
-            self.__counter = 0
-        self.__counter += 1
-        self.__metric_list.put_nowait(
-            (metric_datum['Timestamp'], self.__counter, metric_datum))
+        # Only one timer is ever armed, even if the interval is changed while a flush is running
+        with self.__timer_lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.__put_metric_interval > 0 and not self.__stopped:
+                delay = self.__flush_schedule.next_delay(self.__put_metric_interval, self.__created_at,
+                                                         self.__arrival_rate.rate, METRIC_BATCH_SIZE)
+                self.timer = self.__scheduler.call_later(delay, self.__start_timer_and_flush_metrics)
 
     def __put_metric_batch_in_queue(self, metric_batch):
-        for metric in metric_batch:
-            self.__put_metric_in_queue(metric)
+        for metric_datum, datum_size, priority in metric_batch:
+            self.__metric_list.put(metric_datum, datum_size, priority)
 
     def __get_metric_batch(self):
-        batch = []
-        for _ in range(METRIC_BATCH_SIZE):
-            try:
-                _, _, metric = self.__metric_list.get_nowait()
-                batch.append(metric)
-            except Queue.Empty as e:
-                break
+        return self.__metric_list.get_batch(METRIC_BATCH_SIZE)
 
-        return batch
+    def __put_metric_data(self, metric_data):
+        if self.__upload_slots is None:
+            return self.__cw_client.put_metric_data(self.__namespace, metric_data)
+        with self.__upload_slots.slot(self.__namespace, self.priority):
+            return self.__cw_client.put_metric_data(self.__namespace, metric_data)
 
     def __start_timer_and_flush_metrics(self, batches_to_upload=DEFAULT_MAX_BATCHES_TO_UPLOAD):
+        self.__arrival_rate.sample(time.monotonic())
         self.__start_flush_timer()
+        self.__drain_aggregates()
         self.flush_metrics(batches_to_upload)
 
     '''
@@ -104,9 +224,9 @@ class MetricPublisher:
     both the cases as we dont guarantee ordering in general.
     '''
 
-    def flush_metrics(self, batches_to_upload):
-        from src.cloudwatch_metric_connector import (OUTPUT_TOPIC,
-                                                     pubsub_to_iot_core)
+    def flush_metrics(self, batches_to_upload, deadline=None):
+        from botocore.exceptions import ConnectionError
+
         num_metrics = self.__metric_list.qsize()
         if num_metrics == 0:
             return
@@ -114,13 +234,14 @@ class MetricPublisher:
         num_metrics_tried = 0
         total_batches_tried = 0
         while num_metrics_tried < num_metrics and total_batches_tried < batches_to_upload:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
             # Grab a batch of max METRIC_BATCH_SIZE metrics
             batch = self.__get_metric_batch()
             if batch:
                 response = {}
                 try:
-                    cw_response = self.__cw_client.put_metric_data(
-                        self.__namespace, batch)
+                    cw_response = self.__put_metric_data([metric_datum for metric_datum, _, _ in batch])
                     response_payload = {RESPONSE_FIELD_CW_ID: cw_response,
                                         RESPONSE_FILED_NAMESPACE: self.__namespace}
                     response = utils.generate_success_response(
@@ -131,11 +252,8 @@ class MetricPublisher:
                     response = utils.generate_error_response("", str(e.__class__), str(
                         e), **{RESPONSE_FILED_NAMESPACE: self.__namespace})
                 finally:
-                    if response:
-                        Thread(
-                            target=ipc.publish_message,
-                            args=(OUTPUT_TOPIC, response, pubsub_to_iot_core),
-                        ).start()
+                    if response and self.__status_publisher is not None:
+                        self.__status_publisher.publish(response)
 
             # its fine if last batch has < METRIC_BATCH_SIZE,
             # num_metrics_tried should be greater than num_metrics to break the loop
@@ -0,0 +1,181 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+from threading import Lock, Thread
+
+from src import utils
+from src.metric import backpressure
+from src.metric.manager import RETIRED_NAMESPACE_FLUSH_TIMEOUT_SEC, MetricsManager
+from src.metric.sink import SINK_EMF
+from src.scheduler import ThreadScheduler
+
+logger = utils.logger
+
+
+class MetricsRouter:
+    ''' Routes metrics to one MetricsManager per CloudWatch region. It offers the same interface
+    as MetricsManager, so that the connector and the shutdown do not need to know about regions.
+    arguments:
+    region -- default Cloudwatch region, used by namespaces without a route
+    region_routes -- dict of namespace to the list of regions its metrics are published to
+    emf_sink -- EmfFileSink shared by the regions, for the namespaces routed to it by namespace_sinks
+    other arguments are the ones of MetricsManager, applied to the manager of each region
+
+    Each region has its own CloudWatch client, upload slots and bucket bounds, so a slow or
+    unreachable region only fills its own buffer. A metric routed to several regions is parsed
+    once and the same datum object is buffered by each of them; byte budgets count it in every
+    region that holds it.
+
+    The manager of the default region follows PublishRegion updates and keeps its buffered metrics,
+    as MetricsManager does. The manager of a region that is no longer routed to is closed and its
+    metrics are flushed in the background.
+    '''
+
+    def __init__(self, region, put_metric_interval, max_bucket_size, status_publisher=None,
+                 namespace_idle_timeout=0, max_namespaces=0, max_buffer_bytes=0,
+                 namespace_priorities=None, max_concurrent_uploads=0, backpressure_monitor=None,
+                 region_routes=None, namespace_sinks=None, emf_sink=None, sketch_metrics=None,
+                 sketch_relative_accuracy=0.01, scheduler=None, flush_schedule=None, drain_policy=None):
+        self.__status_publisher = status_publisher
+        self.__scheduler = scheduler if scheduler is not None else ThreadScheduler()
+        self.__flush_schedule = flush_schedule
+        self.__drain_policy = drain_policy
+        self.__emf_sink = emf_sink
+        self.__backpressure_monitor = backpressure_monitor
+        self.__lock = Lock()
+        self.__closed = False
+        self.rejected_after_close = 0
+        self.__settings = self.__get_settings(
+            put_metric_interval, max_bucket_size, namespace_idle_timeout, max_namespaces, max_buffer_bytes,
+            namespace_priorities, max_concurrent_uploads, namespace_sinks, sketch_metrics, sketch_relative_accuracy)
+        self.__namespace_sinks = namespace_sinks or {}
+        self.__region = region
+        self.__default_manager = self.__create_manager(region)
+        self.__region_managers = {}
+        self.__default_route = (self.__default_manager,)
+        self.__routes = {}
+        self.__update_routes(region_routes or {})
+
+    @staticmethod
+    def __get_settings(put_metric_interval, max_bucket_size, namespace_idle_timeout, max_namespaces,
+                       max_buffer_bytes, namespace_priorities, max_concurrent_uploads, namespace_sinks,
+                       sketch_metrics, sketch_relative_accuracy):
+        # Keyword arguments of MetricsManager.update_settings(), besides the region
+        return {
+            'put_metric_interval': put_metric_interval,
+            'max_bucket_size': max_bucket_size,
+            'namespace_idle_timeout': namespace_idle_timeout,
+            'max_namespaces': max_namespaces,
+            'max_buffer_bytes': max_buffer_bytes,
+            'namespace_priorities': namespace_priorities,
+            'max_concurrent_uploads': max_concurrent_uploads,
+            'namespace_sinks': namespace_sinks,
+            'sketch_metrics': sketch_metrics,
+            'sketch_relative_accuracy': sketch_relative_accuracy
+        }
+
+    def __create_manager(self, region):
+        return MetricsManager(region, status_publisher=self.__status_publisher, emf_sink=self.__emf_sink,
+                              scheduler=self.__scheduler, flush_schedule=self.__flush_schedule,
+                              drain_policy=self.__drain_policy, **self.__settings)
+
+    def __get_managers(self):
+        return [self.__default_manager] + list(self.__region_managers.values())
+
+    def __update_routes(self, region_routes):
+        # The EMF file does not depend on the region, its namespaces are written once
+        if self.__emf_sink is not None:
+            region_routes = {namespace: route_regions for namespace, route_regions in region_routes.items()
+                             if self.__namespace_sinks.get(namespace) != SINK_EMF}
+        regions = {region for route_regions in region_routes.values() for region in route_regions}
+        regions.discard(self.__region)
+
+        retired_managers = [self.__region_managers.pop(region) for region in list(self.__region_managers)
+                            if region not in regions]
+        for region in regions:
+            if region not in self.__region_managers:
+                self.__region_managers[region] = self.__create_manager(region)
+
+        def get_manager(region):
+            return self.__default_manager if region == self.__region else self.__region_managers[region]
+
+        self.__routes = {namespace: tuple(get_manager(region) for region in route_regions)
+                         for namespace, route_regions in region_routes.items() if route_regions}
+
+        for retired_manager in retired_managers:
+            retired_manager.close()
+            self.__scheduler.submit(retired_manager.flush_all, time.monotonic() + RETIRED_NAMESPACE_FLUSH_TIMEOUT_SEC)
+
+    def prewarm_client(self):
+        for metrics_manager in self.__get_managers():
+            metrics_manager.prewarm_client()
+
+    def update_settings(self, region, put_metric_interval, max_bucket_size,
+                        namespace_idle_timeout=0, max_namespaces=0, max_buffer_bytes=0,
+                        namespace_priorities=None, max_concurrent_uploads=0, region_routes=None,
+                        namespace_sinks=None, sketch_metrics=None, sketch_relative_accuracy=0.01):
+        with self.__lock:
+            self.__settings = self.__get_settings(
+                put_metric_interval, max_bucket_size, namespace_idle_timeout, max_namespaces, max_buffer_bytes,
+                namespace_priorities, max_concurrent_uploads, namespace_sinks, sketch_metrics,
+                sketch_relative_accuracy)
+            self.__namespace_sinks = namespace_sinks or {}
+            # A routed manager already publishing to the new default region is retired by
+            # the route update below, its metrics are still flushed to that region
+            self.__region = region
+            self.__default_manager.update_settings(region, **self.__settings)
+            for route_region, metrics_manager in self.__region_managers.items():
+                metrics_manager.update_settings(route_region, **self.__settings)
+            self.__update_routes(region_routes or {})
+
+    def close(self):
+        with self.__lock:
+            self.__closed = True
+            if self.__backpressure_monitor is not None:
+                self.__backpressure_monitor.stop()
+            for metrics_manager in self.__get_managers():
+                metrics_manager.close()
+
+    def flush_all(self, deadline):
+        ''' Flushes all regions concurrently until the monotonic deadline. Returns a dict of
+        namespace to the number of metrics that could not be uploaded, summed over its regions.
+        '''
+        leftovers = []
+        workers = [Thread(target=lambda m=metrics_manager: leftovers.append(m.flush_all(deadline)), daemon=True)
+                   for metrics_manager in self.__get_managers()]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(max(0, deadline - time.monotonic()))
+
+        leftover = {}
+        for region_leftover in list(leftovers):
+            for namespace, left in region_leftover.items():
+                leftover[namespace] = leftover.get(namespace, 0) + left
+        return leftover
+
+    def add_metric(self, namespace, metric_datum, priority=None, cumulative=False):
+        if self.__closed:
+            self.rejected_after_close += 1
+            return
+
+        for metrics_manager in self.__routes.get(namespace, self.__default_route):
+            metrics_manager.add_metric(namespace, metric_datum, priority, cumulative)
+        if self.__backpressure_monitor is not None:
+            self.__backpressure_monitor.check(self.get_fill_level, self.get_backpressure_stats)
+
+    def get_fill_level(self):
+        ''' Fill level (0-1) of the fullest region. '''
+        return max(metrics_manager.get_fill_level() for metrics_manager in self.__get_managers())
+
+    def get_backpressure_stats(self):
+        stats = {}
+        for metrics_manager in self.__get_managers():
+            for field, value in metrics_manager.get_backpressure_stats().items():
+                stats[field] = stats.get(field, 0) + value
+        stats[backpressure.FIELD_FILL_LEVEL] = round(self.get_fill_level(), 3)
+        return stats
+
+    def get_buffer_size_bytes(self):
+        return sum(metrics_manager.get_buffer_size_bytes() for metrics_manager in self.__get_managers())
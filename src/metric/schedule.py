@@ -0,0 +1,104 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import math
+import time
+import zlib
+
+# Weight of the latest sample in the arrival rate estimate of a namespace
+ARRIVAL_RATE_SMOOTHING = 0.3
+# A flush closer than this fraction of the interval is pushed to the next slot, so that a timer
+# firing a little early does not flush twice in a row
+MIN_FLUSH_DELAY_FRACTION = 0.1
+
+
+class ArrivalRateEstimator:
+    ''' Exponentially weighted moving average of the rate (metrics/s) at which a namespace buffers
+    metrics, sampled at each flush. Counting is not locked, a lost increment only skews the estimate.
+    '''
+
+    def __init__(self, now):
+        self.rate = None
+        self.arrivals = 0
+        self.__sampled_at = now
+
+    def sample(self, now):
+        elapsed = now - self.__sampled_at
+        if elapsed <= 0:
+            return self.rate
+        arrivals, self.arrivals = self.arrivals, 0
+        self.__sampled_at = now
+        sample = arrivals / elapsed
+        self.rate = sample if self.rate is None else \
+            ARRIVAL_RATE_SMOOTHING * sample + (1 - ARRIVAL_RATE_SMOOTHING) * self.rate
+        return self.rate
+
+
+def get_device_offset(device_name):
+    ''' Fraction (0-1) of the interval a device is offset by, stable across restarts. '''
+    return zlib.crc32((device_name or '').encode('utf-8')) / 2 ** 32
+
+
+class FlushSchedule:
+    ''' Places the flushes of every namespace on a grid of slots interval apart, instead of
+    interval after whenever the namespace got its first metric.
+
+    With align, the slots fall on multiples of the interval since the epoch, so that each upload
+    covers a whole aggregation period and devices started at different times flush together.
+    With jitter, the slots of a device are offset by a fraction of the interval derived from its
+    thing name, so that a fleet redeployed at once spreads its uploads over the interval instead
+    of hitting the account throttling limits together. Without either, flushes are interval apart
+    as before.
+
+    With a max_latency above the interval, the schedule is adaptive instead: each namespace flushes
+    when a full batch is expected at its arrival rate, no sooner than the interval and no later
+    than max_latency after its previous flush. Quiet namespaces then upload fewer, fuller batches,
+    while busy ones keep flushing every interval, or as soon as a batch is full. Adaptive flushes
+    follow the arrivals of each namespace and are neither aligned nor jittered.
+    arguments:
+    align -- whether the slots are aligned on multiples of the interval
+    jitter -- fraction (0-1) of the interval the slots of this device may be offset by
+    device_name -- thing name the offset is derived from
+    clock -- returns the wall clock time (s), so that tests can use a virtual clock
+    max_latency -- longest time (s) between two flushes of an adaptive namespace, 0 disables it
+    '''
+
+    def __init__(self, align=False, jitter=0, device_name=None, clock=time.time, max_latency=0):
+        self.__device_offset = get_device_offset(device_name)
+        self.__clock = clock
+        self.update_settings(align, jitter, max_latency)
+
+    def update_settings(self, align, jitter, max_latency=0):
+        # Publishers apply new settings when they re-arm their timer
+        self.align = align
+        self.jitter = jitter
+        self.max_latency = max_latency
+
+    def is_adaptive(self, interval):
+        return self.max_latency > interval
+
+    def now(self):
+        return self.__clock()
+
+    def get_offset(self, interval):
+        return self.__device_offset * self.jitter * interval
+
+    def next_delay(self, interval, anchor, arrival_rate=None, batch_size=1):
+        ''' Returns the delay (s) to the next flush slot. Without align the slots are counted from
+        anchor, the wall clock time the namespace was created at. An adaptive schedule waits for
+        batch_size metrics at arrival_rate (metrics/s) instead, an unknown rate waits the interval.
+        '''
+        if self.is_adaptive(interval):
+            if arrival_rate is None:
+                return interval
+            if arrival_rate <= 0:
+                return self.max_latency
+            return min(max(batch_size / arrival_rate, interval), self.max_latency)
+        if not self.align and not self.jitter:
+            return interval
+        start = (0 if self.align else anchor) + self.get_offset(interval)
+        now = self.__clock()
+        delay = start + (math.floor((now - start) / interval) + 1) * interval - now
+        if delay < interval * MIN_FLUSH_DELAY_FRACTION:
+            delay += interval
+        return delay
@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+from threading import Lock
+
+from src import utils
+
+logger = utils.logger
+
+SINK_PUT_METRIC_DATA = 'putmetricdata'
+SINK_EMF = 'emf'
+SINK_TYPES = (SINK_PUT_METRIC_DATA, SINK_EMF)
+
+
+def parse_sink(value):
+    ''' Returns the sink type for a name such as "EMF", or None if it is not valid. '''
+    if not isinstance(value, str) or value.lower() not in SINK_TYPES:
+        return None
+    return value.lower()
+
+
+class MetricSink:
+    ''' Destination of the metric batches of a MetricPublisher. put_metric_data() is called with
+    at most METRIC_BATCH_SIZE datums of one namespace, returns an id reported in the status
+    response and raises on failure.
+    '''
+
+    def put_metric_data(self, namespace, metric_data):
+        raise NotImplementedError
+
+
+def to_emf(namespace, metric_datum):
+    ''' Converts a metric datum built by PutMetricRequest to an Embedded Metric Format record. A
+    datum carrying Values and Counts, such as merged samples, a sketch or weighted samples, keeps
+    its counts next to its values.
+    '''
+    dimensions = metric_datum.get('Dimensions', [])
+    record = {
+        '_aws': {
+            'Timestamp': int(metric_datum['Timestamp'] * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [[dimension['Name'] for dimension in dimensions]],
+                'Metrics': [{'Name': metric_datum['MetricName'], 'Unit': metric_datum.get('Unit', 'None')}]
+            }]
+        }
+    }
+    for dimension in dimensions:
+        record[dimension['Name']] = dimension['Value']
+    if 'Counts' in metric_datum:
+        record[metric_datum['MetricName']] = {'Values': metric_datum['Values'], 'Counts': metric_datum['Counts']}
+    else:
+        record[metric_datum['MetricName']] = metric_datum.get('Values', metric_datum.get('Value'))
+    return record
+
+
+class EmfFileSink(MetricSink):
+    ''' Appends metrics as Embedded Metric Format JSON lines to a file, for a log shipper to pick
+    up. Each batch is written with a single write call, so that the shipper never reads a partial
+    batch. The file is opened on first use and rotated like logging.handlers.RotatingFileHandler.
+    arguments:
+    path -- file the records are appended to
+    max_bytes -- size (bytes) above which the file is rotated, 0 disables the rotation
+    backup_count -- number of rotated files kept as path.1 ... path.N, the oldest is removed
+    '''
+
+    def __init__(self, path, max_bytes, backup_count):
+        self.__lock = Lock()
+        self.__file = None
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def update_settings(self, path, max_bytes, backup_count):
+        with self.__lock:
+            if path != self.path:
+                self.__close()
+            self.path = path
+            self.max_bytes = max_bytes
+            self.backup_count = backup_count
+
+    def put_metric_data(self, namespace, metric_data):
+        data = ''.join(json.dumps(to_emf(namespace, metric_datum), separators=(',', ':')) + '\n'
+                       for metric_datum in metric_data).encode('utf-8')
+        with self.__lock:
+            if self.__file is None:
+                self.__open()
+            # The file may already be over the limit when it is opened, left by a previous run
+            if 0 < self.max_bytes < self.__file.tell() + len(data):
+                self.__rotate()
+            self.__file.write(data)
+            self.__file.flush()
+            return self.path
+
+    def close(self):
+        with self.__lock:
+            self.__close()
+
+    def __open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.__file = open(self.path, 'ab')
+
+    def __close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __rotate(self):
+        self.__close()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                rotated_path = '{}.{}'.format(self.path, index)
+                if os.path.exists(rotated_path):
+                    os.replace(rotated_path, '{}.{}'.format(self.path, index + 1))
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        logger.info("Rotated the EMF file %s", self.path)
+        self.__open()
@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import math
+from threading import Lock
+
+from src.metric.counter import get_series_key
+
+# Buckets kept per sign of a sketch, the lowest ones are collapsed beyond it.
+# At 1% relative accuracy they cover a range of about e^40 between the smallest
+# and the largest value.
+MAX_SKETCH_BUCKETS = 2048
+# Largest number of distinct Values in a PutMetricData datum
+MAX_VALUES_PER_DATUM = 150
+# Values closer to zero than this are counted as zero
+MIN_INDEXABLE_VALUE = 1e-9
+# Metric name matching every metric of a namespace
+ALL_METRICS = '*'
+
+
+class DDSketch:
+    ''' Quantile sketch with bounded relative error (DDSketch). Samples are counted in logarithmic
+    buckets, so any quantile read back from the sketch is within relative_accuracy of the true
+    value, add() is O(1) and the memory is bounded by max_buckets whatever the number of samples.
+    Sketches with the same relative_accuracy can be merged.
+    arguments:
+    relative_accuracy -- relative error (0-1) of the values read back from the sketch
+    max_buckets -- buckets kept per sign, the lowest ones are collapsed together beyond it
+    '''
+
+    def __init__(self, relative_accuracy, max_buckets=MAX_SKETCH_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.__gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.__log_gamma = math.log(self.__gamma)
+        self.__max_buckets = max_buckets
+        self.__positive = {}
+        self.__negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        if value > MIN_INDEXABLE_VALUE:
+            self.__add_to_store(self.__positive, self.__key(value), count)
+        elif value < -MIN_INDEXABLE_VALUE:
+            self.__add_to_store(self.__negative, self.__key(-value), count)
+        else:
+            self.zero_count += count
+        self.count += count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('sketches with a different relative accuracy can not be merged')
+        for key, count in other.__positive.items():
+            self.__add_to_store(self.__positive, key, count)
+        for key, count in other.__negative.items():
+            self.__add_to_store(self.__negative, key, count)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def get_buckets(self):
+        ''' Returns the (value, count) of every non empty bucket, in increasing value order. '''
+        buckets = [(-self.__value(key), count) for key, count in sorted(self.__negative.items(), reverse=True)]
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        buckets.extend((self.__value(key), count) for key, count in sorted(self.__positive.items()))
+        return buckets
+
+    def get_quantile(self, quantile):
+        rank = quantile * (self.count - 1)
+        seen = 0
+        for value, count in self.get_buckets():
+            seen += count
+            if seen > rank:
+                return value
+        return None
+
+    def __key(self, value):
+        return math.ceil(math.log(value) / self.__log_gamma)
+
+    def __value(self, key):
+        # Middle of the bucket in relative terms, within relative_accuracy of all its values
+        return 2 * self.__gamma ** key / (self.__gamma + 1)
+
+    def __add_to_store(self, store, key, count):
+        if key in store or len(store) < self.__max_buckets:
+            store[key] = store.get(key, 0) + count
+            return
+        # Collapse the lowest buckets, the relative accuracy of the high quantiles is kept
+        lowest_key = min(store)
+        if key < lowest_key:
+            store[lowest_key] += count
+            return
+        lowest_count = store.pop(lowest_key)
+        next_key = min(store) if store else key
+        if next_key > key:
+            next_key = key
+        store[next_key] = store.get(next_key, 0) + lowest_count
+        store[key] = store.get(key, 0) + count
+
+
+class SketchAggregator:
+    ''' Absorbs the samples of the sketched series of a namespace into one DDSketch per series,
+    keyed by metric name, dimensions and unit. drain() turns each sketch into datums carrying
+    Values and Counts, so the upload volume depends on the number of buckets and not on the
+    number of samples.
+    arguments:
+    metric_names -- names of the sketched metrics, ALL_METRICS sketches every metric
+    relative_accuracy -- relative error (0-1) of the sketches
+    '''
+
+    def __init__(self, metric_names, relative_accuracy):
+        self.metric_names = set(metric_names)
+        self.relative_accuracy = relative_accuracy
+        self.__lock = Lock()
+        self.__series = {}
+
+    def accepts(self, metric_datum):
+        return (ALL_METRICS in self.metric_names or metric_datum['MetricName'] in self.metric_names) \
+            and ('Value' in metric_datum or 'Values' in metric_datum)
+
+    def add(self, metric_datum, count=1):
+        series_key = get_series_key(metric_datum)
+        with self.__lock:
+            series = self.__series.get(series_key)
+            if series is None:
+                series = self.__series[series_key] = [DDSketch(self.relative_accuracy), metric_datum]
+            if 'Value' in metric_datum:
+                series[0].add(metric_datum['Value'], count)
+            else:
+                # Weighted samples, or datums already sketched elsewhere
+                values = metric_datum['Values']
+                for value, weight in zip(values, metric_datum.get('Counts') or [1] * len(values)):
+                    series[0].add(value, weight * count)
+            # The sketch is reported at the time of its latest sample
+            if metric_datum['Timestamp'] > series[1]['Timestamp']:
+                series[1] = metric_datum
+
+    def get_size(self):
+        return len(self.__series)
+
+    def drain(self):
+        ''' Returns the datums of all sketches and starts new ones. '''
+        with self.__lock:
+            series, self.__series = self.__series, {}
+
+        metric_data = []
+        for sketch, latest_datum in series.values():
+            buckets = sketch.get_buckets()
+            for start in range(0, len(buckets), MAX_VALUES_PER_DATUM):
+                chunk = buckets[start:start + MAX_VALUES_PER_DATUM]
+                metric_datum = {key: value for key, value in latest_datum.items()
+                                if key not in ('Value', 'Values', 'Counts')}
+                metric_datum['Values'] = [value for value, _ in chunk]
+                metric_datum['Counts'] = [float(count) for _, count in chunk]
+                metric_data.append(metric_datum)
+        return metric_data
@@ -4,6 +4,7 @@
 import numbers
 import time
 
+from src.metric.priority import PRIORITY_CLASSES, parse_priority
 from src.utils import *
 
 
@@ -15,6 +16,46 @@ class PutMetricRequest:
 
         self.parse_event(event)
 
+    def to_tuple(self):
+        ''' Compact form of a parsed request, made of built-in types only. '''
+        return (self.namespace, self.metric_datum, self.priority, self.cumulative, self.message_id,
+                self.has_timestamp)
+
+    @classmethod
+    def from_tuple(cls, parsed):
+        ''' Rebuilds a request returned by to_tuple(), without validating it again. '''
+        metric_request = cls.__new__(cls)
+        (metric_request.namespace, metric_request.metric_datum, metric_request.priority,
+         metric_request.cumulative, metric_request.message_id, metric_request.has_timestamp) = parsed
+        metric_datum = metric_request.metric_datum
+        metric_request.metric_name = metric_datum['MetricName']
+        # Sketched datums carry Values and Counts instead
+        metric_request.metric_value = metric_datum.get('Value')
+        metric_request.dimension = metric_datum['Dimensions']
+        metric_request.unit = metric_datum['Unit']
+        metric_request.timestamp = metric_datum['Timestamp']
+        return metric_request
+
+    @classmethod
+    def from_template(cls, namespace, dimensions, message):
+        ''' Parses a message published on a templated topic, see src.topic_template. The namespace
+        and dimensions come from the topic and were checked once for it, only the fields of the
+        message are validated.
+        '''
+        if type(message) is not dict:
+            raise ValueError('Incorrect payload format, templated message is not a dict')
+        metric_request = cls.__new__(cls)
+        # The message holds the fields of metricData, the request fields it also holds are not
+        # looked at when parsing the datum
+        metric_request.parse_metric({FIELD_NAMESPACE: namespace, FIELD_METRIC_DATA: message,
+                                     FIELD_PRIORITY: message.get(FIELD_PRIORITY),
+                                     FIELD_MESSAGE_ID: message.get(FIELD_MESSAGE_ID)})
+        if len(dimensions) + len(metric_request.dimension) > MAX_DIMENSIONS_PER_METRIC:
+            raise ValueError(
+                'More than ({}) entries present in field ({})'.format(MAX_DIMENSIONS_PER_METRIC, FIELD_DIMENSIONS))
+        metric_request.dimension = metric_request.metric_datum['Dimensions'] = dimensions + metric_request.dimension
+        return metric_request
+
     def add_dimension(self, dimension_name, dimension_value):
         if self.metric_datum:
             self.metric_datum['Dimensions'].append(
@@ -35,6 +76,8 @@ class PutMetricRequest:
         self.validate_metric(metric)
 
         self.namespace = metric.get(FIELD_NAMESPACE)
+        self.message_id = metric.get(FIELD_MESSAGE_ID)
+        self.priority = self.parse_priority(metric.get(FIELD_PRIORITY))
         self.parse_metric_datum(metric.get(FIELD_METRIC_DATA))
         self.metric_datum = {
             'MetricName': self.metric_name,
@@ -43,6 +86,32 @@ class PutMetricRequest:
             'Unit': self.unit,
             'Timestamp': self.timestamp
         }
+        self.apply_sample_rate(self.sample_rate)
+
+    def apply_sample_rate(self, sample_rate):
+        ''' Weights the datum of a sample kept with a probability of sample_rate, by the inverse of
+        the rate, so that the sums and sample counts of the retained samples stay unbiased. The
+        samples of a cumulative counter are not weighted: dropping some of them only merges their
+        deltas.
+        '''
+        if sample_rate >= 1 or self.cumulative:
+            return
+        metric_datum = self.metric_datum
+        if 'Value' in metric_datum:
+            metric_datum['Values'] = [metric_datum.pop('Value')]
+            metric_datum['Counts'] = [1 / sample_rate]
+        else:
+            metric_datum['Counts'] = [count / sample_rate for count in metric_datum['Counts']]
+
+    def parse_priority(self, priority):
+        if priority is None:
+            return None
+
+        parsed_priority = parse_priority(priority)
+        if parsed_priority is None:
+            raise ValueError('field ({}) is not a valid value, must be in ({})'.format(
+                FIELD_PRIORITY, set(PRIORITY_CLASSES)))
+        return parsed_priority
 
     def validate_metric(self, metric):
         if metric.get(FIELD_NAMESPACE) is None:
@@ -53,12 +122,19 @@ class PutMetricRequest:
             raise ValueError(
                 'mandatory field ({}) is absent in the input'.format(FIELD_METRIC_DATA))
 
+        if metric.get(FIELD_MESSAGE_ID) is not None and type(metric.get(FIELD_MESSAGE_ID)) is not str:
+            raise ValueError(
+                'field ({}) is not a string'.format(FIELD_MESSAGE_ID))
+
     def parse_metric_datum(self, metric_datum):
         self.validate_metric_datum(metric_datum)
 
         self.metric_name = metric_datum.get(FIELD_METRIC_NAME)
         self.metric_value = metric_datum.get(FIELD_METRIC_VALUE)
+        self.cumulative = metric_datum.get(FIELD_METRIC_CUMULATIVE, False)
+        self.sample_rate = metric_datum.get(FIELD_METRIC_SAMPLE_RATE, 1)
         self.unit = metric_datum.get(FIELD_METRIC_UNIT, 'Count')
+        self.has_timestamp = metric_datum.get(FIELD_METRIC_TIMESTAMP) is not None
         self.timestamp = metric_datum.get(FIELD_METRIC_TIMESTAMP, time.time())
         self.dimension = self.parse_dimensions(
             metric_datum.get(FIELD_DIMENSIONS))
@@ -76,6 +152,16 @@ class PutMetricRequest:
                 raise ValueError(
                     'mandatory field ({}) is not a number'.format(FIELD_METRIC_VALUE))
 
+            if type(metric_datum.get(FIELD_METRIC_CUMULATIVE, False)) is not bool:
+                raise ValueError(
+                    'field ({}) is not a boolean'.format(FIELD_METRIC_CUMULATIVE))
+
+            sample_rate = metric_datum.get(FIELD_METRIC_SAMPLE_RATE, 1)
+            if not isinstance(sample_rate, numbers.Number) or isinstance(sample_rate, bool) \
+                    or not 0 < sample_rate <= 1:
+                raise ValueError(
+                    'field ({}) is not a number in (0, 1]'.format(FIELD_METRIC_SAMPLE_RATE))
+
             if metric_datum.get(FIELD_METRIC_UNIT) and metric_datum.get(FIELD_METRIC_UNIT) not in VALID_UNIT_VALUES:
                 raise ValueError(
                     'field ({}) is not a valid value, must be in ({})'.format(FIELD_METRIC_UNIT, VALID_UNIT_VALUES))
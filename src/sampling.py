@@ -0,0 +1,71 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import random
+import re
+
+from src import utils
+from src.metric.sketch import ALL_METRICS
+
+logger = utils.logger
+
+NAMESPACE_PATTERN = re.compile(rb'"namespace"\s*:\s*"((?:[^"\\]|\\.)*)"')
+METRIC_NAME_PATTERN = re.compile(rb'"metricName"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class Sampler:
+    ''' Keeps the samples of hot series with a probability, their sample rate, and drops the
+    others before their message is parsed, as far as the namespace and metric name can be found
+    without parsing it. PutMetricRequest.apply_sample_rate() weights the kept samples by the
+    inverse of their rate, so that the sums and sample counts uploaded stay unbiased.
+    arguments:
+    sample_rates -- sample rate (0-1] by metric name by namespace, ALL_METRICS for the other metrics
+    random -- returns a float in [0, 1), so that tests can control the draws
+    '''
+
+    def __init__(self, sample_rates, random=random.random):
+        self.sample_rates = sample_rates
+        self.__random = random
+        self.dropped_count = 0
+
+    def get_rate(self, namespace, metric_name):
+        metric_rates = self.sample_rates.get(namespace)
+        if metric_rates is None:
+            return 1.0
+        return metric_rates.get(metric_name, metric_rates.get(ALL_METRICS, 1.0))
+
+    def sample(self, namespace, metric_name):
+        ''' Returns the rate the sample was kept at, or None if it is dropped. '''
+        sample_rate = self.get_rate(namespace, metric_name)
+        if sample_rate >= 1:
+            return 1.0
+        if self.__random() >= sample_rate:
+            # Not locked, a lost increment only skews the statistic
+            self.dropped_count += 1
+            return None
+        return sample_rate
+
+    def sample_message(self, message):
+        ''' Samples a raw (bytes) or decoded message by its namespace and metric name. A message
+        whose namespace can not be found is kept, for its parsing to report the error.
+        '''
+        if isinstance(message, bytes):
+            match = NAMESPACE_PATTERN.search(message)
+            if match is None:
+                return 1.0
+            namespace = match.group(1).decode('utf-8', 'replace')
+            if namespace not in self.sample_rates:
+                return 1.0
+            match = METRIC_NAME_PATTERN.search(message)
+            metric_name = match.group(1).decode('utf-8', 'replace') if match else None
+            return self.sample(namespace, metric_name)
+
+        request = message.get(utils.FIELD_REQUEST) if isinstance(message, dict) else None
+        if not isinstance(request, dict):
+            return 1.0
+        namespace = request.get(utils.FIELD_NAMESPACE)
+        if not isinstance(namespace, str):
+            return 1.0
+        metric_data = request.get(utils.FIELD_METRIC_DATA)
+        metric_name = metric_data.get(utils.FIELD_METRIC_NAME) if isinstance(metric_data, dict) else None
+        return self.sample(namespace, metric_name)
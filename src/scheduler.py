@@ -0,0 +1,137 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Timer
+
+from src import utils
+
+logger = utils.logger
+
+# Time (s) given to the event loop thread to stop
+LOOP_STOP_TIMEOUT_SEC = 5
+
+
+class ThreadScheduler:
+    ''' Runs every timer callback and background task on a thread of its own: one Timer thread per
+    namespace flush, one thread per status message. It is the default engine.
+    '''
+
+    def call_later(self, delay, callback, *args):
+        ''' Calls callback(*args) after delay (s). Returns a handle whose cancel() stops the call. '''
+        timer = Timer(delay, callback, args)
+        # The timer must not hold up the process exit
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def submit(self, callback, *args, daemon=True):
+        Thread(target=callback, args=args, daemon=daemon).start()
+
+    def close(self, timeout=LOOP_STOP_TIMEOUT_SEC):
+        pass
+
+
+class ScheduledCall:
+    ''' Handle of a callback scheduled on the event loop of an AsyncioScheduler, with the cancel()
+    of a threading.Timer. It can be cancelled from any thread.
+    '''
+
+    def __init__(self, scheduler, callback, args):
+        self.__scheduler = scheduler
+        self.__callback = callback
+        self.__args = args
+        self.__handle = None
+        self.cancelled = False
+
+    def arm(self, loop, delay):
+        # Runs on the event loop
+        if not self.cancelled:
+            self.__handle = loop.call_later(delay, self.__fire)
+
+    def __fire(self):
+        if not self.cancelled:
+            self.__scheduler.submit(self.__run)
+
+    def __run(self):
+        # The call may have been cancelled while it was waiting for an executor thread
+        if not self.cancelled:
+            self.__callback(*self.__args)
+
+    def cancel(self):
+        self.cancelled = True
+        handle = self.__handle
+        if handle is not None:
+            self.__scheduler.call_soon(handle.cancel)
+
+
+class AsyncioScheduler:
+    ''' Single asyncio event loop owning the flush timers, the idle namespace reaper, the
+    backpressure poll and the status publishing, with the blocking calls they make (PutMetricData,
+    IPC publish) confined to a fixed pool of executor threads. Timers are kept by the loop rather
+    than by a sleeping thread each, so the number of threads no longer grows with the number of
+    namespaces or of status messages, and at most max_workers uploads run at once.
+
+    Metrics are still buffered on the IPC callback threads, under the locks of the buffers.
+    arguments:
+    max_workers -- number of executor threads running the callbacks
+    '''
+
+    def __init__(self, max_workers):
+        # Imported here so that the default ThreadScheduler does not pay for loading asyncio
+        import asyncio
+        self.max_workers = max_workers
+        self.__loop = asyncio.new_event_loop()
+        self.__executor = ThreadPoolExecutor(max_workers, thread_name_prefix='metrics-worker')
+        self.__thread = Thread(target=self.__run_loop, name='metrics-event-loop', daemon=True)
+        self.__thread.start()
+
+    def __run_loop(self):
+        import asyncio
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.run_forever()
+        self.__loop.close()
+
+    def call_soon(self, callback, *args):
+        ''' Runs a non-blocking callback on the event loop. '''
+        try:
+            self.__loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The loop is closed, there is nothing left to schedule
+            pass
+
+    def call_later(self, delay, callback, *args):
+        ''' Calls callback(*args) on an executor thread after delay (s). Returns a handle whose
+        cancel() stops the call.
+        '''
+        scheduled_call = ScheduledCall(self, callback, args)
+        self.call_soon(scheduled_call.arm, self.__loop, delay)
+        return scheduled_call
+
+    def submit(self, callback, *args, daemon=True):
+        ''' Runs callback(*args) on an executor thread. Once the scheduler is closed, the callback
+        runs on the calling thread.
+        '''
+        try:
+            self.__executor.submit(self.__run_task, callback, args)
+        except RuntimeError:
+            self.__run_task(callback, args)
+
+    def __run_task(self, callback, args):
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Error running a scheduled task: ")
+
+    def close(self, timeout=LOOP_STOP_TIMEOUT_SEC):
+        ''' Stops the event loop and the executor, tasks already running are not waited for. '''
+        self.call_soon(self.__loop.stop)
+        self.__thread.join(timeout)
+        self.__executor.shutdown(wait=False)
+
+
+def create_scheduler(asyncio_workers):
+    if asyncio_workers <= 0:
+        return ThreadScheduler()
+    logger.info("Using the asyncio engine with %s executor threads", asyncio_workers)
+    return AsyncioScheduler(asyncio_workers)
@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+
+from src import utils
+
+logger = utils.logger
+
+SHUTDOWN_ERROR_CLASS = 'ShutdownTimeout'
+RESPONSE_FIELD_UNPUBLISHED_METRICS = 'unpublished_metrics'
+RESPONSE_FIELD_REJECTED_METRICS = 'rejected_metrics'
+
+
+class ShutdownCoordinator:
+    ''' Stops ingest and drains the buffered metrics of every namespace within the configured
+    ShutdownTimeout. Metrics that could not be uploaded in time are reported on the output topic.
+    arguments:
+    connector -- the running CloudWatchMetricConnector
+    '''
+
+    def __init__(self, connector):
+        self.__connector = connector
+
+    def shutdown(self):
+        start = time.monotonic()
+        deadline = start + self.__connector.configuration.shutdown_timeout_sec
+        metrics_manager = self.__connector.metrics_manager
+
+        self.__connector.stop_ingest()
+        logger.info("Ingest stopped in %.3f seconds, flushing buffered metrics", time.monotonic() - start)
+
+        leftover = metrics_manager.flush_all(deadline)
+        self.__connector.emf_sink.close()
+        try:
+            # Ingest is stopped, the errors of its last messages are all aggregated
+            self.__connector.error_aggregator.close()
+        except Exception:
+            logger.exception("Failed to report the aggregated errors: ")
+        elapsed = time.monotonic() - start
+        if leftover or metrics_manager.rejected_after_close:
+            self.__report_leftover(leftover, metrics_manager.rejected_after_close)
+        self.__connector.scheduler.close()
+        logger.info("Shutdown completed in %.3f seconds, %s metrics were not published",
+                    elapsed, sum(leftover.values()) + metrics_manager.rejected_after_close)
+        return leftover
+
+    def __report_leftover(self, leftover, rejected_after_close):
+        logger.warning("Metrics not published before the shutdown deadline: %s, rejected after ingest stopped: %s"
+                       , leftover, rejected_after_close)
+        response = utils.generate_error_response(
+            "", SHUTDOWN_ERROR_CLASS, "Buffered metrics could not be published before shutdown",
+            **{RESPONSE_FIELD_UNPUBLISHED_METRICS: dict(leftover),
+               RESPONSE_FIELD_REJECTED_METRICS: rejected_after_close})
+        try:
+            self.__connector.status_publisher.publish_and_wait(response)
+        except Exception:
+            logger.exception("Failed to report unpublished metrics: ")
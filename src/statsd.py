@@ -0,0 +1,325 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+''' Local StatsD listener, on a UDP port or a Unix datagram socket, for processes emitting more
+samples than the IPC publish/subscribe path can carry. Each datagram holds newline separated lines
+
+    <metric>:<value>[:<value>...]|<type>[|@<sample rate>][|#<dimension>:<value>,...]
+
+for instance
+
+    RequestTime:12.5:9.1|ms|@0.5|#line:L1,station:S4
+
+Counters (c) are summed over the window, divided by their sample rate. Gauges (g) report their
+latest value, a value with an explicit sign moves the gauge instead of setting it. Timers (ms),
+histograms (h) and distributions (d) are absorbed into one DDSketch per series. Sets are not
+supported. At the end of each window the aggregates go through the connector like any other
+metric, so the coreName dimension and the cardinality limit apply to them.
+'''
+
+import math
+import os
+import select
+import socket
+import time
+from threading import Lock, Thread
+
+from src import utils
+from src.metric.sketch import ALL_METRICS, SketchAggregator
+from src.request import PutMetricRequest
+
+logger = utils.logger
+
+STATSD_COUNTER = 'c'
+STATSD_GAUGE = 'g'
+STATSD_TIMER_UNITS = {'ms': 'Milliseconds', 'h': 'None', 'd': 'None'}
+# Largest datagram read, StatsD clients stay well below it
+MAX_PACKET_BYTES = 65535
+# Datagrams read off the socket in one go before they are aggregated under a single lock
+MAX_PACKETS_PER_READ = 256
+# Receive buffer requested for bursts, the kernel caps it at net.core.rmem_max
+RECEIVE_BUFFER_BYTES = 4 * 1024 * 1024
+# Time (s) the listener thread waits for datagrams before checking whether it was stopped
+RECEIVE_POLL_SEC = 0.5
+# Distinct dimension sets whose parsing is remembered, the cache starts over beyond it
+MAX_CACHED_TAGS = 4096
+# Gauges remembered for the signed updates, the oldest are forgotten beyond it
+MAX_GAUGE_SERIES = 100000
+# Shortest window (s), used when the metrics are published as they come
+MIN_STATSD_WINDOW_SEC = 1
+
+
+def parse_statsd_address(address):
+    ''' Returns the socket family and bind address of a host:port, a :port or a port bound on the
+    loopback interface, or of an absolute path for a Unix datagram socket. Returns None if the
+    address is not valid.
+    '''
+    if not isinstance(address, str) or not address:
+        return None
+    if address.startswith('/'):
+        return (socket.AF_UNIX, address) if hasattr(socket, 'AF_UNIX') else None
+    host, _, port = address.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        return None
+    if not 0 < port < 65536:
+        return None
+    return socket.AF_INET, (host or '127.0.0.1', port)
+
+
+def parse_tags(tags):
+    ''' Returns the dimensions of the comma separated name:value tags of a line. '''
+    tags = tags.split(',')
+    if len(tags) > utils.MAX_DIMENSIONS_PER_METRIC:
+        raise ValueError('more than ({}) dimensions'.format(utils.MAX_DIMENSIONS_PER_METRIC))
+    dimensions = []
+    for tag in tags:
+        name, _, value = tag.partition(':')
+        if not name or not value:
+            raise ValueError('dimension ({}) is not name:value'.format(tag))
+        dimensions.append({'Name': name, 'Value': value})
+    return tuple(dimensions)
+
+
+class StatsdAggregator:
+    ''' Aggregates the StatsD samples of a window into datums.
+    arguments:
+    relative_accuracy -- relative error (0-1) of the timer sketches
+    '''
+
+    def __init__(self, relative_accuracy):
+        self.__lock = Lock()
+        self.__tags = {}
+        self.__counters = {}
+        self.__gauges = {}
+        self.__updated_gauges = set()
+        self.__timers = SketchAggregator([ALL_METRICS], relative_accuracy)
+        self.invalid_count = 0
+        self.first_error = None
+
+    def add_packets(self, packets, now):
+        ''' Aggregates the lines of the datagrams. The invalid lines are counted and skipped. '''
+        timer_datums = []
+        errors = []
+        with self.__lock:
+            for packet in packets:
+                for line in packet.decode('utf-8', 'replace').split('\n'):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        self.__add_line(line, now, timer_datums)
+                    except ValueError as e:
+                        errors.append('({}): {}'.format(line, e))
+            if errors:
+                self.invalid_count += len(errors)
+                if self.first_error is None:
+                    self.first_error = errors[0]
+        # The sketches have their own lock
+        for metric_datum, count in timer_datums:
+            self.__timers.add(metric_datum, count)
+
+    def __add_line(self, line, now, timer_datums):
+        sections = line.split('|')
+        if len(sections) < 2:
+            raise ValueError('no metric type')
+        name, _, values = sections[0].partition(':')
+        if not name or not values:
+            raise ValueError('expected <metric>:<value>')
+        metric_type = sections[1]
+
+        sample_rate = 1.0
+        tags = ''
+        for section in sections[2:]:
+            if section.startswith('@'):
+                sample_rate = float(section[1:])
+                if not 0 < sample_rate <= 1:
+                    raise ValueError('sample rate ({}) is not in (0, 1]'.format(section[1:]))
+            elif section.startswith('#'):
+                tags = section[1:]
+            # Other extensions, such as container ids, are ignored
+
+        dimensions = self.__tags.get(tags)
+        if dimensions is None:
+            dimensions = parse_tags(tags) if tags else ()
+            if len(self.__tags) >= MAX_CACHED_TAGS:
+                self.__tags.clear()
+            self.__tags[tags] = dimensions
+
+        parsed_values = []
+        for value in values.split(':'):
+            parsed_value = float(value)
+            if not math.isfinite(parsed_value):
+                raise ValueError('value ({}) is not finite'.format(value))
+            parsed_values.append((value, parsed_value))
+
+        series_key = (name, tags)
+        if metric_type == STATSD_COUNTER:
+            counter = self.__counters.get(series_key)
+            if counter is None:
+                counter = self.__counters[series_key] = self.__create_datum(name, dimensions, 'Count', 0.0, now)
+            counter['Value'] += sum(value for _, value in parsed_values) / sample_rate
+            counter['Timestamp'] = now
+        elif metric_type == STATSD_GAUGE:
+            gauge = self.__gauges.get(series_key)
+            if gauge is None:
+                if len(self.__gauges) >= MAX_GAUGE_SERIES:
+                    del self.__gauges[next(iter(self.__gauges))]
+                gauge = self.__gauges[series_key] = self.__create_datum(name, dimensions, 'None', 0.0, now)
+            for raw_value, value in parsed_values:
+                gauge['Value'] = gauge['Value'] + value if raw_value[0] in '+-' else value
+            gauge['Timestamp'] = now
+            self.__updated_gauges.add(series_key)
+        elif metric_type in STATSD_TIMER_UNITS:
+            unit = STATSD_TIMER_UNITS[metric_type]
+            for _, value in parsed_values:
+                timer_datums.append((self.__create_datum(name, dimensions, unit, value, now), 1 / sample_rate))
+        else:
+            raise ValueError('metric type ({}) is not supported'.format(metric_type))
+
+    def __create_datum(self, name, dimensions, unit, value, now):
+        return {
+            'MetricName': name,
+            'Value': value,
+            'Dimensions': list(dimensions),
+            'Unit': unit,
+            'Timestamp': now
+        }
+
+    def drain(self):
+        ''' Returns the datums of the window, with the number of invalid lines and the first of
+        them, and starts a new window. Gauges that were not updated are not reported again.
+        '''
+        with self.__lock:
+            counters, self.__counters = self.__counters, {}
+            updated_gauges, self.__updated_gauges = self.__updated_gauges, set()
+            metric_data = list(counters.values())
+            for series_key in updated_gauges:
+                gauge = self.__gauges.get(series_key)
+                if gauge is not None:
+                    metric_data.append(dict(gauge, Dimensions=list(gauge['Dimensions'])))
+            invalid_count, first_error = self.invalid_count, self.first_error
+            self.invalid_count, self.first_error = 0, None
+
+        for metric_datum in self.__timers.drain():
+            # Datums split from the same sketch share the dimension list the coreName is appended to
+            metric_datum['Dimensions'] = list(metric_datum['Dimensions'])
+            metric_data.append(metric_datum)
+        return metric_data, invalid_count, first_error
+
+
+class StatsdListener:
+    ''' Reads StatsD datagrams on a thread of its own, draining every datagram queued on the
+    socket at each wake up so that a burst is parsed in one pass, and hands the aggregates of each
+    window to the connector.
+    arguments:
+    address -- socket family and bind address returned by parse_statsd_address
+    namespace -- namespace of the StatsD metrics
+    window -- aggregation window (s)
+    relative_accuracy -- relative error (0-1) of the timer sketches
+    connector -- CloudWatchMetricConnector the aggregates are put with
+    scheduler -- runs the window timer
+    '''
+
+    def __init__(self, address, namespace, window, relative_accuracy, connector, scheduler):
+        self.family, self.bind_address = address
+        self.namespace = namespace
+        self.window = max(window, MIN_STATSD_WINDOW_SEC)
+        self.aggregator = StatsdAggregator(relative_accuracy)
+        self.__connector = connector
+        self.__scheduler = scheduler
+        self.__socket = None
+        self.__thread = None
+        self.__timer = None
+        self.__stopped = False
+        self.__timer_lock = Lock()
+
+    def start(self):
+        sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        try:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_BYTES)
+            except OSError:
+                logger.warning("Could not set the StatsD receive buffer to %s bytes", RECEIVE_BUFFER_BYTES)
+            if self.family != socket.AF_INET and os.path.exists(self.bind_address):
+                # Left over by a previous run that did not stop cleanly
+                os.unlink(self.bind_address)
+            sock.bind(self.bind_address)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self.__socket = sock
+        logger.info("Listening for StatsD metrics of namespace %s on %s", self.namespace, self.bind_address)
+        self.__thread = Thread(target=self.__receive, name='statsd-listener', daemon=True)
+        self.__thread.start()
+        self.__arm_timer()
+
+    def update_settings(self, window):
+        # The new window applies from the next timer
+        self.window = max(window, MIN_STATSD_WINDOW_SEC)
+
+    def __receive(self):
+        sock = self.__socket
+        aggregator = self.aggregator
+        while not self.__stopped:
+            try:
+                readable, _, _ = select.select([sock], [], [], RECEIVE_POLL_SEC)
+            except (OSError, ValueError):
+                # The socket was closed by stop()
+                break
+            if not readable:
+                continue
+            packets = []
+            try:
+                while len(packets) < MAX_PACKETS_PER_READ:
+                    packets.append(sock.recv(MAX_PACKET_BYTES))
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                if self.__stopped:
+                    break
+                logger.exception("Error reading StatsD datagrams: ")
+            if packets:
+                aggregator.add_packets(packets, time.time())
+
+    def __arm_timer(self):
+        with self.__timer_lock:
+            if not self.__stopped:
+                self.__timer = self.__scheduler.call_later(self.window, self.__flush_timer)
+
+    def __flush_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Error flushing the StatsD metrics: ")
+        self.__arm_timer()
+
+    def flush(self):
+        ''' Puts the aggregates of the current window and reports its invalid lines. '''
+        metric_data, invalid_count, first_error = self.aggregator.drain()
+        for metric_datum in metric_data:
+            self.__connector.put_metrics(PutMetricRequest.from_tuple(
+                (self.namespace, metric_datum, None, False, None, False)))
+        if invalid_count:
+            self.__connector.report_error(ValueError(
+                '{} invalid StatsD lines, first one: {}'.format(invalid_count, first_error)), str(self.bind_address))
+
+    def stop(self):
+        ''' Stops listening and puts the aggregates of the window in progress. '''
+        with self.__timer_lock:
+            self.__stopped = True
+            timer, self.__timer = self.__timer, None
+        if timer is not None:
+            timer.cancel()
+        if self.__thread is not None:
+            self.__thread.join(RECEIVE_POLL_SEC * 2)
+        if self.__socket is not None:
+            self.__socket.close()
+            if self.family != socket.AF_INET:
+                try:
+                    os.unlink(self.bind_address)
+                except OSError:
+                    pass
+        self.flush()
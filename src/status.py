@@ -0,0 +1,165 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+from threading import Lock
+
+from src import utils
+from src.scheduler import ThreadScheduler
+
+logger = utils.logger
+
+# Error groups (error class and topic) reported per window, the errors of the others are only counted
+MAX_ERROR_GROUPS = 64
+# Payloads kept per error group and window, truncated to MAX_ERROR_SAMPLE_CHARS
+MAX_ERROR_SAMPLES = 3
+MAX_ERROR_SAMPLE_CHARS = 512
+ERROR_SUMMARY_CLASS = 'ErrorSummary'
+RESPONSE_FIELD_ERROR_COUNT = 'count'
+RESPONSE_FIELD_ERRORS = 'errors'
+RESPONSE_FIELD_TOPIC = 'topic'
+RESPONSE_FIELD_SAMPLES = 'samples'
+RESPONSE_FIELD_UNGROUPED_COUNT = 'ungrouped_count'
+
+
+class StatusPublisher:
+    ''' Publishes status responses to the configured output topic without blocking the caller.
+    arguments:
+    ipc -- IPCUtils used to publish the responses
+    output_topic -- topic the responses are published to
+    pubsub_to_iot_core -- whether the responses are also published to IoT Core
+    scheduler -- ThreadScheduler or AsyncioScheduler running the publish calls
+    '''
+
+    def __init__(self, ipc, output_topic, pubsub_to_iot_core, scheduler=None):
+        self.ipc = ipc
+        self.__scheduler = scheduler if scheduler is not None else ThreadScheduler()
+        self.output_topic = output_topic
+        self.pubsub_to_iot_core = pubsub_to_iot_core
+
+    def publish(self, response, topic=None):
+        self.__scheduler.submit(self.ipc.publish_message, topic or self.output_topic, response,
+                                self.pubsub_to_iot_core, daemon=False)
+
+    def publish_and_wait(self, response):
+        self.ipc.publish_message(self.output_topic, response, self.pubsub_to_iot_core)
+
+
+def format_sample(payload):
+    ''' Returns a message payload as a string of at most MAX_ERROR_SAMPLE_CHARS characters. '''
+    if isinstance(payload, (bytes, bytearray)):
+        sample = bytes(payload[:MAX_ERROR_SAMPLE_CHARS * 4]).decode('utf-8', 'replace')
+    elif isinstance(payload, str):
+        sample = payload
+    else:
+        try:
+            sample = json.dumps(payload, default=str)
+        except ValueError:
+            sample = repr(payload)
+    if len(sample) > MAX_ERROR_SAMPLE_CHARS:
+        sample = sample[:MAX_ERROR_SAMPLE_CHARS] + '...'
+    return sample
+
+
+class ErrorGroup:
+    __slots__ = ('error_message', 'count', 'samples')
+
+    def __init__(self, error_message):
+        self.error_message = error_message
+        self.count = 0
+        self.samples = []
+
+
+class ErrorAggregator:
+    ''' Reports the errors of the messages which could not be put, grouped by error class and
+    topic, in one status response per window instead of one per message: a producer sending a
+    flood of bad messages then costs a dictionary update per message. Each group reports its
+    count, its first error message and a few truncated sample payloads; the groups beyond
+    MAX_ERROR_GROUPS are only counted, so the memory and the response size are bounded.
+    arguments:
+    status_publisher -- StatusPublisher the summaries are published with
+    window_sec -- time (s) over which the errors are aggregated, 0 reports each error as it comes
+    scheduler -- runs the window timer
+    '''
+
+    def __init__(self, status_publisher, window_sec, scheduler=None):
+        self.__status_publisher = status_publisher
+        self.__scheduler = scheduler if scheduler is not None else ThreadScheduler()
+        self.window_sec = window_sec
+        self.__lock = Lock()
+        self.__groups = {}
+        self.__ungrouped_count = 0
+        self.__timer = None
+        self.__closed = False
+
+    def update_settings(self, window_sec):
+        # Errors already aggregated are reported at the end of the current window
+        self.window_sec = window_sec
+
+    def add(self, e, topic=None, payload=None):
+        error_class = str(e.__class__)
+        if self.window_sec <= 0 or self.__closed:
+            # Same response as the one published for each error before they were aggregated
+            self.__status_publisher.publish(utils.generate_error_response(error_class, str(e), ""))
+            return
+
+        key = (error_class, topic)
+        with self.__lock:
+            group = self.__groups.get(key)
+            if group is None:
+                if len(self.__groups) >= MAX_ERROR_GROUPS:
+                    self.__ungrouped_count += 1
+                    self.__arm_timer()
+                    return
+                group = self.__groups[key] = ErrorGroup(str(e))
+            group.count += 1
+            if payload is not None and len(group.samples) < MAX_ERROR_SAMPLES:
+                group.samples.append(format_sample(payload))
+            self.__arm_timer()
+
+    def __arm_timer(self):
+        # Called with the lock held
+        if self.__timer is None:
+            self.__timer = self.__scheduler.call_later(self.window_sec, self.__flush_timer)
+
+    def __flush_timer(self):
+        with self.__lock:
+            self.__timer = None
+        self.flush()
+
+    def flush(self, wait=False):
+        ''' Publishes the summary of the errors aggregated so far, if any. '''
+        with self.__lock:
+            groups, self.__groups = self.__groups, {}
+            ungrouped_count, self.__ungrouped_count = self.__ungrouped_count, 0
+        if not groups and not ungrouped_count:
+            return
+
+        errors = [{
+            utils.RESPONSE_FIELD_ERROR_CLASS: error_class,
+            utils.RESPONSE_FIELD_ERROR_MSG: group.error_message,
+            RESPONSE_FIELD_TOPIC: topic,
+            RESPONSE_FIELD_ERROR_COUNT: group.count,
+            RESPONSE_FIELD_SAMPLES: group.samples
+        } for (error_class, topic), group in sorted(groups.items(), key=lambda item: -item[1].count)]
+        error_count = sum(group.count for group in groups.values()) + ungrouped_count
+        # The most frequent error heads the response, for the consumers of single error responses
+        response = utils.generate_error_response(
+            "", errors[0][utils.RESPONSE_FIELD_ERROR_CLASS] if errors else ERROR_SUMMARY_CLASS,
+            errors[0][utils.RESPONSE_FIELD_ERROR_MSG] if errors else "Too many kinds of errors",
+            **{RESPONSE_FIELD_ERROR_COUNT: error_count, RESPONSE_FIELD_ERRORS: errors,
+               RESPONSE_FIELD_UNGROUPED_COUNT: ungrouped_count})
+        logger.debug("Reporting %s errors of the last %s seconds", error_count, self.window_sec)
+        if wait:
+            self.__status_publisher.publish_and_wait(response)
+        else:
+            self.__status_publisher.publish(response)
+
+    def close(self):
+        ''' Publishes the errors aggregated so far and reports the next ones as they come. '''
+        with self.__lock:
+            self.__closed = True
+            timer, self.__timer = self.__timer, None
+        if timer is not None:
+            timer.cancel()
+        self.flush(wait=True)
@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+''' Topic templates, such as metrics/{namespace}/{line}/{station}, whose placeholder segments carry
+the namespace and the dimensions of the metrics published on the matching topics. Messages then
+only hold the metrics: a JSON message holds the fields of metricData, along with the optional
+priority and messageId of the request,
+
+    {"metricName": "Temperature", "value": 21.5, "unit": "None"}
+
+and a binary message holds lines of the line protocol without their first field,
+
+    Temperature=21.5|None,Pressure=101.3 [<timestamp>]
+
+The namespace and dimensions of a topic are parsed once and cached, JSON messages are then parsed
+by PutMetricRequest.from_template() without building the full request.
+'''
+
+from src.utils import MAX_DIMENSIONS_PER_METRIC
+
+NAMESPACE_PLACEHOLDER = 'namespace'
+# Distinct topics whose namespace and dimensions are remembered, the cache starts over beyond it
+MAX_CACHED_TOPICS = 4096
+
+
+class TopicTemplate:
+    ''' Parsed topic template. Raises ValueError if the template is not valid.
+    arguments:
+    template -- topic whose segments are either literal or a {placeholder}, {namespace} is mandatory
+    '''
+
+    def __init__(self, template):
+        if not isinstance(template, str) or not template:
+            raise ValueError('topic template ({}) is not a string'.format(template))
+        self.template = template
+        self.__placeholders = []
+        self.__topics = {}
+        segments = template.split('/')
+        subscription_segments = []
+        for index, segment in enumerate(segments):
+            if segment.startswith('{') and segment.endswith('}'):
+                name = segment[1:-1]
+                if not name or any(name == placeholder for _, placeholder in self.__placeholders):
+                    raise ValueError('placeholder ({}) of topic template ({}) is empty or repeated'
+                                     .format(segment, template))
+                self.__placeholders.append((index, name))
+                subscription_segments.append('+')
+            elif '{' in segment or '}' in segment or '+' in segment or '#' in segment:
+                raise ValueError('segment ({}) of topic template ({}) is neither literal nor a placeholder'
+                                 .format(segment, template))
+            else:
+                subscription_segments.append(segment)
+        if not any(name == NAMESPACE_PLACEHOLDER for _, name in self.__placeholders):
+            raise ValueError('topic template ({}) has no {{{}}} placeholder'.format(template, NAMESPACE_PLACEHOLDER))
+        # The connector appends the coreName dimension
+        if len(self.__placeholders) > MAX_DIMENSIONS_PER_METRIC:
+            raise ValueError('topic template ({}) has more than ({}) dimensions'
+                             .format(template, MAX_DIMENSIONS_PER_METRIC - 1))
+        self.segment_count = len(segments)
+        self.topic = '/'.join(subscription_segments)
+
+    def match(self, topic):
+        ''' Returns the namespace and dimensions carried by a topic matching the template. The
+        dimensions are shared between the calls, callers copy them before extending them.
+        '''
+        head = self.__topics.get(topic)
+        if head is not None:
+            return head
+        segments = topic.split('/')
+        if len(segments) != self.segment_count:
+            raise ValueError('topic ({}) does not match the template ({})'.format(topic, self.template))
+        namespace = None
+        dimensions = []
+        for index, name in self.__placeholders:
+            if not segments[index]:
+                raise ValueError('segment ({}) of topic ({}) is empty'.format(name, topic))
+            if name == NAMESPACE_PLACEHOLDER:
+                namespace = segments[index]
+            else:
+                dimensions.append({'Name': name, 'Value': segments[index]})
+        if len(self.__topics) >= MAX_CACHED_TOPICS:
+            self.__topics.clear()
+        head = self.__topics[topic] = (namespace, dimensions)
+        return head
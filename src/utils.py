@@ -1,12 +1,29 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import atexit
 import logging
 import os
+import queue
 import sys
+from logging.handlers import QueueListener
+
+from src.log import AsyncQueueHandler, RateLimitFilter
+
+# Log records waiting to be written, the newer ones are dropped beyond it
+LOG_QUEUE_SIZE = 10000
+# Records of the same message written per window, the others are counted and reported with the next one
+LOG_RATE_LIMIT_BURST = 10
+LOG_RATE_LIMIT_WINDOW_SEC = 60
 
 logger = logging.getLogger()
 handler = logging.StreamHandler(sys.stdout)
+# Records go through the queue once start_logging() is called, until then they are written right away
+log_queue = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = AsyncQueueHandler(log_queue)
+rate_limit_filter = RateLimitFilter(LOG_RATE_LIMIT_BURST, LOG_RATE_LIMIT_WINDOW_SEC)
+queue_handler.addFilter(rate_limit_filter)
+log_listener = QueueListener(log_queue, handler)
 log_level_switcher = {
     "CRITICAL" : logging.CRITICAL,
     "ERROR" : logging.ERROR,
@@ -38,6 +55,115 @@ DEFAULT_OUTPUT_TOPIC = "cloudwatch/metric/put/status"
 PUBSUB_TO_IOT_CORE_KEY = 'PubSubToIoTCore'
 DEFAULT_PUBSUB_TO_IOT_CORE = 'False'
 
+PREWARM_CLIENT_KEY = 'PrewarmClient'
+DEFAULT_PREWARM_CLIENT = 'True'
+
+SHUTDOWN_TIMEOUT_SEC_KEY = 'ShutdownTimeout'
+DEFAULT_SHUTDOWN_TIMEOUT_SEC = 10
+MAX_SHUTDOWN_TIMEOUT_SEC = 300
+
+MAX_BUFFER_BYTES_KEY = 'MaxBufferBytes'
+DEFAULT_MAX_BUFFER_BYTES = 0
+MAX_MAX_BUFFER_BYTES = 4 * 1024 ** 3
+
+NAMESPACE_PRIORITIES_KEY = 'NamespacePriorities'
+
+REGION_ROUTES_KEY = 'RegionRoutes'
+
+SKETCH_METRICS_KEY = 'SketchMetrics'
+# Percent
+SKETCH_RELATIVE_ACCURACY_KEY = 'SketchRelativeAccuracy'
+DEFAULT_SKETCH_RELATIVE_ACCURACY = 1.0
+MIN_SKETCH_RELATIVE_ACCURACY = 0.01
+MAX_SKETCH_RELATIVE_ACCURACY = 50.0
+
+NAMESPACE_SINKS_KEY = 'NamespaceSinks'
+EMF_FILE_PATH_KEY = 'EmfFilePath'
+DEFAULT_EMF_FILE_PATH = 'emf/metrics.log'
+EMF_FILE_MAX_BYTES_KEY = 'EmfFileMaxBytes'
+DEFAULT_EMF_FILE_MAX_BYTES = 10 * 1024 * 1024
+MAX_EMF_FILE_MAX_BYTES = 1024 * 1024 * 1024
+EMF_FILE_BACKUP_COUNT_KEY = 'EmfFileBackupCount'
+DEFAULT_EMF_FILE_BACKUP_COUNT = 5
+MAX_EMF_FILE_BACKUP_COUNT = 100
+
+# Opt-in, a producer whose metrics fill a batch waits for a free slot while the batch is uploaded
+MAX_CONCURRENT_UPLOADS_KEY = 'MaxConcurrentUploads'
+DEFAULT_MAX_CONCURRENT_UPLOADS = 0
+MAX_MAX_CONCURRENT_UPLOADS = 50
+
+NAMESPACE_IDLE_TIMEOUT_SEC_KEY = 'NamespaceIdleTimeout'
+DEFAULT_NAMESPACE_IDLE_TIMEOUT_SEC = 3600
+MAX_NAMESPACE_IDLE_TIMEOUT_SEC = 7 * 24 * 3600
+
+MAX_NAMESPACES_KEY = 'MaxNamespaces'
+DEFAULT_MAX_NAMESPACES = 1000
+MAX_MAX_NAMESPACES = 100000
+
+DEDUPLICATION_WINDOW_SEC_KEY = 'DeduplicationWindow'
+DEFAULT_DEDUPLICATION_WINDOW_SEC = 0
+MAX_DEDUPLICATION_WINDOW_SEC = 3600
+DEDUPLICATION_CAPACITY_KEY = 'DeduplicationCapacity'
+DEFAULT_DEDUPLICATION_CAPACITY = 100000
+MAX_DEDUPLICATION_CAPACITY = 10000000
+
+INGEST_WORKERS_KEY = 'IngestWorkers'
+DEFAULT_INGEST_WORKERS = 0
+MAX_INGEST_WORKERS = 64
+
+FLUSH_ALIGNMENT_KEY = 'FlushAlignment'
+DEFAULT_FLUSH_ALIGNMENT = 'false'
+FLUSH_JITTER_KEY = 'FlushJitter'
+DEFAULT_FLUSH_JITTER = 0
+MAX_FLUSH_JITTER = 100
+
+MAX_FLUSH_LATENCY_SEC_KEY = 'MaxFlushLatency'
+DEFAULT_MAX_FLUSH_LATENCY_SEC = 0
+MAX_MAX_FLUSH_LATENCY_SEC = 3600
+
+DRAIN_ORDER_KEY = 'DrainOrder'
+DEFAULT_DRAIN_ORDER = 'oldest'
+BACKFILL_SHARE_KEY = 'BackfillShare'
+DEFAULT_BACKFILL_SHARE = 25
+MAX_BACKFILL_SHARE = 100
+
+# CloudWatch rejects datums older than two weeks, an hour is kept for clock skew and uploads in flight
+MAX_METRIC_AGE_SEC_KEY = 'MaxMetricAge'
+DEFAULT_MAX_METRIC_AGE_SEC = 14 * 24 * 3600 - 3600
+MIN_MAX_METRIC_AGE_SEC = 60
+
+# Percentage of the samples kept, by namespace or by metric name by namespace
+SAMPLE_RATES_KEY = 'SampleRates'
+MIN_SAMPLE_RATE = 0.01
+MAX_SAMPLE_RATE = 100.0
+
+# Wildcard input topics whose placeholder segments carry the namespace and dimensions
+TOPIC_TEMPLATES_KEY = 'TopicTemplates'
+
+# host:port, :port or port on the loopback interface, or the path of a Unix datagram socket
+STATSD_ADDRESS_KEY = 'StatsdAddress'
+STATSD_NAMESPACE_KEY = 'StatsdNamespace'
+DEFAULT_STATSD_NAMESPACE = 'StatsD'
+
+# Time (s) over which the errors of the invalid messages are summarized, 0 reports each one
+ERROR_REPORT_WINDOW_SEC_KEY = 'ErrorReportWindow'
+DEFAULT_ERROR_REPORT_WINDOW_SEC = 5
+MAX_ERROR_REPORT_WINDOW_SEC = 300
+
+ASYNCIO_WORKERS_KEY = 'AsyncioWorkers'
+DEFAULT_ASYNCIO_WORKERS = 0
+MAX_ASYNCIO_WORKERS = 32
+
+MAX_SERIES_PER_METRIC_KEY = 'MaxSeriesPerMetric'
+DEFAULT_MAX_SERIES_PER_METRIC = 0
+MAX_MAX_SERIES_PER_METRIC = 10000
+
+BACKPRESSURE_TOPIC_KEY = 'BackpressureTopic'
+BACKPRESSURE_HIGH_WATERMARK_KEY = 'BackpressureHighWatermark'
+DEFAULT_BACKPRESSURE_HIGH_WATERMARK = 80
+BACKPRESSURE_LOW_WATERMARK_KEY = 'BackpressureLowWatermark'
+DEFAULT_BACKPRESSURE_LOW_WATERMARK = 50
+
 GG_CORE_NAME = os.environ.get("AWS_IOT_THING_NAME")
 GG_ROOT_CA_PATH = os.environ.get("GG_ROOT_CA_PATH")
 
@@ -60,6 +186,10 @@ FIELD_DIMENSION_NAME = "name"
 FIELD_DIMENSION_VALUE = "value"
 FIELD_METRIC_TIMESTAMP = "timestamp"
 FIELD_METRIC_UNIT = "unit"
+FIELD_PRIORITY = "priority"
+FIELD_MESSAGE_ID = "messageId"
+FIELD_METRIC_CUMULATIVE = "cumulative"
+FIELD_METRIC_SAMPLE_RATE = "sampleRate"
 
 MAX_DIMENSIONS_PER_METRIC = 30
 VALID_UNIT_VALUES = {'Seconds', 'Microseconds', 'Milliseconds', 'Bytes', 'Kilobytes', 'Megabytes', 'Gigabytes',
@@ -97,3 +227,30 @@ def generate_error_response(rid, error_class, error_msg, **kwargs):
         error_response[RESPONSE].update(kwargs)
 
     return error_response
+
+
+def start_logging():
+    ''' Moves the writing of the log records to the listener thread, until stop_logging(), which
+    also runs at exit so that the records queued by an early exit are written.
+    '''
+    if queue_handler in logger.handlers:
+        return
+    log_listener.start()
+    logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    ''' Reports the records that were suppressed or dropped, then writes the queued records. '''
+    if queue_handler not in logger.handlers:
+        return
+    suppressed = rate_limit_filter.get_suppressed()
+    if suppressed:
+        logger.warning("Log messages suppressed by the rate limit: %s", suppressed)
+    if queue_handler.dropped_count:
+        logger.warning("%s log records were dropped as the log queue was full", queue_handler.dropped_count)
+    logger.removeHandler(queue_handler)
+    log_listener.stop()
+    logger.addHandler(handler)
+    atexit.unregister(stop_logging)
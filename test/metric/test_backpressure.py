@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from mock import MagicMock, patch
+from src.metric import backpressure
+from src.metric.backpressure import BackpressureMonitor
+
+
+class TestBackpressureMonitor(object):
+
+    def setup_method(self, method):
+        self.scheduler = MagicMock()
+        self.status_publisher = MagicMock()
+        self.fill_level = 0.0
+        self.monitor = BackpressureMonitor(self.status_publisher, 'sample/backpressure', 0.8, 0.5, self.scheduler)
+
+    def teardown_method(self, method):
+        patch.stopall()
+
+    def check(self, fill_level):
+        self.fill_level = fill_level
+        self.monitor.check(lambda: self.fill_level, lambda: {backpressure.FIELD_FILL_LEVEL: self.fill_level})
+
+    def published_states(self):
+        return [call[0][0][backpressure.FIELD_BACKPRESSURE][backpressure.FIELD_STATE]
+                for call in self.status_publisher.publish.call_args_list]
+
+    def test_events_on_watermark_crossings(self):
+        self.check(0.7)
+        assert self.published_states() == []
+
+        self.check(0.8)
+        self.check(0.9)
+        assert self.published_states() == [backpressure.STATE_HIGH]
+        event, topic = self.status_publisher.publish.call_args[0]
+        assert topic == 'sample/backpressure'
+        assert event[backpressure.FIELD_BACKPRESSURE][backpressure.FIELD_FILL_LEVEL] == 0.8
+
+        # hysteresis: nothing is sent between the watermarks
+        self.check(0.6)
+        assert self.published_states() == [backpressure.STATE_HIGH]
+
+        self.check(0.5)
+        self.check(0.4)
+        assert self.published_states() == [backpressure.STATE_HIGH, backpressure.STATE_LOW]
+
+    def test_polls_while_above_high_watermark(self):
+        self.check(0.9)
+        self.scheduler.call_later.assert_called_once()
+        poll = self.scheduler.call_later.call_args[0][1]
+
+        # the buffer drained without new metrics coming in
+        self.fill_level = 0.1
+        poll()
+        assert self.published_states() == [backpressure.STATE_HIGH, backpressure.STATE_LOW]
+        self.scheduler.call_later.assert_called_once()
+
+    def test_stop_cancels_polling(self):
+        self.check(0.9)
+        self.monitor.stop()
+        self.scheduler.call_later.return_value.cancel.assert_called_once()
@@ -0,0 +1,176 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+
+from src.metric.buffer import (DRAIN_INTERLEAVED, DRAIN_NEWEST, DRAIN_OLDEST,
+                               BufferTotals, DrainPolicy, MetricBuffer,
+                               get_datum_size)
+from src.metric.priority import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+
+
+def create_metric_datum(timestamp, num_dimensions=1):
+    return {
+        'MetricName': 'test_metric',
+        'Dimensions': [
+            {
+                'Name': 'dimension_{}'.format(i),
+                'Value': 'value_{}'.format(i) * 10
+            } for i in range(num_dimensions)
+        ],
+        'Timestamp': timestamp,
+        'Value': 123.0,
+        'Unit': 'Seconds'
+    }
+
+
+class TestMetricBuffer(object):
+
+    def test_datum_size_grows_with_dimensions(self):
+        assert get_datum_size(create_metric_datum(1, 30)) > 10 * get_datum_size(create_metric_datum(1, 0))
+
+    def test_oldest_first_and_size_accounting(self):
+        metric_buffer = MetricBuffer()
+        datums = [create_metric_datum(timestamp) for timestamp in (3, 1, 2)]
+        for metric_datum in datums:
+            metric_buffer.put(metric_datum)
+
+        assert metric_buffer.qsize() == 3
+        assert metric_buffer.size_bytes() == sum(get_datum_size(d) for d in datums)
+
+        assert [entry[0]['Timestamp'] for entry in metric_buffer.get_batch(1)] == [1]
+        assert [entry[0]['Timestamp'] for entry in metric_buffer.get_batch(5)] == [2, 3]
+        assert metric_buffer.get_batch(1) == []
+        assert metric_buffer.size_bytes() == 0
+
+    def test_totals_follow_every_buffer(self):
+        now = time.time()
+        totals = BufferTotals()
+        drain_policy = DrainPolicy()
+        metric_buffers = [MetricBuffer(drain_policy, totals) for _ in range(2)]
+        for metric_buffer in metric_buffers:
+            for age in (7200, 10, 0):
+                metric_buffer.put(create_metric_datum(now - age))
+        assert totals.count == 6
+        assert totals.size_bytes == sum(b.size_bytes() for b in metric_buffers)
+
+        # the oldest datum of each buffer expires, the first buffer also uploads one
+        drain_policy.update_settings(DRAIN_OLDEST, 0, 3600)
+        metric_buffers[0].get_batch(1)
+        metric_buffers[1].evict(1)
+        assert totals.count == 3
+        assert totals.size_bytes == sum(b.size_bytes() for b in metric_buffers)
+
+        # a detached buffer no longer counts, nor do the datums it removes afterwards
+        metric_buffers[0].detach_totals()
+        metric_buffers[0].get_batch(1)
+        assert totals.count == 2
+        assert totals.size_bytes == metric_buffers[1].size_bytes()
+
+    def test_evict_bytes(self):
+        metric_buffer = MetricBuffer()
+        small_datum = create_metric_datum(1)
+        for timestamp in range(4):
+            metric_buffer.put(create_metric_datum(timestamp))
+
+        assert metric_buffer.evict_bytes(get_datum_size(small_datum) + 1) == 2 * get_datum_size(small_datum)
+        assert metric_buffer.qsize() == 2
+        assert metric_buffer.get_batch(1)[0][0]['Timestamp'] == 2
+
+        metric_buffer.evict_bytes(10 ** 9)
+        assert metric_buffer.qsize() == 0
+        assert metric_buffer.size_bytes() == 0
+
+    def test_priority_classes(self):
+        metric_buffer = MetricBuffer()
+        metric_buffer.put(create_metric_datum(1), priority=PRIORITY_LOW)
+        metric_buffer.put(create_metric_datum(2), priority=PRIORITY_NORMAL)
+        metric_buffer.put(create_metric_datum(3), priority=PRIORITY_HIGH)
+        assert metric_buffer.lowest_priority() == PRIORITY_LOW
+
+        # eviction never goes above the requested class
+        assert metric_buffer.evict(3, PRIORITY_NORMAL) == 2
+        assert metric_buffer.lowest_priority() == PRIORITY_HIGH
+        assert metric_buffer.evictable_bytes(PRIORITY_NORMAL) == 0
+
+        metric_buffer.put(create_metric_datum(4), priority=PRIORITY_LOW)
+        # uploads take the highest class first
+        metric_datum, _, priority = metric_buffer.get_batch(1)[0]
+        assert metric_datum['Timestamp'] == 3
+        assert priority == PRIORITY_HIGH
+
+    def test_newest_first(self):
+        metric_buffer = MetricBuffer(DrainPolicy(DRAIN_NEWEST))
+        for timestamp in (3, 1, 4, 2):
+            metric_buffer.put(create_metric_datum(timestamp))
+
+        assert [entry[0]['Timestamp'] for entry in metric_buffer.get_batch(2)] == [4, 3]
+        # eviction still drops the oldest
+        assert metric_buffer.evict(1) == 1
+        assert [entry[0]['Timestamp'] for entry in metric_buffer.get_batch(5)] == [2]
+        assert metric_buffer.qsize() == 0
+        assert metric_buffer.size_bytes() == 0
+
+    def test_interleaved_caps_backfill_share(self):
+        metric_buffer = MetricBuffer(DrainPolicy(DRAIN_INTERLEAVED, 0.25))
+        for timestamp in range(100):
+            metric_buffer.put(create_metric_datum(timestamp))
+
+        timestamps = [entry[0]['Timestamp'] for entry in metric_buffer.get_batch(20)]
+        assert timestamps == list(range(99, 84, -1)) + list(range(5))
+
+        # without a backlog, the batch takes everything
+        metric_buffer = MetricBuffer(DrainPolicy(DRAIN_INTERLEAVED, 0.25))
+        for timestamp in range(3):
+            metric_buffer.put(create_metric_datum(timestamp))
+        assert sorted(entry[0]['Timestamp'] for entry in metric_buffer.get_batch(20)) == [0, 1, 2]
+
+    def test_drain_order_can_change(self):
+        drain_policy = DrainPolicy(DRAIN_NEWEST)
+        metric_buffer = MetricBuffer(drain_policy)
+        for timestamp in range(300):
+            metric_buffer.put(create_metric_datum(timestamp))
+        assert metric_buffer.get_batch(1)[0][0]['Timestamp'] == 299
+
+        drain_policy.update_settings(DRAIN_OLDEST, 0)
+        assert [entry[0]['Timestamp'] for entry in metric_buffer.get_batch(2)] == [0, 1]
+        drain_policy.update_settings(DRAIN_NEWEST, 0)
+        for _ in range(14):
+            metric_buffer.get_batch(20)
+        assert metric_buffer.qsize() == 17
+        assert metric_buffer.get_batch(20)[-1][0]['Timestamp'] == 2
+        assert metric_buffer.qsize() == 0
+
+    def test_expiry(self):
+        now = time.time()
+        drain_policy = DrainPolicy(DRAIN_NEWEST)
+        metric_buffer = MetricBuffer(drain_policy)
+        for age in (7200, 5000, 10, 0):
+            metric_buffer.put(create_metric_datum(now - age), priority=PRIORITY_LOW)
+        metric_buffer.put(create_metric_datum(now - 4000), priority=PRIORITY_HIGH)
+
+        drain_policy.update_settings(DRAIN_NEWEST, 0, 3600)
+        # a datum already past the cutoff is not buffered
+        assert not metric_buffer.put(create_metric_datum(now - 9000))
+        assert metric_buffer.expired_count == 1
+        assert metric_buffer.qsize() == 5
+
+        batch = metric_buffer.get_batch(20)
+        assert [entry[0]['Timestamp'] for entry in batch] == [now, now - 10]
+        assert metric_buffer.expired_count == 4
+        assert metric_buffer.evicted_count == 0
+        assert metric_buffer.size_bytes() == 0
+
+    def test_expired_datums_are_freed_first(self):
+        now = time.time()
+        drain_policy = DrainPolicy()
+        metric_buffer = MetricBuffer(drain_policy)
+        for age in (7200, 0):
+            metric_buffer.put(create_metric_datum(now - age), priority=PRIORITY_HIGH)
+        metric_buffer.put(create_metric_datum(now - 10), priority=PRIORITY_LOW)
+
+        drain_policy.update_settings(DRAIN_OLDEST, 0, 3600)
+        assert metric_buffer.evict(1) == 1
+        assert metric_buffer.expired_count == 1
+        assert metric_buffer.evicted_count == 0
+        assert metric_buffer.qsize() == 2
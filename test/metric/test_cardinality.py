@@ -0,0 +1,105 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from mock import MagicMock, patch
+from src.metric import cardinality
+from src.metric.cardinality import CardinalityLimiter, SpaceSaving
+from src.request import PutMetricRequest
+
+
+def create_request(request_id, metric_name='Latency', cumulative=False):
+    return PutMetricRequest({"request": {
+        "namespace": "Greengrass",
+        "metricData": {
+            "metricName": metric_name,
+            "dimensions": [{"name": "line", "value": "1"}, {"name": "requestId", "value": request_id}],
+            "value": 1.0,
+            "cumulative": cumulative
+        }
+    }})
+
+
+class TestCardinalityLimiter(object):
+
+    def test_space_saving_keeps_heavy_hitters(self):
+        space_saving = SpaceSaving(3)
+        for i in range(1000):
+            space_saving.add('heavy')
+            space_saving.add('noise-{}'.format(i))
+
+        item, count, error = space_saving.top(1)[0]
+        assert item == 'heavy'
+        assert 1000 <= count <= 1000 + error
+
+    def test_overflow_is_folded_and_reported(self):
+        status_publisher = MagicMock()
+        limiter = CardinalityLimiter(2, status_publisher)
+
+        for request_id in ('a', 'b', 'a'):
+            metric_request = create_request(request_id)
+            limiter.limit(metric_request)
+            assert metric_request.metric_datum['Dimensions'][1]['Value'] == request_id
+
+        metric_request = create_request('c')
+        limiter.limit(metric_request)
+        assert metric_request.metric_datum['Dimensions'] == [
+            {'Name': 'line', 'Value': cardinality.OTHER_DIMENSION_VALUE},
+            {'Name': 'requestId', 'Value': cardinality.OTHER_DIMENSION_VALUE}]
+
+        # other metrics have their own budget
+        metric_request = create_request('c', metric_name='Errors')
+        limiter.limit(metric_request)
+        assert metric_request.metric_datum['Dimensions'][1]['Value'] == 'c'
+
+        report = status_publisher.publish.call_args[0][0][cardinality.FIELD_CARDINALITY_LIMIT]
+        assert report[cardinality.FIELD_OFFENDERS] == [{
+            cardinality.FIELD_NAMESPACE: 'Greengrass', cardinality.FIELD_METRIC_NAME: 'Latency',
+            cardinality.FIELD_FOLDED_METRICS: 1}]
+
+        # reports are rate limited
+        limiter.limit(create_request('d'))
+        assert status_publisher.publish.call_count == 1
+        assert limiter.folded_count == 2
+
+    def test_memory_is_bounded(self):
+        limiter = CardinalityLimiter(10, MagicMock())
+        for i in range(cardinality.MAX_TRACKED_METRICS + 50):
+            limiter.limit(create_request('a', metric_name='metric-{}'.format(i)))
+
+        assert limiter.get_tracked_metrics() == cardinality.MAX_TRACKED_METRICS
+        assert limiter.folded_count == 50
+
+    def test_metric_name_churn_does_not_reset_the_cap(self):
+        limiter = CardinalityLimiter(2, MagicMock())
+        for request_id in ('a', 'b', 'c'):
+            limiter.limit(create_request(request_id))
+        assert limiter.folded_count == 1
+
+        for i in range(cardinality.MAX_TRACKED_METRICS + 50):
+            limiter.limit(create_request('a', metric_name='metric-{}'.format(i)))
+        folded_count = limiter.folded_count
+
+        metric_request = create_request('d')
+        limiter.limit(metric_request)
+        assert metric_request.metric_datum['Dimensions'][1]['Value'] == cardinality.OTHER_DIMENSION_VALUE
+        assert limiter.folded_count == folded_count + 1
+
+    def test_cumulative_series_are_not_folded(self):
+        limiter = CardinalityLimiter(1, MagicMock())
+        limiter.limit(create_request('a'))
+
+        # two counters past the cap keep their own series, their totals are not mixed
+        for request_id in ('b', 'c', 'b', 'c'):
+            metric_request = create_request(request_id, cumulative=True)
+            limiter.limit(metric_request)
+            assert metric_request.metric_datum['Dimensions'][1]['Value'] == request_id
+        assert limiter.folded_count == 0
+
+    def test_series_are_bounded_across_metrics(self):
+        limiter = CardinalityLimiter(10, MagicMock())
+        with patch.object(cardinality, 'MAX_TRACKED_SERIES', 15):
+            for metric_name in ('Latency', 'Errors'):
+                for i in range(10):
+                    limiter.limit(create_request(str(i), metric_name=metric_name))
+
+        assert limiter.folded_count == 5
@@ -0,0 +1,54 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from src.metric.counter import CumulativeCounterTracker
+
+
+def create_metric_datum(value, timestamp=1600000000.0, dimension_value='eth0'):
+    return {
+        'MetricName': 'bytes_sent',
+        'Dimensions': [{'Name': 'interface', 'Value': dimension_value}],
+        'Timestamp': timestamp,
+        'Value': value,
+        'Unit': 'Bytes'
+    }
+
+
+class TestCumulativeCounterTracker(object):
+
+    def test_deltas_between_drains(self):
+        tracker = CumulativeCounterTracker()
+        tracker.add(create_metric_datum(1000.0))
+        # the first sample only sets the baseline
+        assert tracker.drain() == []
+
+        tracker.add(create_metric_datum(1500.0, 1600000010.0))
+        tracker.add(create_metric_datum(1800.0, 1600000020.0))
+        metric_datum, = tracker.drain()
+        assert metric_datum['Value'] == 800.0
+        assert metric_datum['Timestamp'] == 1600000020.0
+
+        # series without new samples are not reported, their baseline is kept
+        assert tracker.drain() == []
+        tracker.add(create_metric_datum(1900.0))
+        assert [metric_datum['Value'] for metric_datum in tracker.drain()] == [100.0]
+
+    def test_counter_reset(self):
+        tracker = CumulativeCounterTracker()
+        tracker.add(create_metric_datum(1000.0))
+        tracker.add(create_metric_datum(1200.0))
+        # the producer restarted and counts from 0 again
+        tracker.add(create_metric_datum(50.0))
+
+        assert [metric_datum['Value'] for metric_datum in tracker.drain()] == [250.0]
+
+    def test_series_are_bounded(self):
+        tracker = CumulativeCounterTracker(max_series=2)
+        for dimension_value in ('eth0', 'eth1', 'wlan0'):
+            tracker.add(create_metric_datum(10.0, dimension_value=dimension_value))
+
+        assert tracker.get_size() == 2
+        # eth0 was forgotten, its next sample sets a new baseline
+        tracker.add(create_metric_datum(20.0, dimension_value='eth0'))
+        tracker.add(create_metric_datum(20.0, dimension_value='wlan0'))
+        assert [metric_datum['Dimensions'][0]['Value'] for metric_datum in tracker.drain()] == ['wlan0']
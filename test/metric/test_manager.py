@@ -16,7 +16,12 @@ class TestMetricManager(object):
         self.mock_publisher_class = patch(
             'src.metric.publisher.MetricPublisher', autospec=True).start()
         self.mock_publisher = MagicMock()
+        self.mock_publisher.priority = 1
+        self.mock_publisher.lowest_priority.return_value = None
+        self.mock_publisher.sketch_metric.return_value = False
         self.mock_publisher_class.return_value = self.mock_publisher
+        self.mock_cw_class = patch(
+            'src.metric.client.CloudWatchClient', autospec=True).start()
 
     def teardown_method(self, method):
         patch.stopall()
@@ -51,15 +56,12 @@ class TestMetricManager(object):
         metric_datum = self.create_default_metric_datum()
         metric_manager = MetricsManager('us-east-1', 5, 3)
 
-        # return 2 as the size of each namespace metrics
-        self.mock_publisher.get_size.return_value = 2
-
         # now an add should trigger add_metric()
         metric_manager.add_metric('GG', metric_datum)
         self.mock_publisher.add_metric.assert_called_once_with(metric_datum)
 
-        # return 2 as the size of each namespace metrics
-        self.mock_publisher.get_size.return_value = 4
+        # the namespace now holds more metrics than the bucket
+        self.set_buffered(4)
 
         # now an add should trigger replace_metric()
         metric_manager.add_metric('GG', metric_datum)
@@ -71,18 +73,14 @@ class TestMetricManager(object):
         metric_datum = self.create_default_metric_datum()
         metric_manager = MetricsManager('us-east-1', 5, 2)
 
-        # return 0 as the size of each namespace metrics
-        self.mock_publisher.get_size.return_value = 0
-
         # now an add should trigger add_metric()
         metric_manager.add_metric('GG', metric_datum)
         metric_manager.add_metric('GG1', metric_datum)
         metric_manager.add_metric('GG2', metric_datum)
 
-        # return 1 as the size of each namespace metrics
-        # this would return total size of bucket as 3
+        # each namespace holds one metric, the total size of bucket is 3
         # and should trigger replace for a new metric as our max_size is 2
-        self.mock_publisher.get_size.return_value = 1
+        self.set_buffered(3)
 
         metric_manager.add_metric('GG', metric_datum)
         self.mock_publisher.replace_metric.assert_called_with(metric_datum)
@@ -100,6 +98,256 @@ class TestMetricManager(object):
         metric_manager.add_metric('GG3', metric_datum)
         self.mock_publisher.replace_metric.assert_called_with(metric_datum)
 
+    def test_client_is_shared_and_prewarmed(self):
+        from src.metric.manager import MetricsManager
+        self.mock_publisher.get_size.return_value = 0
+        metric_manager = MetricsManager('us-east-1', 5, 100)
+
+        metric_manager.prewarm_client()
+        self.mock_cw_class.assert_called_once_with('us-east-1')
+
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        metric_manager.add_metric('GG1', self.create_default_metric_datum())
+        self.mock_cw_class.assert_called_once_with('us-east-1')
+        assert self.mock_publisher_class.call_args[1]['cw_client'] == self.mock_cw_class.return_value
+
+    def test_prewarm_failure_is_not_fatal(self):
+        from src.metric.manager import MetricsManager
+        self.mock_cw_class.side_effect = ValueError('no credentials')
+        metric_manager = MetricsManager('us-east-1', 5, 100)
+
+        metric_manager.prewarm_client()
+
+    def test_update_settings(self):
+        from src.metric.manager import MetricsManager
+        self.mock_publisher.get_size.return_value = 0
+        metric_manager = MetricsManager('us-east-1', 5, 100)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+
+        metric_manager.update_settings('us-west-2', 20, 100)
+
+        self.mock_publisher.set_put_metric_interval.assert_called_once_with(20)
+        self.mock_cw_class.assert_called_with('us-west-2')
+        self.mock_publisher.set_cw_client.assert_called_once_with(self.mock_cw_class.return_value)
+
+        # shrinking the bucket below its current size drops the oldest metrics
+        self.set_buffered(150)
+        self.mock_publisher.drop_oldest.return_value = 100
+        metric_manager.update_settings('us-west-2', 20, 50)
+        self.mock_publisher.drop_oldest.assert_called_once_with(100)
+
+    def test_update_settings_applies_priorities_and_upload_slots(self):
+        from src.metric.manager import MetricsManager
+        from src.metric.priority import PRIORITY_HIGH, PRIORITY_NORMAL
+        self.mock_publisher.get_size.return_value = 0
+        metric_manager = MetricsManager('us-east-1', 5, 100, max_concurrent_uploads=2)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        assert self.mock_publisher_class.call_args[1]['priority'] == PRIORITY_NORMAL
+        upload_slots = self.mock_publisher_class.call_args[1]['upload_slots']
+
+        metric_manager.update_settings('us-east-1', 5, 100, namespace_priorities={'GG': PRIORITY_HIGH},
+                                       max_concurrent_uploads=7)
+        assert self.mock_publisher.priority == PRIORITY_HIGH
+        assert upload_slots.max_slots == 7
+
+        metric_manager.update_settings('us-east-1', 5, 100)
+        assert self.mock_publisher.priority == PRIORITY_NORMAL
+        assert upload_slots.max_slots == 0
+
+    def test_update_settings_applies_byte_budget(self):
+        from src.metric.manager import MetricsManager
+        metric_manager = MetricsManager('us-east-1', 5, 100)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        self.set_buffered(0, 5000)
+
+        # setting a budget below the buffered bytes drops the oldest metrics
+        self.mock_publisher.drop_oldest_bytes.return_value = 4000
+        metric_manager.update_settings('us-east-1', 5, 100, max_buffer_bytes=1000)
+        self.mock_publisher.drop_oldest_bytes.assert_called_once_with(4000)
+        assert metric_manager.get_fill_level() == 1.0
+
+        # the new budget applies to the next metrics
+        self.set_buffered(0, 1000)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        self.mock_publisher.replace_metric.assert_called_once()
+
+    def test_close_and_flush_all(self):
+        import time
+        from src.metric.manager import MetricsManager
+        self.mock_publisher.get_size.return_value = 0
+        metric_manager = MetricsManager('us-east-1', 5, 100)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+
+        metric_manager.close()
+        self.mock_publisher.stop.assert_called_once()
+
+        # metrics are rejected once the manager is closed
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        assert metric_manager.rejected_after_close == 1
+        self.mock_publisher.add_metric.assert_called_once()
+
+        self.mock_publisher.get_size.return_value = 4
+        leftover = metric_manager.flush_all(time.monotonic() + 5)
+        self.mock_publisher.flush_all.assert_called_once()
+        assert leftover == {'GG': 4}
+
+    def test_reap_idle_namespaces(self):
+        from src.metric.manager import MetricsManager
+        self.mock_publisher_class.side_effect = lambda *args, **kwargs: MagicMock(get_size=MagicMock(return_value=0))
+        metric_manager = MetricsManager('us-east-1', 5, 100, namespace_idle_timeout=60)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        metric_manager.add_metric('GG1', self.create_default_metric_datum())
+        idle_publisher = metric_manager.metrics_bucket['GG']
+        idle_publisher.last_metric_time = time.monotonic() - 120
+        idle_publisher.flush_all.return_value = 0
+        metric_manager.metrics_bucket['GG1'].last_metric_time = time.monotonic()
+
+        assert metric_manager.reap_idle_namespaces() == ['GG']
+
+        assert list(metric_manager.metrics_bucket.keys()) == ['GG1']
+        idle_publisher.stop.assert_called_once()
+        idle_publisher.detach_buffer_totals.assert_called_once()
+        idle_publisher.flush_all.assert_called_once()
+        metric_manager.close()
+
+    def test_max_namespaces_removes_least_recently_used(self):
+        from src.metric.manager import MetricsManager
+        self.mock_publisher_class.side_effect = lambda *args, **kwargs: MagicMock(get_size=MagicMock(return_value=0))
+        metric_manager = MetricsManager('us-east-1', 5, 100, max_namespaces=2)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        metric_manager.add_metric('GG1', self.create_default_metric_datum())
+        metric_manager.metrics_bucket['GG'].last_metric_time = 2
+        metric_manager.metrics_bucket['GG1'].last_metric_time = 1
+        lru_publisher = metric_manager.metrics_bucket['GG1']
+
+        metric_manager.add_metric('GG2', self.create_default_metric_datum())
+
+        assert sorted(metric_manager.metrics_bucket.keys()) == ['GG', 'GG2']
+        lru_publisher.stop.assert_called_once()
+
+    def test_replace_metric_with_byte_budget(self):
+        from src.metric.buffer import get_datum_size
+        from src.metric.manager import MetricsManager
+        metric_datum = self.create_default_metric_datum()
+        datum_size = get_datum_size(metric_datum)
+        metric_manager = MetricsManager('us-east-1', 5, 100, max_buffer_bytes=10 * datum_size)
+        metric_manager.add_metric('GG', metric_datum)
+        self.mock_publisher.add_metric.assert_called_once_with(metric_datum, datum_size)
+
+        # the budget is exceeded by the size of two datums
+        self.set_buffered(11, 11 * datum_size)
+        metric_manager.add_metric('GG', metric_datum)
+        self.mock_publisher.replace_metric.assert_called_once_with(metric_datum, 2 * datum_size, datum_size)
+
+    def test_lower_priority_namespace_evicted_first(self):
+        from src.metric.manager import MetricsManager
+        from src.metric.priority import PRIORITY_HIGH, PRIORITY_LOW
+        publishers = {}
+
+        def create_publisher(namespace, *args, **kwargs):
+            publishers[namespace] = MagicMock(priority=kwargs['priority'], get_size_bytes=MagicMock(return_value=0))
+            publishers[namespace].lowest_priority.return_value = kwargs['priority']
+            publishers[namespace].sketch_metric.return_value = False
+            # each namespace holds one metric
+            kwargs['buffer_totals'].add(1, 0)
+            return publishers[namespace]
+        self.mock_publisher_class.side_effect = create_publisher
+        metric_manager = MetricsManager('us-east-1', 5, 1, namespace_priorities={
+            'Health': PRIORITY_HIGH, 'Telemetry': PRIORITY_LOW})
+        metric_manager.add_metric('Telemetry', self.create_default_metric_datum())
+        metric_manager.add_metric('Health', self.create_default_metric_datum())
+
+        # the bucket is full: the low priority namespace makes room for the high priority one
+        publishers['Telemetry'].drop_oldest.assert_called_once_with(1, PRIORITY_HIGH + 1)
+        publishers['Health'].add_metric.assert_called_once()
+        publishers['Health'].replace_metric.assert_not_called()
+
+        # a low priority metric never evicts a high priority one
+        metric_datum = self.create_default_metric_datum()
+        metric_manager.add_metric('Health', metric_datum, PRIORITY_LOW)
+        publishers['Health'].replace_metric.assert_called_once_with(metric_datum, priority=PRIORITY_LOW)
+
+    def test_backpressure_stats(self):
+        from src.metric import backpressure
+        from src.metric.manager import MetricsManager
+        monitor = MagicMock()
+        metric_manager = MetricsManager('us-east-1', 5, 4, backpressure_monitor=monitor)
+        self.mock_publisher.get_evicted_count.return_value = 2
+        self.mock_publisher.get_expired_count.return_value = 4
+        self.mock_publisher.replace_metric.return_value = False
+
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+        self.set_buffered(3, 300)
+        assert metric_manager.get_fill_level() == 0.75
+        self.set_buffered(5, 300)
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+
+        assert monitor.check.call_count == 2
+        assert metric_manager.get_fill_level() == 1.0
+        assert metric_manager.get_backpressure_stats() == {
+            backpressure.FIELD_FILL_LEVEL: 1.0,
+            backpressure.FIELD_BUFFERED_METRICS: 5,
+            backpressure.FIELD_BUFFERED_BYTES: 300,
+            backpressure.FIELD_EVICTED_METRICS: 2,
+            backpressure.FIELD_EXPIRED_METRICS: 4,
+            backpressure.FIELD_REJECTED_METRICS: 1
+        }
+
+        metric_manager.close()
+        monitor.stop.assert_called_once()
+
+    def test_namespace_routed_to_emf_sink(self):
+        from src.metric.manager import MetricsManager
+        from src.metric.sink import SINK_EMF
+        emf_sink = MagicMock()
+        self.mock_publisher.get_size.return_value = 0
+        metric_manager = MetricsManager('us-east-1', 5, 100, namespace_sinks={'Telemetry': SINK_EMF},
+                                        emf_sink=emf_sink)
+
+        metric_manager.add_metric('Telemetry', self.create_default_metric_datum())
+        metric_manager.add_metric('GG', self.create_default_metric_datum())
+
+        assert self.mock_publisher_class.call_args_list[0][1]['cw_client'] is emf_sink
+        assert self.mock_publisher_class.call_args_list[1][1]['cw_client'] is self.mock_cw_class.return_value
+
+        # moving the namespace back to PutMetricData
+        metric_manager.update_settings('us-east-1', 5, 100)
+        self.mock_publisher.set_cw_client.assert_called_with(self.mock_cw_class.return_value)
+
+    def test_cumulative_metric_bypasses_the_bucket(self):
+        from src.metric.manager import MetricsManager
+        metric_manager = MetricsManager('us-east-1', 5, 100)
+        metric_datum = self.create_default_metric_datum()
+
+        metric_manager.add_metric('GG', metric_datum, cumulative=True)
+
+        self.mock_publisher.add_cumulative_metric.assert_called_once_with(metric_datum)
+        self.mock_publisher.add_metric.assert_not_called()
+
+    def test_aggregates_are_bounded_like_other_metrics(self):
+        from src.metric.manager import MetricsManager
+        metric_manager = MetricsManager('us-east-1', 5, 4)
+        metric_datum = self.create_default_metric_datum()
+        metric_manager.add_metric('GG', metric_datum, cumulative=True)
+        buffer_aggregate = self.mock_publisher_class.call_args[1]['buffer_aggregate']
+
+        self.set_buffered(2)
+        buffer_aggregate(self.mock_publisher, metric_datum)
+        self.mock_publisher.add_metric.assert_called_once_with(metric_datum, flush=False)
+
+        # a full bucket makes the aggregate replace the oldest metric of its namespace
+        self.set_buffered(5)
+        self.mock_publisher.replace_metric.return_value = False
+        buffer_aggregate(self.mock_publisher, metric_datum)
+        self.mock_publisher.replace_metric.assert_called_once_with(metric_datum, flush=False)
+        assert metric_manager.rejected_metrics == 1
+
+    def set_buffered(self, count, size_bytes=0):
+        ''' Sets the metrics buffered by the namespaces, as their buffers count them in the manager. '''
+        buffer_totals = self.mock_publisher_class.call_args[1]['buffer_totals']
+        buffer_totals.count = count
+        buffer_totals.size_bytes = size_bytes
+
     def create_default_metric_datum(self):
         return {
             'MetricName': 'test_metric',
@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+from threading import Thread
+
+from src.metric.priority import (PRIORITY_HIGH, PRIORITY_LOW,
+                                 WeightedFairUploadSlots, parse_priority)
+
+
+class TestWeightedFairUploadSlots(object):
+
+    def test_parse_priority(self):
+        assert parse_priority('High') == PRIORITY_HIGH
+        assert parse_priority('low') == PRIORITY_LOW
+        assert parse_priority('urgent') is None
+        assert parse_priority(1) is None
+
+    def test_disabled_slots_never_block(self):
+        upload_slots = WeightedFairUploadSlots(0)
+        for _ in range(10):
+            assert upload_slots.acquire('GG', PRIORITY_LOW) == False
+
+    def test_raising_max_slots_releases_waiters(self):
+        upload_slots = WeightedFairUploadSlots(1)
+        upload_slots.acquire('Holder', PRIORITY_HIGH)
+        waiter = Thread(target=upload_slots.acquire, args=('GG', PRIORITY_LOW))
+        waiter.start()
+        waiter.join(0.05)
+        assert waiter.is_alive()
+
+        upload_slots.set_max_slots(2)
+        waiter.join(5)
+        assert not waiter.is_alive()
+
+    def test_higher_priority_gets_more_slots(self):
+        upload_slots = WeightedFairUploadSlots(1)
+        granted = []
+
+        def upload(namespace, priority):
+            with upload_slots.slot(namespace, priority):
+                granted.append(namespace)
+
+        # hold the only slot until every upload is waiting for it
+        upload_slots.acquire('Holder', PRIORITY_HIGH)
+        threads = []
+        for namespace, priority in [('Telemetry', PRIORITY_LOW)] * 4 + [('Health', PRIORITY_HIGH)] * 4:
+            thread = Thread(target=upload, args=(namespace, priority))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.01)
+        upload_slots.release()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(granted) == 8
+        # the high priority namespace is served 4 times as often while both are waiting
+        assert granted[:5].count('Health') == 4
@@ -64,3 +64,211 @@ class TestMetricPublisherWithBatchDisabled(object):
             i = i + 1
 
         assert metric_publisher.get_size() == 0
+
+    def test_set_put_metric_interval(self):
+        import src.metric.publisher as publisher
+        metric_datum = create_default_metric_datum()
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 0)
+        assert metric_publisher.timer is None
+
+        metric_publisher.set_put_metric_interval(60)
+        timer = metric_publisher.timer
+        assert timer.is_alive()
+
+        # buffered metrics are kept when the timer is re-armed
+        metric_publisher.add_metric(metric_datum)
+        metric_publisher.set_put_metric_interval(30)
+        assert timer.finished.is_set()
+        assert metric_publisher.timer.interval == 30
+        assert metric_publisher.get_size() == 1
+
+        metric_publisher.set_put_metric_interval(0)
+        assert metric_publisher.timer is None
+
+    def test_flush_timer_on_asyncio_scheduler(self):
+        import src.metric.publisher as publisher
+        from src.scheduler import AsyncioScheduler
+        scheduler = AsyncioScheduler(1)
+        metric_datum = create_default_metric_datum()
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 0.05, cw_client=self.mock_cw,
+                                                     scheduler=scheduler)
+        metric_publisher.add_metric(metric_datum)
+
+        deadline = time.monotonic() + 2
+        while metric_publisher.get_size() > 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        metric_publisher.stop()
+        scheduler.close()
+
+        self.mock_cw.put_metric_data.assert_called_with('GG', [metric_datum])
+
+    def test_flush_timer_follows_schedule(self):
+        import src.metric.publisher as publisher
+        from src.metric.schedule import FlushSchedule
+        clock = MagicMock(return_value=1000.0)
+        scheduler = MagicMock()
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 60, cw_client=self.mock_cw, scheduler=scheduler,
+                                                     flush_schedule=FlushSchedule(align=True, clock=clock))
+
+        assert scheduler.call_later.call_args[0][0] == 20
+        flush = scheduler.call_later.call_args[0][1]
+        metric_publisher.add_metric(create_default_metric_datum())
+
+        clock.return_value = 1020.0
+        flush()
+        assert scheduler.call_later.call_args[0][0] == 60
+        assert self.mock_cw.put_metric_data.call_count == 1
+
+    def test_adaptive_flush_waits_for_quiet_namespace(self):
+        import src.metric.publisher as publisher
+        from src.metric.schedule import FlushSchedule
+        scheduler = MagicMock()
+        with patch('src.metric.publisher.time.monotonic', return_value=0):
+            metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 10, cw_client=self.mock_cw,
+                                                         scheduler=scheduler,
+                                                         flush_schedule=FlushSchedule(max_latency=60))
+        assert scheduler.call_later.call_args[0][0] == 10
+        flush = scheduler.call_later.call_args[0][1]
+
+        for _ in range(5):
+            metric_publisher.add_metric(create_default_metric_datum())
+        with patch('src.metric.publisher.time.monotonic', return_value=10):
+            flush()
+
+        # 0.5 metric/s fills a batch in 40s
+        assert scheduler.call_later.call_args[0][0] == 40
+        assert self.mock_cw.put_metric_data.call_count == 1
+
+    def test_drop_oldest(self):
+        import src.metric.publisher as publisher
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 60)
+        for _ in range(3):
+            metric_publisher.add_metric(create_default_metric_datum())
+
+        assert metric_publisher.drop_oldest(2) == 2
+        assert metric_publisher.drop_oldest(2) == 1
+        assert metric_publisher.get_size() == 0
+        metric_publisher.set_put_metric_interval(0)
+
+    def test_stop_and_flush_all(self):
+        import src.metric.publisher as publisher
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 60)
+        for _ in range(publisher.METRIC_BATCH_SIZE + 5):
+            metric_publisher.add_metric(create_default_metric_datum())
+        self.mock_cw.reset_mock()
+
+        metric_publisher.stop()
+        assert metric_publisher.timer is None
+        # a stopped publisher never re-arms its timer
+        metric_publisher.set_put_metric_interval(30)
+        assert metric_publisher.timer is None
+
+        assert metric_publisher.flush_all(time.monotonic() + 5) == 0
+        assert self.mock_cw.put_metric_data.call_count == 1
+
+    def test_flush_all_stops_without_progress(self):
+        from botocore.exceptions import ConnectionError
+        import src.metric.publisher as publisher
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 60)
+        metric_publisher.stop()
+        self.mock_cw.put_metric_data.side_effect = ConnectionError(error='offline')
+        metric_publisher.add_metric(create_default_metric_datum())
+
+        assert metric_publisher.flush_all(time.monotonic() + 5) == 1
+        assert metric_publisher.flush_all(time.monotonic() - 1) == 1
+
+    def test_replace_metric_frees_bytes(self):
+        import src.metric.publisher as publisher
+        from src.metric.buffer import get_datum_size
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 60)
+        metric_publisher.stop()
+        metric_datum = create_default_metric_datum()
+        datum_size = get_datum_size(metric_datum)
+        for _ in range(3):
+            metric_publisher.add_metric(create_default_metric_datum())
+        assert metric_publisher.get_size_bytes() == 3 * datum_size
+
+        metric_publisher.replace_metric(metric_datum, 2 * datum_size)
+        assert metric_publisher.get_size() == 2
+
+        # the namespace can not release enough bytes, the new metric is dropped
+        metric_publisher.replace_metric(metric_datum, 3 * datum_size)
+        assert metric_publisher.get_size() == 2
+
+    def test_replace_metric_after_expiry(self):
+        import src.metric.publisher as publisher
+        from src.metric.buffer import DRAIN_OLDEST, DrainPolicy, get_datum_size
+        from src.metric.priority import PRIORITY_HIGH, PRIORITY_LOW
+        drain_policy = DrainPolicy()
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 60, priority=PRIORITY_LOW,
+                                                     drain_policy=drain_policy)
+        metric_publisher.stop()
+        metric_datum = create_default_metric_datum()
+        for _ in range(3):
+            old_datum = create_default_metric_datum()
+            old_datum['Timestamp'] -= 7200
+            metric_publisher.add_metric(old_datum, priority=PRIORITY_HIGH)
+        drain_policy.update_settings(DRAIN_OLDEST, 0, 3600)
+
+        # the buffer is full of expired metrics of a higher class, they still make room
+        assert metric_publisher.replace_metric(metric_datum)
+        assert metric_publisher.get_size() == 1
+        assert metric_publisher.get_expired_count() == 3
+
+        # same with a byte budget
+        drain_policy.update_settings(DRAIN_OLDEST, 0, 0)
+        for _ in range(2):
+            old_datum = create_default_metric_datum()
+            old_datum['Timestamp'] -= 7200
+            metric_publisher.add_metric(old_datum, priority=PRIORITY_HIGH)
+        drain_policy.update_settings(DRAIN_OLDEST, 0, 3600)
+        assert metric_publisher.replace_metric(metric_datum, 2 * get_datum_size(metric_datum))
+        assert metric_publisher.get_size() == 2
+        assert metric_publisher.get_expired_count() == 5
+
+    def test_sketched_metrics_are_uploaded_as_values_and_counts(self):
+        import src.metric.publisher as publisher
+        from src.metric.sketch import SketchAggregator
+        metric_publisher = publisher.MetricPublisher(
+            'GG', 'us-east-1', 60, sketch_aggregator=SketchAggregator(['test_metric'], 0.01))
+        metric_publisher.stop()
+        for _ in range(publisher.METRIC_BATCH_SIZE * 5):
+            assert metric_publisher.sketch_metric(create_default_metric_datum())
+        assert metric_publisher.get_size() == 0
+
+        assert metric_publisher.flush_all(time.monotonic() + 5) == 0
+        self.mock_cw.put_metric_data.assert_called_once()
+        metric_datum, = self.mock_cw.put_metric_data.call_args[0][1]
+        assert metric_datum['Counts'] == [100.0]
+
+    def test_cumulative_metrics_are_uploaded_as_deltas(self):
+        import src.metric.publisher as publisher
+        metric_publisher = publisher.MetricPublisher('GG', 'us-east-1', 60)
+        metric_publisher.stop()
+        for value in (100.0, 130.0, 150.0):
+            metric_datum = create_default_metric_datum()
+            metric_datum['Value'] = value
+            metric_publisher.add_cumulative_metric(metric_datum)
+
+        assert metric_publisher.flush_all(time.monotonic() + 5) == 0
+        metric_datum, = self.mock_cw.put_metric_data.call_args[0][1]
+        assert metric_datum['Value'] == 50.0
+
+    def test_aggregates_are_buffered_through_the_owner(self):
+        import src.metric.publisher as publisher
+        from src.metric.sketch import SketchAggregator
+        buffer_aggregate = MagicMock()
+        metric_publisher = publisher.MetricPublisher(
+            'GG', 'us-east-1', 60, sketch_aggregator=SketchAggregator(['test_metric'], 0.01),
+            buffer_aggregate=buffer_aggregate)
+        metric_publisher.stop()
+        metric_publisher.sketch_metric(create_default_metric_datum())
+        # the first sample of a counter is its baseline
+        metric_publisher.add_cumulative_metric(create_default_metric_datum())
+        metric_publisher.add_cumulative_metric(create_default_metric_datum())
+
+        assert metric_publisher.flush_all(time.monotonic() + 5) == 0
+        assert [call[0][1]['MetricName'] for call in buffer_aggregate.call_args_list] == \
+            ['test_metric', 'test_metric']
+        assert buffer_aggregate.call_args[0][0] is metric_publisher
+        self.mock_cw.put_metric_data.assert_not_called()
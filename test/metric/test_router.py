@@ -0,0 +1,80 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+
+from mock import MagicMock, patch
+
+
+class TestMetricsRouter(object):
+
+    def setup_method(self, method):
+        self.managers = {}
+
+        def create_manager(region, *args, **kwargs):
+            self.managers[region] = MagicMock()
+            self.managers[region].flush_all.return_value = {}
+            return self.managers[region]
+        self.mock_manager_class = patch('src.metric.router.MetricsManager', side_effect=create_manager).start()
+
+    def teardown_method(self, method):
+        patch.stopall()
+
+    def test_unrouted_namespace_goes_to_default_region(self):
+        from src.metric.router import MetricsRouter
+        router = MetricsRouter('us-east-1', 5, 100, region_routes={'Health': ['us-west-2']})
+        metric_datum = self.create_default_metric_datum()
+
+        router.add_metric('GG', metric_datum)
+
+        self.managers['us-east-1'].add_metric.assert_called_once_with('GG', metric_datum, None, False)
+        self.managers['us-west-2'].add_metric.assert_not_called()
+
+    def test_mirrored_namespace_shares_the_datum(self):
+        from src.metric.router import MetricsRouter
+        router = MetricsRouter('us-east-1', 5, 100, region_routes={'Health': ['us-east-1', 'eu-west-1']})
+        metric_datum = self.create_default_metric_datum()
+
+        router.add_metric('Health', metric_datum, 0)
+
+        assert sorted(self.managers) == ['eu-west-1', 'us-east-1']
+        for region in self.managers:
+            assert self.managers[region].add_metric.call_args[0][1] is metric_datum
+
+    def test_update_settings_retires_unrouted_regions(self):
+        from src.metric.router import MetricsRouter
+        router = MetricsRouter('us-east-1', 5, 100, region_routes={'Health': ['us-east-1', 'eu-west-1']})
+        eu_manager = self.managers['eu-west-1']
+
+        router.update_settings('us-east-1', 10, 100, region_routes={'Health': ['ap-south-1']})
+
+        self.managers['us-east-1'].update_settings.assert_called_once_with(
+            'us-east-1', put_metric_interval=10, max_bucket_size=100, namespace_idle_timeout=0, max_namespaces=0,
+            max_buffer_bytes=0, namespace_priorities=None, max_concurrent_uploads=0, namespace_sinks=None,
+            sketch_metrics=None, sketch_relative_accuracy=0.01)
+        eu_manager.close.assert_called_once()
+        router.add_metric('Health', self.create_default_metric_datum())
+        self.managers['ap-south-1'].add_metric.assert_called_once()
+        eu_manager.add_metric.assert_not_called()
+
+    def test_close_and_flush_all(self):
+        from src.metric.router import MetricsRouter
+        router = MetricsRouter('us-east-1', 5, 100, region_routes={'Health': ['us-east-1', 'eu-west-1']})
+        self.managers['us-east-1'].flush_all.return_value = {'Health': 1, 'GG': 2}
+        self.managers['eu-west-1'].flush_all.return_value = {'Health': 3}
+
+        router.close()
+        router.add_metric('GG', self.create_default_metric_datum())
+
+        assert router.rejected_after_close == 1
+        for metrics_manager in self.managers.values():
+            metrics_manager.close.assert_called_once()
+        assert router.flush_all(time.monotonic() + 5) == {'Health': 4, 'GG': 2}
+
+    def create_default_metric_datum(self):
+        return {
+            'MetricName': 'test_metric',
+            'Timestamp': time.time(),
+            'Value': 123.0,
+            'Unit': 'Seconds'
+        }
@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from src.metric.schedule import ArrivalRateEstimator, FlushSchedule, get_device_offset
+
+
+class VirtualClock:
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestFlushSchedule(object):
+
+    def setup_method(self, method):
+        self.clock = VirtualClock(1000.0)
+
+    def test_unaligned_schedule_keeps_interval(self):
+        flush_schedule = FlushSchedule(clock=self.clock)
+        assert flush_schedule.next_delay(60, 990.0) == 60
+
+    def test_aligned_schedule(self):
+        flush_schedule = FlushSchedule(align=True, clock=self.clock)
+
+        assert flush_schedule.next_delay(60, 990.0) == pytest.approx(20)
+        # a timer firing on the slot, or a little early, waits for the next one
+        self.clock.now = 1020.0
+        assert flush_schedule.next_delay(60, 990.0) == pytest.approx(60)
+        self.clock.now = 1019.9
+        assert flush_schedule.next_delay(60, 990.0) == pytest.approx(60.1)
+
+    def test_device_offset_is_deterministic(self):
+        assert get_device_offset('thing-1') == get_device_offset('thing-1')
+        assert 0 <= get_device_offset('thing-1') < 1
+        assert get_device_offset(None) == get_device_offset('')
+
+    def test_jitter_spreads_a_fleet_over_the_interval(self):
+        slots = set()
+        for device in range(1000):
+            flush_schedule = FlushSchedule(True, 1.0, 'thing-{}'.format(device), self.clock)
+            slots.add(int((self.clock.now + flush_schedule.next_delay(60, 0)) % 60))
+
+        # every second of the interval gets some of the devices
+        assert len(slots) == 60
+
+    def test_jitter_without_alignment_counts_from_anchor(self):
+        flush_schedule = FlushSchedule(False, 0.5, 'thing-1', self.clock)
+        offset = flush_schedule.get_offset(60)
+        assert 0 <= offset < 30
+
+        delay = flush_schedule.next_delay(60, self.clock.now)
+        assert delay == pytest.approx(offset if offset >= 6 else offset + 60)
+
+    def test_update_settings(self):
+        flush_schedule = FlushSchedule(clock=self.clock)
+        flush_schedule.update_settings(True, 0)
+        assert flush_schedule.next_delay(60, 990.0) == pytest.approx(20)
+
+    def test_arrival_rate_estimator(self):
+        estimator = ArrivalRateEstimator(0)
+        assert estimator.rate is None
+
+        estimator.arrivals = 20
+        assert estimator.sample(10) == 2
+        assert estimator.arrivals == 0
+        assert estimator.sample(20) == pytest.approx(1.4)
+
+    def test_adaptive_schedule_targets_full_batches(self):
+        flush_schedule = FlushSchedule(align=True, clock=self.clock, max_latency=60)
+        assert flush_schedule.is_adaptive(10)
+        assert not flush_schedule.is_adaptive(60)
+
+        # unknown rate: the interval, as before
+        assert flush_schedule.next_delay(10, 0, None, 20) == 10
+        # quiet namespace: waits for a batch, up to the latency bound
+        assert flush_schedule.next_delay(10, 0, 0.5, 20) == 40
+        assert flush_schedule.next_delay(10, 0, 0.1, 20) == 60
+        assert flush_schedule.next_delay(10, 0, 0, 20) == 60
+        # busy namespace: keeps the interval
+        assert flush_schedule.next_delay(10, 0, 100, 20) == 10
@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+
+from src.metric.sink import EmfFileSink, parse_sink, to_emf
+
+
+def create_default_metric_datum(value=123.0):
+    return {
+        'MetricName': 'test_metric',
+        'Dimensions': [{'Name': 'topic', 'Value': 'test_topic'}],
+        'Timestamp': 1600000000.5,
+        'Value': value,
+        'Unit': 'Seconds'
+    }
+
+
+class TestEmfFileSink(object):
+
+    def test_parse_sink(self):
+        assert parse_sink('EMF') == 'emf'
+        assert parse_sink('PutMetricData') == 'putmetricdata'
+        assert parse_sink('kafka') is None
+
+    def test_to_emf(self):
+        assert to_emf('GG', create_default_metric_datum()) == {
+            '_aws': {
+                'Timestamp': 1600000000500,
+                'CloudWatchMetrics': [{
+                    'Namespace': 'GG',
+                    'Dimensions': [['topic']],
+                    'Metrics': [{'Name': 'test_metric', 'Unit': 'Seconds'}]
+                }]
+            },
+            'topic': 'test_topic',
+            'test_metric': 123.0
+        }
+
+    def test_to_emf_keeps_counts(self):
+        metric_datum = create_default_metric_datum()
+        del metric_datum['Value']
+        metric_datum['Values'] = [1.0, 2.0]
+        metric_datum['Counts'] = [3.0, 0.5]
+
+        assert to_emf('GG', metric_datum)['test_metric'] == {'Values': [1.0, 2.0], 'Counts': [3.0, 0.5]}
+
+    def test_batch_is_written_as_json_lines(self, tmp_path):
+        path = str(tmp_path / 'emf' / 'metrics.log')
+        sink = EmfFileSink(path, 0, 0)
+
+        assert sink.put_metric_data('GG', [create_default_metric_datum(1.0), create_default_metric_datum(2.0)]) == path
+        sink.close()
+
+        with open(path) as emf_file:
+            records = [json.loads(line) for line in emf_file]
+        assert [record['test_metric'] for record in records] == [1.0, 2.0]
+
+    def test_rotation(self, tmp_path):
+        path = str(tmp_path / 'metrics.log')
+        line_size = len(json.dumps(to_emf('GG', create_default_metric_datum()), separators=(',', ':'))) + 1
+        sink = EmfFileSink(path, 2 * line_size, 2)
+
+        for value in range(7):
+            sink.put_metric_data('GG', [create_default_metric_datum(float(value))])
+        sink.close()
+
+        def values(file_path):
+            with open(file_path) as emf_file:
+                return [json.loads(line)['test_metric'] for line in emf_file]
+        assert values(path) == [6.0]
+        assert values(path + '.1') == [4.0, 5.0]
+        assert values(path + '.2') == [2.0, 3.0]
+        assert not (tmp_path / 'metrics.log.3').exists()
+
+    def test_oversized_file_is_rotated_on_first_write(self, tmp_path):
+        path = str(tmp_path / 'metrics.log')
+        line_size = len(json.dumps(to_emf('GG', create_default_metric_datum()), separators=(',', ':'))) + 1
+        # left over by a previous run, already at the limit
+        with open(path, 'wb') as emf_file:
+            emf_file.write(b'x' * 2 * line_size)
+        sink = EmfFileSink(path, 2 * line_size, 1)
+
+        sink.put_metric_data('GG', [create_default_metric_datum()])
+        sink.close()
+
+        assert os.path.getsize(path) == line_size
+        assert os.path.getsize(path + '.1') == 2 * line_size
@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import random
+
+from src.metric.sketch import (ALL_METRICS, MAX_VALUES_PER_DATUM, DDSketch,
+                               SketchAggregator)
+
+
+def create_metric_datum(value, timestamp=1600000000.0, metric_name='latency'):
+    return {
+        'MetricName': metric_name,
+        'Dimensions': [{'Name': 'topic', 'Value': 'test_topic'}],
+        'Timestamp': timestamp,
+        'Value': value,
+        'Unit': 'Milliseconds'
+    }
+
+
+class TestDDSketch(object):
+
+    def test_quantiles_within_relative_accuracy(self):
+        random.seed(7)
+        samples = sorted(random.lognormvariate(3, 1) for _ in range(10000))
+        sketch = DDSketch(0.01)
+        for sample in samples:
+            sketch.add(sample)
+
+        assert sketch.count == len(samples)
+        for quantile in (0.0, 0.5, 0.9, 0.99, 1.0):
+            expected = samples[int(quantile * (len(samples) - 1))]
+            assert abs(sketch.get_quantile(quantile) - expected) <= 0.01 * expected
+
+    def test_negative_and_zero_values(self):
+        sketch = DDSketch(0.01)
+        for value in (-10.0, 0.0, 0.0, 10.0):
+            sketch.add(value)
+
+        values = [value for value, _ in sketch.get_buckets()]
+        assert [count for _, count in sketch.get_buckets()] == [1, 2, 1]
+        assert values[1] == 0.0 and abs(values[0] + 10) <= 0.1 and abs(values[2] - 10) <= 0.1
+
+    def test_memory_is_bounded(self):
+        sketch = DDSketch(0.01, max_buckets=10)
+        for exponent in range(100):
+            sketch.add(1.1 ** exponent)
+
+        assert len(sketch.get_buckets()) == 10
+        assert sum(count for _, count in sketch.get_buckets()) == 100
+        # the highest values keep their accuracy
+        assert abs(sketch.get_quantile(1.0) - 1.1 ** 99) <= 0.01 * 1.1 ** 99
+
+    def test_merge(self):
+        sketch, other = DDSketch(0.01), DDSketch(0.01)
+        for value in range(1, 51):
+            sketch.add(value)
+            other.add(value + 50)
+
+        sketch.merge(other)
+        assert sketch.count == 100
+        assert abs(sketch.get_quantile(1.0) - 100) <= 1
+
+
+class TestSketchAggregator(object):
+
+    def test_drain_emits_values_and_counts_per_series(self):
+        aggregator = SketchAggregator(['latency'], 0.01)
+        assert not aggregator.accepts(create_metric_datum(1.0, metric_name='other'))
+
+        for value in (5.0, 5.0, 20.0):
+            aggregator.add(create_metric_datum(value, timestamp=1600000000.0 + value))
+        metric_data = aggregator.drain()
+
+        assert len(metric_data) == 1
+        metric_datum = metric_data[0]
+        assert 'Value' not in metric_datum
+        assert metric_datum['Timestamp'] == 1600000020.0
+        assert metric_datum['Counts'] == [2.0, 1.0]
+        assert abs(metric_datum['Values'][0] - 5.0) <= 0.05
+        assert aggregator.drain() == []
+
+    def test_weighted_samples_are_absorbed_with_their_counts(self):
+        aggregator = SketchAggregator([ALL_METRICS], 0.01)
+        metric_datum = create_metric_datum(10.0)
+        del metric_datum['Value']
+        metric_datum['Values'] = [10.0]
+        metric_datum['Counts'] = [4.0]
+        assert aggregator.accepts(metric_datum)
+
+        aggregator.add(metric_datum)
+        aggregator.add(create_metric_datum(10.0), 2)
+        metric_data = aggregator.drain()
+
+        assert len(metric_data) == 1
+        assert metric_data[0]['Counts'] == [6.0]
+
+    def test_large_sketch_is_split_across_datums(self):
+        aggregator = SketchAggregator([ALL_METRICS], 0.01)
+        for exponent in range(MAX_VALUES_PER_DATUM + 10):
+            aggregator.add(create_metric_datum(1.1 ** exponent))
+
+        metric_data = aggregator.drain()
+        assert [len(metric_datum['Values']) for metric_datum in metric_data] == [MAX_VALUES_PER_DATUM, 10]
@@ -1,10 +1,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
-import importlib
+import subprocess
+import sys
 
 from mock import MagicMock, patch
 from src import utils
+from src.configuration import Configuration
 
 DEFAULT_NAMESPACE = 'Greengrass'
 DEFAULT_METRIC_NAME = 'Count'
@@ -25,17 +27,6 @@ def get_sample_config():
     }
 
 
-def get_empty_values_config():
-    return {
-        utils.PUBLISH_REGION_KEY: '',
-        utils.PUBLISH_INTERVAL_SEC_KEY: '',
-        utils.MAX_METRICS_KEY: '',
-        utils.INPUT_TOPIC_KEY: '',
-        utils.OUTPUT_TOPIC_KEY: '',
-        utils.PUBSUB_TO_IOT_CORE_KEY: ''
-    }
-
-
 def create_valid_request_with_all_fields():
     return {
         "request": {
@@ -63,89 +54,252 @@ class TestHandler(object):
         self.mock_iot = MagicMock()
         self.mock_iot_class.return_value = self.mock_iot
         self.mock_metric_manager_class = patch(
-            'src.metric.manager.MetricsManager', autospec=True).start()
+            'src.cloudwatch_metric_connector.MetricsRouter', autospec=True).start()
         self.mock_manager = MagicMock()
         self.mock_manager.add_metric.return_value = True
         self.mock_metric_manager_class.return_value = self.mock_manager
-        self.mock_ipc_class = patch(
-            'src.ipc_utils.IPCUtils', autospec=True).start()
         self.mock_ipc = MagicMock()
         self.mock_ipc.subscribe_to_pubsub_topic.return_value = True
         self.mock_ipc.subscribe_to_iot_topic.return_value = True
-        self.mock_ipc_class.return_value = self.mock_ipc
 
     def teardown_method(self, method):
         patch.stopall()
 
-    def test_parsing_config_parameters(self):
+    def test_import_has_no_side_effects(self):
+        # importing the connector must neither connect to IPC nor load boto3
+        code = ('import sys, src.cloudwatch_metric_connector; '
+                'assert "boto3" not in sys.modules and "botocore" not in sys.modules')
+        subprocess.check_call([sys.executable, '-c', code])
+
+    def test_start_subscribes_to_input_topic(self):
+        import src.cloudwatch_metric_connector as app
+        configuration = Configuration(get_sample_config())
+
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, configuration)
+        connector.start()
+
+        self.mock_ipc.subscribe_to_iot_topic.assert_called_once()
+        self.mock_ipc.subscribe_to_pubsub_topic.assert_called_once()
+        assert self.mock_ipc.subscribe_to_pubsub_topic.call_args[0][0] == 'sample/put'
+        self.mock_metric_manager_class.assert_called_once_with(
+            'eu-west-2', 5, 5000, connector.status_publisher,
+            utils.DEFAULT_NAMESPACE_IDLE_TIMEOUT_SEC, utils.DEFAULT_MAX_NAMESPACES, utils.DEFAULT_MAX_BUFFER_BYTES,
+            {}, utils.DEFAULT_MAX_CONCURRENT_UPLOADS, connector.backpressure_monitor, {}, {}, connector.emf_sink,
+            {}, utils.DEFAULT_SKETCH_RELATIVE_ACCURACY / 100, connector.scheduler, connector.flush_schedule,
+            connector.drain_policy)
+
+    def test_start_prewarms_client(self):
+        import src.cloudwatch_metric_connector as app
+        configuration = Configuration(get_sample_config())
+
+        with patch('src.cloudwatch_metric_connector.Thread') as mock_thread:
+            app.CloudWatchMetricConnector(self.mock_ipc, configuration).start()
+            mock_thread.assert_called_once_with(target=self.mock_manager.prewarm_client, daemon=True)
+
         sample_config = get_sample_config()
-        self.mock_ipc.get_configuration.return_value = sample_config
+        sample_config[utils.PREWARM_CLIENT_KEY] = 'False'
+        configuration = Configuration(sample_config)
+
+        with patch('src.cloudwatch_metric_connector.Thread') as mock_thread:
+            app.CloudWatchMetricConnector(self.mock_ipc, configuration).start()
+            mock_thread.assert_not_called()
 
+    def test_pubsub_handler_puts_metrics(self):
         import src.cloudwatch_metric_connector as app
-        importlib.reload(app)
-
-        assert app.PUBLISH_REGION == sample_config[utils.PUBLISH_REGION_KEY]
-        assert app.PUBLISH_INTERVAL_SEC == int(
-            sample_config[utils.PUBLISH_INTERVAL_SEC_KEY])
-        assert app.MAX_METRICS == int(sample_config[utils.MAX_METRICS_KEY])
-        assert app.INPUT_TOPIC == sample_config[utils.INPUT_TOPIC_KEY]
-        assert app.OUTPUT_TOPIC == sample_config[utils.OUTPUT_TOPIC_KEY]
-        assert app.PUBSUB_TO_IOT_CORE == sample_config[utils.PUBSUB_TO_IOT_CORE_KEY]
-        assert app.pubsub_to_iot_core == True
-
-    def test_invalid_config_parameters(self):
-        invalid_config = get_sample_config()
-        invalid_config[utils.PUBLISH_INTERVAL_SEC_KEY] = 1000
-        invalid_config[utils.MAX_METRICS_KEY] = 1000
-        self.mock_ipc.get_configuration.return_value = invalid_config
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(get_sample_config()))
+        event = MagicMock()
+        event.json_message.message = create_valid_request_with_all_fields()
+
+        app.PubSubStreamHandler(connector).on_stream_event(event)
 
+        namespace, metric_datum, priority, cumulative = self.mock_manager.add_metric.call_args[0]
+        assert namespace == DEFAULT_NAMESPACE
+        assert priority is None
+        assert cumulative == False
+        assert metric_datum['Dimensions'][-1]['Name'] == 'coreName'
+
+    def test_pubsub_handler_puts_line_protocol(self):
         import src.cloudwatch_metric_connector as app
-        importlib.reload(app)
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(get_sample_config()))
+        event = MagicMock()
+        event.json_message = None
+        event.binary_message.message = b'GG,line=L1 Count=1,Latency=2|Milliseconds\nGG Count=x'
 
-        assert app.PUBLISH_INTERVAL_SEC == utils.MAX_PUBLISH_INTERVAL_SEC
-        assert app.MAX_METRICS == utils.MIN_MAX_METRICS
+        with patch.object(connector, 'report_error') as mock_report_error:
+            app.PubSubStreamHandler(connector).on_stream_event(event)
 
-        invalid_config[utils.PUBLISH_INTERVAL_SEC_KEY] = "string 1"
-        invalid_config[utils.MAX_METRICS_KEY] = "string 2"
-        self.mock_ipc.get_configuration.return_value = invalid_config
+        assert [call[0][1]['MetricName'] for call in self.mock_manager.add_metric.call_args_list] == \
+            ['Count', 'Latency']
+        assert self.mock_manager.add_metric.call_args[0][1]['Dimensions'][-1]['Name'] == 'coreName'
+        assert 'line 2' in str(mock_report_error.call_args[0][0])
 
+    def test_invalid_messages_are_reported_with_their_topic(self):
         import src.cloudwatch_metric_connector as app
-        importlib.reload(app)
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(get_sample_config()))
+        event = MagicMock()
+        event.json_message.context.topic = 'sensors/a'
+        event.json_message.message = {'request': {}}
 
-        assert app.PUBLISH_INTERVAL_SEC == utils.DEFAULT_PUBLISH_INTERVAL_SEC
-        assert app.MAX_METRICS == utils.DEFAULT_MAX_METRICS
+        with patch.object(connector.error_aggregator, 'add') as mock_add:
+            app.PubSubStreamHandler(connector).on_stream_event(event)
+            connector.report_error(ValueError('bad value'))
 
-        invalid_config[utils.PUBLISH_INTERVAL_SEC_KEY] = -1000
+        error, topic, payload = mock_add.call_args_list[0][0]
+        assert isinstance(error, ValueError)
+        assert (topic, payload) == ('sensors/a', {'request': {}})
+        assert mock_add.call_args_list[1][0][1:] == (connector.configuration.input_topic, None)
 
+    def test_topic_templates_are_subscribed_to(self):
         import src.cloudwatch_metric_connector as app
-        importlib.reload(app)
+        sample_config = get_sample_config()
+        sample_config[utils.TOPIC_TEMPLATES_KEY] = ['metrics/{namespace}/{line}/{station}']
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(sample_config))
+        connector.start()
 
-        assert app.PUBLISH_INTERVAL_SEC == utils.DEFAULT_PUBLISH_INTERVAL_SEC
+        assert self.mock_ipc.subscribe_to_pubsub_topic.call_args[0][0] == 'metrics/+/+/+'
+        assert self.mock_ipc.subscribe_to_iot_topic.call_args[0][0] == 'metrics/+/+/+'
+        assert len(connector.template_operations) == 2
 
-    def test_empty_config_values(self):
-        self.mock_ipc.get_configuration.return_value = get_empty_values_config()
+        sample_config[utils.TOPIC_TEMPLATES_KEY] = []
+        template_operations = connector.template_operations
+        connector.apply_configuration(Configuration(sample_config))
+        assert connector.template_operations == []
+        for operation in template_operations:
+            self.mock_ipc.close_subscription.assert_any_call(operation)
 
+    def test_templated_pubsub_handler_puts_metrics(self):
         import src.cloudwatch_metric_connector as app
-        importlib.reload(app)
+        from src.topic_template import TopicTemplate
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(get_sample_config()))
+        handler = app.PubSubStreamHandler(connector, TopicTemplate('metrics/{namespace}/{line}'))
+        event = MagicMock()
+        event.json_message.context.topic = 'metrics/Factory/L1'
+        event.json_message.message = {'metricName': 'Temperature', 'value': 21.5, 'unit': 'None',
+                                      'dimensions': [{'name': 'sensor', 'value': 'T1'}], 'priority': 'high'}
 
-        assert app.PUBLISH_REGION == utils.DEFAULT_PUBLISH_REGION
-        assert app.PUBLISH_INTERVAL_SEC == utils.DEFAULT_PUBLISH_INTERVAL_SEC
-        assert app.MAX_METRICS == utils.DEFAULT_MAX_METRICS
-        assert app.INPUT_TOPIC == utils.DEFAULT_INPUT_TOPIC
-        assert app.OUTPUT_TOPIC == utils.DEFAULT_OUTPUT_TOPIC
-        assert app.PUBSUB_TO_IOT_CORE == utils.DEFAULT_PUBSUB_TO_IOT_CORE
-        assert app.pubsub_to_iot_core == False
+        handler.on_stream_event(event)
+        namespace, metric_datum, priority = self.mock_manager.add_metric.call_args[0][:3]
+        assert namespace == 'Factory'
+        assert [dimension['Name'] for dimension in metric_datum['Dimensions']] == ['line', 'sensor', 'coreName']
+        assert metric_datum['Value'] == 21.5
+        assert priority == 0
 
-    def test_missing_keys_config(self):
-        self.mock_ipc.get_configuration.return_value = {}
+        event.json_message = None
+        event.binary_message.context.topic = 'metrics/Factory/L2'
+        event.binary_message.message = b'Count=1,Pressure=101.3|None'
+        handler.on_stream_event(event)
+        assert self.mock_manager.add_metric.call_count == 3
+        metric_datum = self.mock_manager.add_metric.call_args[0][1]
+        assert metric_datum['Dimensions'][0] == {'Name': 'line', 'Value': 'L2'}
 
+    def test_pubsub_handler_submits_to_ingest_workers(self):
         import src.cloudwatch_metric_connector as app
-        importlib.reload(app)
-
-        assert app.PUBLISH_REGION == utils.DEFAULT_PUBLISH_REGION
-        assert app.PUBLISH_INTERVAL_SEC == utils.DEFAULT_PUBLISH_INTERVAL_SEC
-        assert app.MAX_METRICS == utils.DEFAULT_MAX_METRICS
-        assert app.INPUT_TOPIC == utils.DEFAULT_INPUT_TOPIC
-        assert app.OUTPUT_TOPIC == utils.DEFAULT_OUTPUT_TOPIC
-        assert app.PUBSUB_TO_IOT_CORE == utils.DEFAULT_PUBSUB_TO_IOT_CORE
-        assert app.pubsub_to_iot_core == False
+        sample_config = get_sample_config()
+        sample_config[utils.INGEST_WORKERS_KEY] = '2'
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(sample_config))
+        event = MagicMock()
+        event.json_message.message = create_valid_request_with_all_fields()
+
+        with patch('src.cloudwatch_metric_connector.ShardedIngestEngine', autospec=True) as mock_engine:
+            connector.start()
+            app.PubSubStreamHandler(connector).on_stream_event(event)
+
+        mock_engine.assert_called_once_with(2, connector)
+        connector.ingest_engine.submit.assert_called_once_with(event.json_message.message, 1.0)
+        self.mock_manager.add_metric.assert_not_called()
+
+    def test_start_and_stop_statsd_listener(self, tmp_path):
+        import src.cloudwatch_metric_connector as app
+        sample_config = get_sample_config()
+        sample_config[utils.STATSD_ADDRESS_KEY] = str(tmp_path / 'statsd.sock')
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(sample_config))
+
+        connector.start()
+        statsd_listener = connector.statsd_listener
+        assert statsd_listener.namespace == utils.DEFAULT_STATSD_NAMESPACE
+        statsd_listener.aggregator.add_packets([b'Requests:1|c'], 1600000000.0)
+        connector.stop_ingest()
+
+        assert connector.statsd_listener is None
+        assert not (tmp_path / 'statsd.sock').exists()
+        namespace, metric_datum = self.mock_manager.add_metric.call_args[0][:2]
+        assert namespace == utils.DEFAULT_STATSD_NAMESPACE
+        assert metric_datum['Dimensions'][-1]['Name'] == 'coreName'
+        self.mock_manager.close.assert_called_once()
+
+    def test_sampled_messages_are_weighted(self):
+        import src.cloudwatch_metric_connector as app
+        sample_config = get_sample_config()
+        sample_config[utils.SAMPLE_RATES_KEY] = {DEFAULT_NAMESPACE: 50}
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(sample_config))
+        assert connector.sampler.get_rate(DEFAULT_NAMESPACE, DEFAULT_METRIC_NAME) == 0.5
+        event = MagicMock()
+        event.json_message.message = create_valid_request_with_all_fields()
+
+        with patch.object(connector.sampler, 'sample', side_effect=[None, 0.5]):
+            app.PubSubStreamHandler(connector).on_stream_event(event)
+            app.PubSubStreamHandler(connector).on_stream_event(event)
+
+        self.mock_manager.add_metric.assert_called_once()
+        metric_datum = self.mock_manager.add_metric.call_args[0][1]
+        assert metric_datum['Values'] == [DEFAULT_METRIC_VALUE]
+        assert metric_datum['Counts'] == [2.0]
+
+    def test_duplicate_messages_are_dropped(self):
+        import src.cloudwatch_metric_connector as app
+        sample_config = get_sample_config()
+        sample_config[utils.DEDUPLICATION_WINDOW_SEC_KEY] = '60'
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(sample_config))
+        event = MagicMock()
+        event.json_message.message = create_valid_request_with_all_fields()
+        event.json_message.message['request']['messageId'] = 'm1'
+
+        app.PubSubStreamHandler(connector).on_stream_event(event)
+        app.PubSubStreamHandler(connector).on_stream_event(event)
+
+        self.mock_manager.add_metric.assert_called_once()
+        assert connector.deduplicator.duplicate_count == 1
+
+    def test_apply_configuration_updates_settings_and_topics(self):
+        import src.cloudwatch_metric_connector as app
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(get_sample_config()))
+        connector.start()
+        old_pubsub_operation = connector.pubsub_operation
+        old_iot_operation = connector.iot_operation
+
+        new_config = get_sample_config()
+        new_config[utils.PUBLISH_INTERVAL_SEC_KEY] = '30'
+        new_config[utils.MAX_METRICS_KEY] = '3000'
+        new_config[utils.OUTPUT_TOPIC_KEY] = 'sample/new_status'
+        new_config[utils.INPUT_TOPIC_KEY] = 'sample/new_put'
+        new_config[utils.PUBSUB_TO_IOT_CORE_KEY] = 'False'
+        self.mock_ipc.get_configuration.return_value = new_config
+        self.mock_ipc.subscribe_to_pubsub_topic.reset_mock()
+        self.mock_ipc.subscribe_to_iot_topic.reset_mock()
+
+        connector.reload_configuration()
+
+        self.mock_manager.update_settings.assert_called_once_with(
+            'eu-west-2', 30, 3000, namespace_idle_timeout=utils.DEFAULT_NAMESPACE_IDLE_TIMEOUT_SEC,
+            max_namespaces=utils.DEFAULT_MAX_NAMESPACES, max_buffer_bytes=utils.DEFAULT_MAX_BUFFER_BYTES,
+            namespace_priorities={}, max_concurrent_uploads=utils.DEFAULT_MAX_CONCURRENT_UPLOADS,
+            region_routes={}, namespace_sinks={}, sketch_metrics={},
+            sketch_relative_accuracy=utils.DEFAULT_SKETCH_RELATIVE_ACCURACY / 100)
+        assert connector.status_publisher.output_topic == 'sample/new_status'
+        assert connector.status_publisher.pubsub_to_iot_core == False
+        assert self.mock_ipc.subscribe_to_pubsub_topic.call_args[0][0] == 'sample/new_put'
+        self.mock_ipc.subscribe_to_iot_topic.assert_not_called()
+        self.mock_ipc.close_subscription.assert_any_call(old_pubsub_operation)
+        self.mock_ipc.close_subscription.assert_any_call(old_iot_operation)
+        assert connector.iot_operation is None
+
+    def test_apply_configuration_keeps_unchanged_subscriptions(self):
+        import src.cloudwatch_metric_connector as app
+        connector = app.CloudWatchMetricConnector(self.mock_ipc, Configuration(get_sample_config()))
+        connector.start()
+        self.mock_ipc.subscribe_to_pubsub_topic.reset_mock()
+
+        connector.apply_configuration(Configuration(get_sample_config()))
+
+        self.mock_ipc.subscribe_to_pubsub_topic.assert_not_called()
+        self.mock_ipc.close_subscription.assert_not_called()
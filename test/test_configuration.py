@@ -0,0 +1,229 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from src import utils
+from src.configuration import Configuration
+
+
+def get_sample_config():
+    return {
+        utils.PUBLISH_REGION_KEY: 'eu-west-2',
+        utils.PUBLISH_INTERVAL_SEC_KEY: '5',
+        utils.MAX_METRICS_KEY: '5000',
+        utils.INPUT_TOPIC_KEY: 'sample/put',
+        utils.OUTPUT_TOPIC_KEY: 'sample/status',
+        utils.PUBSUB_TO_IOT_CORE_KEY: 'True'
+    }
+
+
+def get_empty_values_config():
+    return {
+        utils.PUBLISH_REGION_KEY: '',
+        utils.PUBLISH_INTERVAL_SEC_KEY: '',
+        utils.MAX_METRICS_KEY: '',
+        utils.INPUT_TOPIC_KEY: '',
+        utils.OUTPUT_TOPIC_KEY: '',
+        utils.PUBSUB_TO_IOT_CORE_KEY: ''
+    }
+
+
+class TestConfiguration(object):
+
+    def test_parsing_config_parameters(self):
+        sample_config = get_sample_config()
+
+        configuration = Configuration(sample_config)
+
+        assert configuration.publish_region == sample_config[utils.PUBLISH_REGION_KEY]
+        assert configuration.publish_interval_sec == int(
+            sample_config[utils.PUBLISH_INTERVAL_SEC_KEY])
+        assert configuration.max_metrics == int(sample_config[utils.MAX_METRICS_KEY])
+        assert configuration.input_topic == sample_config[utils.INPUT_TOPIC_KEY]
+        assert configuration.output_topic == sample_config[utils.OUTPUT_TOPIC_KEY]
+        assert configuration.pubsub_to_iot_core_value == sample_config[utils.PUBSUB_TO_IOT_CORE_KEY]
+        assert configuration.pubsub_to_iot_core == True
+        assert configuration.prewarm_client == True
+
+    def test_invalid_config_parameters(self):
+        invalid_config = get_sample_config()
+        invalid_config[utils.PUBLISH_INTERVAL_SEC_KEY] = 1000
+        invalid_config[utils.MAX_METRICS_KEY] = 1000
+
+        configuration = Configuration(invalid_config)
+
+        assert configuration.publish_interval_sec == utils.MAX_PUBLISH_INTERVAL_SEC
+        assert configuration.max_metrics == utils.MIN_MAX_METRICS
+
+        invalid_config[utils.PUBLISH_INTERVAL_SEC_KEY] = "string 1"
+        invalid_config[utils.MAX_METRICS_KEY] = "string 2"
+
+        configuration = Configuration(invalid_config)
+
+        assert configuration.publish_interval_sec == utils.DEFAULT_PUBLISH_INTERVAL_SEC
+        assert configuration.max_metrics == utils.DEFAULT_MAX_METRICS
+
+        invalid_config[utils.PUBLISH_INTERVAL_SEC_KEY] = -1000
+
+        configuration = Configuration(invalid_config)
+
+        assert configuration.publish_interval_sec == utils.DEFAULT_PUBLISH_INTERVAL_SEC
+
+    def test_empty_config_values(self):
+        configuration = Configuration(get_empty_values_config())
+
+        assert configuration.publish_region == utils.DEFAULT_PUBLISH_REGION
+        assert configuration.publish_interval_sec == utils.DEFAULT_PUBLISH_INTERVAL_SEC
+        assert configuration.max_metrics == utils.DEFAULT_MAX_METRICS
+        assert configuration.input_topic == utils.DEFAULT_INPUT_TOPIC
+        assert configuration.output_topic == utils.DEFAULT_OUTPUT_TOPIC
+        assert configuration.pubsub_to_iot_core_value == utils.DEFAULT_PUBSUB_TO_IOT_CORE
+        assert configuration.pubsub_to_iot_core == False
+
+    def test_missing_keys_config(self):
+        for config in [{}, None]:
+            configuration = Configuration(config)
+
+            assert configuration.publish_region == utils.DEFAULT_PUBLISH_REGION
+            assert configuration.publish_interval_sec == utils.DEFAULT_PUBLISH_INTERVAL_SEC
+            assert configuration.max_metrics == utils.DEFAULT_MAX_METRICS
+            assert configuration.input_topic == utils.DEFAULT_INPUT_TOPIC
+            assert configuration.output_topic == utils.DEFAULT_OUTPUT_TOPIC
+            assert configuration.pubsub_to_iot_core_value == utils.DEFAULT_PUBSUB_TO_IOT_CORE
+            assert configuration.pubsub_to_iot_core == False
+            assert configuration.prewarm_client == True
+
+    def test_prewarm_client_can_be_disabled(self):
+        sample_config = get_sample_config()
+        sample_config[utils.PREWARM_CLIENT_KEY] = 'false'
+
+        assert Configuration(sample_config).prewarm_client == False
+
+    def test_namespace_priorities(self):
+        sample_config = get_sample_config()
+        sample_config[utils.NAMESPACE_PRIORITIES_KEY] = {'Health': 'high', 'Telemetry': 'low', 'Other': 'urgent'}
+
+        assert Configuration(sample_config).namespace_priorities == {'Health': 0, 'Telemetry': 2}
+
+        sample_config[utils.NAMESPACE_PRIORITIES_KEY] = '{"Health": "high"}'
+        assert Configuration(sample_config).namespace_priorities == {'Health': 0}
+
+        sample_config[utils.NAMESPACE_PRIORITIES_KEY] = 'high'
+        assert Configuration(sample_config).namespace_priorities == {}
+
+    def test_backpressure_watermarks(self):
+        sample_config = get_sample_config()
+        configuration = Configuration(sample_config)
+        assert configuration.backpressure_topic == ""
+        assert configuration.backpressure_high_watermark == utils.DEFAULT_BACKPRESSURE_HIGH_WATERMARK
+        assert configuration.backpressure_low_watermark == utils.DEFAULT_BACKPRESSURE_LOW_WATERMARK
+
+        sample_config[utils.BACKPRESSURE_HIGH_WATERMARK_KEY] = '90'
+        sample_config[utils.BACKPRESSURE_LOW_WATERMARK_KEY] = '20'
+        configuration = Configuration(sample_config)
+        assert (configuration.backpressure_high_watermark, configuration.backpressure_low_watermark) == (90, 20)
+
+        # the low watermark must be below the high one
+        sample_config[utils.BACKPRESSURE_LOW_WATERMARK_KEY] = '95'
+        configuration = Configuration(sample_config)
+        assert (configuration.backpressure_high_watermark, configuration.backpressure_low_watermark) == (
+            utils.DEFAULT_BACKPRESSURE_HIGH_WATERMARK, utils.DEFAULT_BACKPRESSURE_LOW_WATERMARK)
+
+    def test_region_routes(self):
+        sample_config = get_sample_config()
+        sample_config[utils.REGION_ROUTES_KEY] = {
+            'Health': ['eu-west-2', 'us-west-2', 'us-west-2'], 'Fleet': 'us-east-1', 'Other': [1], 'Empty': []}
+
+        assert Configuration(sample_config).region_routes == {
+            'Health': ['eu-west-2', 'us-west-2'], 'Fleet': ['us-east-1']}
+        assert Configuration(get_sample_config()).region_routes == {}
+
+    def test_namespace_sinks(self):
+        sample_config = get_sample_config()
+        sample_config[utils.NAMESPACE_SINKS_KEY] = {'Telemetry': 'EMF', 'GG': 'PutMetricData', 'Other': 'kafka'}
+
+        configuration = Configuration(sample_config)
+        assert configuration.namespace_sinks == {'Telemetry': 'emf', 'GG': 'putmetricdata'}
+        assert configuration.emf_file_path == utils.DEFAULT_EMF_FILE_PATH
+        assert configuration.emf_file_max_bytes == utils.DEFAULT_EMF_FILE_MAX_BYTES
+
+    def test_weighted_namespaces_can_use_emf_sink(self):
+        sample_config = get_sample_config()
+        sample_config[utils.NAMESPACE_SINKS_KEY] = {'Latency': 'EMF', 'Fleet': 'EMF', 'StatsD': 'EMF'}
+        sample_config[utils.SKETCH_METRICS_KEY] = {'Latency': ['RequestTime']}
+        sample_config[utils.SAMPLE_RATES_KEY] = {'Fleet': 10}
+        sample_config[utils.STATSD_ADDRESS_KEY] = '8125'
+
+        # EMF records keep the counts of sketched and sampled datums
+        assert Configuration(sample_config).namespace_sinks == {'Latency': 'emf', 'Fleet': 'emf', 'StatsD': 'emf'}
+
+    def test_sketch_metrics(self):
+        sample_config = get_sample_config()
+        sample_config[utils.SKETCH_METRICS_KEY] = {'Latency': ['RequestTime'], 'Sensors': '*', 'Other': 3}
+        sample_config[utils.SKETCH_RELATIVE_ACCURACY_KEY] = '0.5'
+
+        configuration = Configuration(sample_config)
+        assert configuration.sketch_metrics == {'Latency': ['RequestTime'], 'Sensors': ['*']}
+        assert configuration.sketch_relative_accuracy == 0.5
+
+        sample_config[utils.SKETCH_RELATIVE_ACCURACY_KEY] = '90'
+        assert Configuration(sample_config).sketch_relative_accuracy == utils.DEFAULT_SKETCH_RELATIVE_ACCURACY
+
+    def test_flush_schedule(self):
+        sample_config = get_sample_config()
+        assert Configuration(sample_config).flush_alignment == False
+        assert Configuration(sample_config).flush_jitter == 0
+
+        sample_config[utils.FLUSH_ALIGNMENT_KEY] = 'True'
+        sample_config[utils.FLUSH_JITTER_KEY] = '150'
+        configuration = Configuration(sample_config)
+        assert configuration.flush_alignment == True
+        assert configuration.flush_jitter == utils.DEFAULT_FLUSH_JITTER
+
+    def test_drain_order(self):
+        sample_config = get_sample_config()
+        assert Configuration(sample_config).drain_order == utils.DEFAULT_DRAIN_ORDER
+
+        sample_config[utils.DRAIN_ORDER_KEY] = 'Newest'
+        assert Configuration(sample_config).drain_order == 'newest'
+        sample_config[utils.DRAIN_ORDER_KEY] = 'random'
+        assert Configuration(sample_config).drain_order == utils.DEFAULT_DRAIN_ORDER
+
+    def test_statsd_address(self):
+        sample_config = get_sample_config()
+        assert Configuration(sample_config).statsd_address == ""
+        assert Configuration(sample_config).statsd_namespace == utils.DEFAULT_STATSD_NAMESPACE
+
+        sample_config[utils.STATSD_ADDRESS_KEY] = 8125
+        assert Configuration(sample_config).statsd_address == '8125'
+        sample_config[utils.STATSD_ADDRESS_KEY] = '/tmp/statsd.sock'
+        assert Configuration(sample_config).statsd_address == '/tmp/statsd.sock'
+        sample_config[utils.STATSD_ADDRESS_KEY] = 'localhost:99999'
+        assert Configuration(sample_config).statsd_address == ""
+
+    def test_error_report_window(self):
+        sample_config = get_sample_config()
+        assert Configuration(sample_config).error_report_window_sec == utils.DEFAULT_ERROR_REPORT_WINDOW_SEC
+
+        sample_config[utils.ERROR_REPORT_WINDOW_SEC_KEY] = '0'
+        assert Configuration(sample_config).error_report_window_sec == 0
+        sample_config[utils.ERROR_REPORT_WINDOW_SEC_KEY] = utils.MAX_ERROR_REPORT_WINDOW_SEC + 1
+        assert Configuration(sample_config).error_report_window_sec == utils.DEFAULT_ERROR_REPORT_WINDOW_SEC
+
+    def test_topic_templates(self):
+        sample_config = get_sample_config()
+        assert Configuration(sample_config).topic_templates == []
+
+        sample_config[utils.TOPIC_TEMPLATES_KEY] = 'metrics/{namespace}/{line}'
+        assert Configuration(sample_config).topic_templates == ['metrics/{namespace}/{line}']
+        sample_config[utils.TOPIC_TEMPLATES_KEY] = \
+            '["metrics/{namespace}/{line}", "metrics/{line}", "metrics/{namespace}/{line}", "a/{namespace}"]'
+        assert Configuration(sample_config).topic_templates == ['metrics/{namespace}/{line}', 'a/{namespace}']
+
+    def test_sample_rates(self):
+        sample_config = get_sample_config()
+        assert Configuration(sample_config).sample_rates == {}
+
+        sample_config[utils.SAMPLE_RATES_KEY] = {
+            'Telemetry': 10, 'Sensors': {'Vibration': 1, '*': 50, 'Bad': 0}, 'Other': 'all'}
+        assert Configuration(sample_config).sample_rates == {
+            'Telemetry': {'*': 10}, 'Sensors': {'Vibration': 1, '*': 50}}
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from mock import patch
+from src.dedup import BloomFilter, Deduplicator
+from src.request import PutMetricRequest
+
+
+def create_request(value=12.0, timestamp=1600000000.0, message_id=None):
+    metric_data = {
+        "metricName": "Count",
+        "dimensions": [{"name": "hostname", "value": "test_hostname"}],
+        "value": value
+    }
+    if timestamp is not None:
+        metric_data["timestamp"] = timestamp
+    request = {"namespace": "Greengrass", "metricData": metric_data}
+    if message_id is not None:
+        request["messageId"] = message_id
+    return PutMetricRequest({"request": request})
+
+
+class TestDeduplicator(object):
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(1000, 0.001)
+        for i in range(1000):
+            bloom_filter.add(str(i).encode())
+
+        assert all(str(i).encode() in bloom_filter for i in range(1000))
+        assert sum(str(i).encode() in bloom_filter for i in range(1000, 11000)) < 50
+
+    def test_duplicates_by_content(self):
+        deduplicator = Deduplicator(60, 1000)
+
+        assert not deduplicator.is_duplicate(create_request())
+        assert deduplicator.is_duplicate(create_request())
+        assert not deduplicator.is_duplicate(create_request(value=13.0))
+        assert not deduplicator.is_duplicate(create_request(timestamp=1600000001.0))
+        assert deduplicator.duplicate_count == 1
+
+    def test_duplicates_by_message_id(self):
+        deduplicator = Deduplicator(60, 1000)
+
+        assert not deduplicator.is_duplicate(create_request(message_id='m1'))
+        assert deduplicator.is_duplicate(create_request(value=13.0, message_id='m1'))
+
+    def test_messages_without_id_nor_timestamp_are_accepted(self):
+        deduplicator = Deduplicator(60, 1000)
+
+        assert not deduplicator.is_duplicate(create_request(timestamp=None))
+        assert not deduplicator.is_duplicate(create_request(timestamp=None))
+
+    def test_messages_are_forgotten_after_two_windows(self):
+        with patch('src.dedup.time.monotonic') as mock_monotonic:
+            mock_monotonic.return_value = 0
+            deduplicator = Deduplicator(60, 1000)
+            assert not deduplicator.is_duplicate(create_request())
+
+            mock_monotonic.return_value = 70
+            assert deduplicator.is_duplicate(create_request())
+
+            mock_monotonic.return_value = 140
+            assert not deduplicator.is_duplicate(create_request())
@@ -0,0 +1,151 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import multiprocessing
+import pickle
+from threading import Lock
+
+from src.ingest import (MAX_MERGED_SAMPLES, ShardedIngestEngine, get_picklable_error, parse_batch, parse_message,
+                        unpack_batch)
+from src.metric.priority import PRIORITY_HIGH
+
+
+def create_message(namespace, value, timestamp=None):
+    message = {"request": {"namespace": namespace, "metricData": {"metricName": "Count", "value": value}}}
+    if timestamp is not None:
+        message['request']['metricData']['timestamp'] = timestamp
+    return message
+
+
+class RecordingConnector:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = []
+        self.errors = []
+        self.deduplicator = None
+
+    def put_metrics(self, metric_request):
+        with self.lock:
+            self.requests.append(metric_request)
+
+    def report_error(self, e):
+        with self.lock:
+            self.errors.append(e)
+
+
+class TestShardedIngestEngine(object):
+
+    def test_parse_message(self):
+        assert parse_message(json.dumps(create_message('GG', 1.0)).encode()).namespace == 'GG'
+        assert isinstance(parse_message(b'{"request": {}}'), ValueError)
+        assert isinstance(parse_message(b'not json'), ValueError)
+
+    def test_parse_batch_round_trip(self):
+        message = create_message('GG', 2.0, 1600000000)
+        message['request']['priority'] = 'high'
+        other = create_message('GG', 3.0, 1600000000)
+        other['request']['messageId'] = 'id'
+
+        requests, errors = unpack_batch(parse_batch([message, b'not json', json.dumps(other).encode()]))
+
+        assert len(errors) == 1 and isinstance(errors[0], ValueError)
+        assert [request.metric_datum['Value'] for request in requests] == [2.0, 3.0]
+        assert requests[0].priority == PRIORITY_HIGH
+        assert requests[1].message_id == 'id'
+
+    def test_parse_batch_weights_sampled_messages(self):
+        requests, _ = unpack_batch(parse_batch([create_message('GG', 2.0, 1600000000),
+                                                create_message('Other', 3.0, 1600000000)], [0.5, 1.0]))
+
+        assert requests[0].metric_datum['Counts'] == [2.0]
+        assert requests[1].metric_datum['Value'] == 3.0
+
+    def test_parse_batch_merges_the_samples_of_a_series(self):
+        batch = [create_message('GG', float(value % 3), 1599999960 + value % 60)
+                 for value in range(MAX_MERGED_SAMPLES + 10)]
+        batch.append(create_message('Other', 1.0, 1599999960))
+        batch.append(create_message('GG', 1.0, 1599999960 + 60))
+        batch.append(create_message('GG', 1.0, 1599999960))
+        batch[-1]['request']['priority'] = 'high'
+
+        requests, _ = unpack_batch(parse_batch(batch, [1.0] * (len(batch) - 1) + [0.5]))
+
+        assert [request.namespace for request in requests] == ['GG', 'GG', 'Other', 'GG', 'GG']
+        merged = requests[0].metric_datum
+        assert merged['Values'] == [0.0, 1.0, 2.0]
+        assert merged['Counts'] == [34.0, 33.0, 33.0]
+        assert merged['Timestamp'] == 1599999960
+        assert 'Value' not in merged
+        assert sum(requests[1].metric_datum['Counts']) == 10
+        assert requests[3].metric_datum['Value'] == 1.0
+        assert requests[4].priority == PRIORITY_HIGH and requests[4].metric_datum['Counts'] == [2.0]
+
+    def test_parse_batch_keeps_deduplicated_samples_apart(self):
+        batch = [create_message('GG', 1.0, 1600000000), create_message('GG', 1.0, 1600000001)]
+        batch.append(create_message('GG', 2.0))
+        batch.append(create_message('GG', 2.0))
+        batch[-1]['request']['metricData']['cumulative'] = True
+
+        requests, _ = unpack_batch(parse_batch(batch, merge_timestamped=False))
+
+        assert [request.metric_datum.get('Value') for request in requests] == [1.0, 1.0, 2.0, 2.0]
+
+    def test_messages_are_parsed_by_workers_in_order(self):
+        connector = RecordingConnector()
+        engine = ShardedIngestEngine(2, connector)
+        engine.start()
+
+        for value in range(100):
+            for namespace in ('GG', 'Other'):
+                message = create_message(namespace, float(value), 1600000000 + value * 60)
+                engine.submit(json.dumps(message).encode())
+        engine.submit(create_message('GG', 'not a number'))
+        engine.stop()
+
+        assert len(connector.requests) == 200
+        for namespace in ('GG', 'Other'):
+            values = [request.metric_value for request in connector.requests if request.namespace == namespace]
+            assert values == [float(value) for value in range(100)]
+        assert len(connector.errors) == 1
+
+    def test_merged_samples_are_all_put(self):
+        connector = RecordingConnector()
+        engine = ShardedIngestEngine(2, connector)
+        engine.start()
+
+        for value in range(1000):
+            engine.submit(create_message('GG', float(value % 5), 1600000000))
+        engine.stop()
+
+        assert len(connector.requests) < 1000
+        counts = [sum(request.metric_datum.get('Counts', [1])) for request in connector.requests]
+        assert sum(counts) == 1000
+
+    def test_dead_worker_is_replaced_without_losing_messages(self):
+        connector = RecordingConnector()
+        engine = ShardedIngestEngine(1, connector)
+        engine.start()
+        for worker in multiprocessing.active_children():
+            worker.kill()
+            worker.join()
+
+        # batches sent to the dead worker are parsed by the collector, later ones by a new worker
+        for value in range(100):
+            engine.submit(create_message('GG', float(value), 1600000000 + value * 60))
+        engine.stop()
+
+        assert [request.metric_value for request in connector.requests] == [float(value) for value in range(100)]
+        assert not multiprocessing.active_children()
+
+    def test_unpicklable_errors_are_sent_as_plain_exceptions(self):
+        class CustomError(ValueError):
+            def __init__(self, field, reason):
+                super().__init__('{} {}'.format(field, reason))
+
+        error = ValueError('invalid value')
+        assert get_picklable_error(error) is error
+        error = get_picklable_error(CustomError('value', 'is invalid'))
+        assert isinstance(pickle.loads(pickle.dumps(error)), ValueError)
+        assert str(error) == 'value is invalid'
@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from src.line_protocol import parse_headless_lines, parse_line_protocol
+from src.sampling import Sampler
+
+
+class TestLineProtocol(object):
+
+    def test_parse_metrics(self):
+        payload = (b'# a comment\n'
+                   b'Factory,line=L1,station=S4 Temperature=21.5|None,Pressure=101 1700000000.5\n'
+                   b'\n'
+                   b'Factory,line=L1,station=S4 Count=3\n')
+
+        metric_requests, errors = parse_line_protocol(payload, now=1600000000.0)
+
+        assert errors == []
+        assert [r.metric_name for r in metric_requests] == ['Temperature', 'Pressure', 'Count']
+        temperature, pressure, count = metric_requests
+        assert temperature.namespace == 'Factory'
+        assert temperature.metric_datum == {
+            'MetricName': 'Temperature',
+            'Value': 21.5,
+            'Dimensions': [{'Name': 'line', 'Value': 'L1'}, {'Name': 'station', 'Value': 'S4'}],
+            'Unit': 'None',
+            'Timestamp': 1700000000.5
+        }
+        assert temperature.has_timestamp
+        assert pressure.unit == 'Count'
+        assert count.timestamp == 1600000000.0
+        assert not count.has_timestamp
+        assert count.priority is None
+        assert not count.cumulative
+
+        # dimensions are not shared between metrics
+        temperature.add_dimension('coreName', 'core')
+        assert len(pressure.metric_datum['Dimensions']) == 2
+
+    def test_invalid_lines_are_reported(self):
+        payload = '\n'.join([
+            'GG Count=1',
+            'GG Count=one',
+            'GG Count=1|Parsecs',
+            'GG,line Count=1',
+            'GG Count=nan',
+            'GG',
+            'GG =1',
+            'GG Count=2 1700000000 extra',
+            'GG Count=3 yesterday',
+        ])
+
+        metric_requests, errors = parse_line_protocol(payload)
+
+        assert [r.metric_value for r in metric_requests] == [1.0]
+        assert [str(e).split(':')[0] for e in errors] == ['line {}'.format(i) for i in range(2, 10)]
+
+    def test_too_many_dimensions(self):
+        tags = ','.join('d{}=v'.format(i) for i in range(31))
+        metric_requests, errors = parse_line_protocol('GG,{} Count=1'.format(tags))
+
+        assert metric_requests == []
+        assert len(errors) == 1
+
+    def test_parse_headless_lines(self):
+        dimensions = [{'Name': 'line', 'Value': 'L1'}]
+
+        metric_requests, errors = parse_headless_lines(
+            b'Temperature=21.5|None,Count=2 1700000000\nPressure=x\nCount=1 2 3', 'Factory', dimensions,
+            now=1600000000.0)
+
+        assert [r.metric_name for r in metric_requests] == ['Temperature', 'Count']
+        assert metric_requests[0].namespace == 'Factory'
+        assert metric_requests[0].metric_datum['Dimensions'] == dimensions
+        assert metric_requests[0].metric_datum['Dimensions'] is not dimensions
+        assert metric_requests[1].timestamp == 1700000000
+        assert [str(e).split(':')[0] for e in errors] == ['line 2', 'line 3']
+
+    def test_sampled_metrics(self):
+        draws = iter([0.9, 0.05])
+        sampler = Sampler({'Factory': {'Vibration': 0.1}}, random=lambda: next(draws))
+
+        metric_requests, errors = parse_line_protocol(
+            b'Factory Vibration=x,Count=1\nFactory Vibration=2.5,Count=1', now=1600000000.0, sampler=sampler)
+
+        # the dropped sample is skipped before its value is parsed
+        assert errors == []
+        assert [r.metric_name for r in metric_requests] == ['Count', 'Vibration', 'Count']
+        assert metric_requests[1].metric_datum['Values'] == [2.5]
+        assert metric_requests[1].metric_datum['Counts'] == [10.0]
+        assert sampler.dropped_count == 1
@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+import queue
+import subprocess
+import sys
+from logging.handlers import QueueListener
+
+from src.log import AsyncQueueHandler, RateLimitFilter
+
+
+class VirtualClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FormatCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return 'payload'
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def create_record(msg, args=(), level=logging.WARNING):
+    return logging.LogRecord('test', level, __file__, 1, msg, args, None)
+
+
+class TestLog(object):
+
+    def test_rate_limit_per_message(self):
+        clock = VirtualClock()
+        rate_limit_filter = RateLimitFilter(2, 60, clock)
+
+        passed = [rate_limit_filter.filter(create_record('Invalid message: %s', (i,))) for i in range(5)]
+        assert passed == [True, True, False, False, False]
+        # other messages, or the same one at another level, have their own budget
+        assert rate_limit_filter.filter(create_record('Other message'))
+        assert rate_limit_filter.filter(create_record('Invalid message: %s', (0,), logging.ERROR))
+        assert rate_limit_filter.get_suppressed() == {'Invalid message: %s': 3}
+
+        clock.now = 60
+        record = create_record('Invalid message: %s', (5,))
+        assert rate_limit_filter.filter(record)
+        assert record.getMessage() == 'Invalid message: 5 (3 similar messages were suppressed)'
+        assert rate_limit_filter.get_suppressed() == {}
+
+    def test_records_are_formatted_by_the_listener(self):
+        log_queue = queue.Queue(10)
+        recording_handler = RecordingHandler()
+        test_logger = logging.getLogger('test_log.listener')
+        test_logger.propagate = False
+        test_logger.setLevel(logging.DEBUG)
+        queue_handler = AsyncQueueHandler(log_queue)
+        test_logger.addHandler(queue_handler)
+        listener = QueueListener(log_queue, recording_handler)
+        payload = FormatCounter()
+
+        try:
+            test_logger.debug("Response: %s", payload)
+            try:
+                raise ValueError('bad value')
+            except ValueError:
+                test_logger.exception("Failed: ")
+            assert payload.count == 0
+
+            listener.start()
+            listener.stop()
+        finally:
+            test_logger.removeHandler(queue_handler)
+
+        assert recording_handler.messages[0] == 'Response: payload'
+        assert payload.count == 1
+        assert 'Traceback' in recording_handler.messages[1] and 'bad value' in recording_handler.messages[1]
+
+    def test_full_queue_drops_records(self):
+        queue_handler = AsyncQueueHandler(queue.Queue(2))
+
+        for i in range(5):
+            queue_handler.handle(create_record('Message %s', (i,)))
+
+        assert queue_handler.queue.qsize() == 2
+        assert queue_handler.dropped_count == 3
+
+    def test_queued_records_are_written_on_early_exit(self):
+        script = ("from src import utils; assert utils.queue_handler not in utils.logger.handlers; "
+                  "utils.start_logging(); utils.logger.error('Exiting early'); exit(1)")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        result = subprocess.run([sys.executable, '-c', script], cwd=root, stdout=subprocess.PIPE)
+
+        assert result.returncode == 1
+        assert b'Exiting early' in result.stdout
@@ -87,6 +87,18 @@ class TestPutMetricRequest(object):
         assert put_request.metric_datum['Dimensions'][0]['Name'] == 'TestName'
         assert put_request.metric_datum['Dimensions'][0]['Value'] == 'TestValue'
 
+    def test_from_tuple_rebuilds_request(self):
+        event = self.create_valid_request_with_all_fields()
+
+        put_request = PutMetricRequest.from_tuple(PutMetricRequest(event).to_tuple())
+        put_request.add_dimension('TestName', 'TestValue')
+
+        assert put_request.namespace == DEFAULT_NAMESPACE
+        assert put_request.priority is None
+        assert put_request.cumulative == False
+        self.assert_default_metric_values(put_request.metric_datum)
+        assert put_request.metric_datum['Dimensions'][1]['Name'] == 'TestName'
+
     def test_parse_request_success_when_dimensions_empty(self):
         event = self.create_valid_request_with_all_fields()
         # clear out the dimension array
@@ -265,6 +277,67 @@ class TestPutMetricRequest(object):
         assert put_request.metric_datum['MetricName'] == DEFAULT_METRIC_NAME
         assert put_request.metric_datum['Value'] == DEFAULT_METRIC_VALUE
 
+    def test_parse_request_with_priority(self):
+        event = self.create_valid_request_with_all_fields()
+        assert PutMetricRequest(event).priority is None
+
+        event['request']['priority'] = 'high'
+        assert PutMetricRequest(event).priority == 0
+
+        event['request']['priority'] = 'urgent'
+        with pytest.raises(Exception) as error:
+            PutMetricRequest(event)
+
+        assert 'field ({}) is not a valid value'.format(FIELD_PRIORITY) in str(error.value)
+
+    def test_parse_request_with_message_id(self):
+        event = self.create_valid_request_with_all_fields()
+        assert PutMetricRequest(event).message_id is None
+
+        event['request']['messageId'] = 'm1'
+        assert PutMetricRequest(event).message_id == 'm1'
+
+        event['request']['messageId'] = 1
+        with pytest.raises(Exception) as error:
+            PutMetricRequest(event)
+
+        assert 'field ({}) is not a string'.format(FIELD_MESSAGE_ID) in str(error.value)
+
+    def test_parse_request_with_cumulative_flag(self):
+        event = self.create_valid_request_with_all_fields()
+        assert PutMetricRequest(event).cumulative == False
+
+        event['request']['metricData']['cumulative'] = True
+        assert PutMetricRequest(event).cumulative == True
+
+        event['request']['metricData']['cumulative'] = 'yes'
+        with pytest.raises(Exception) as error:
+            PutMetricRequest(event)
+
+        assert 'field ({}) is not a boolean'.format(FIELD_METRIC_CUMULATIVE) in str(error.value)
+
+    def test_sampled_request_is_weighted(self):
+        event = self.create_valid_request_with_all_fields()
+        event['request']['metricData']['sampleRate'] = 0.5
+
+        put_request = PutMetricRequest(event)
+        assert 'Value' not in put_request.metric_datum
+        assert put_request.metric_datum['Values'] == [DEFAULT_METRIC_VALUE]
+        assert put_request.metric_datum['Counts'] == [2.0]
+
+        # sampled again at the edge
+        put_request.apply_sample_rate(0.25)
+        assert put_request.metric_datum['Counts'] == [8.0]
+
+        event['request']['metricData']['cumulative'] = True
+        assert PutMetricRequest(event).metric_datum['Value'] == DEFAULT_METRIC_VALUE
+
+        for sample_rate in (0, 1.5, '0.5', True):
+            event['request']['metricData']['sampleRate'] = sample_rate
+            with pytest.raises(Exception) as error:
+                PutMetricRequest(event)
+            assert 'field ({}) is not a number'.format(FIELD_METRIC_SAMPLE_RATE) in str(error.value)
+
     def create_valid_request_with_all_fields(self):
         return {
             "request": {
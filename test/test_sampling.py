@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import random
+
+from src.request import PutMetricRequest
+from src.sampling import Sampler
+
+
+def create_message(namespace, metric_name, value=1.0):
+    return {"request": {"namespace": namespace, "metricData": {"metricName": metric_name, "value": value}}}
+
+
+class TestSampler(object):
+
+    def setup_method(self, method):
+        self.sampler = Sampler({'Sensors': {'Vibration': 0.01, '*': 0.5}, 'Telemetry': {'*': 0.1}},
+                               random=random.Random(42).random)
+
+    def test_get_rate(self):
+        assert self.sampler.get_rate('Sensors', 'Vibration') == 0.01
+        assert self.sampler.get_rate('Sensors', 'Temperature') == 0.5
+        assert self.sampler.get_rate('Telemetry', 'Anything') == 0.1
+        assert self.sampler.get_rate('Health', 'Anything') == 1.0
+
+    def test_sample_message_without_parsing(self):
+        message = create_message('Telemetry', 'Latency')
+        raw_message = json.dumps(message).encode('utf-8')
+        sampler = Sampler({'Telemetry': {'Latency': 0.1}}, random=lambda: 0.5)
+
+        assert sampler.sample_message(message) is None
+        assert sampler.sample_message(raw_message) is None
+        assert sampler.dropped_count == 2
+        assert sampler.sample_message(create_message('Health', 'Latency')) == 1.0
+        # messages which can not be sampled are kept for their parsing to report the error
+        assert sampler.sample_message(b'not json') == 1.0
+        assert sampler.sample_message({'request': {'namespace': ['Telemetry']}}) == 1.0
+        assert Sampler({'Telemetry': {'Latency': 0.1}}, random=lambda: 0.05).sample_message(raw_message) == 0.1
+
+    def test_weighted_samples_are_unbiased(self):
+        total_count = total_sum = 0
+        for value in range(20000):
+            message = create_message('Telemetry', 'Latency', float(value % 10))
+            sample_rate = self.sampler.sample_message(message)
+            if sample_rate is None:
+                continue
+            metric_request = PutMetricRequest(message)
+            metric_request.apply_sample_rate(sample_rate)
+            metric_datum = metric_request.metric_datum
+            total_count += metric_datum['Counts'][0]
+            total_sum += metric_datum['Values'][0] * metric_datum['Counts'][0]
+
+        assert abs(self.sampler.dropped_count - 18000) < 300
+        assert abs(total_count - 20000) < 1000
+        assert abs(total_sum - 90000) < 5000
@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from threading import Event
+
+from mock import MagicMock
+from src.scheduler import AsyncioScheduler, ThreadScheduler, create_scheduler
+
+
+class TestScheduler(object):
+
+    def setup_method(self, method):
+        self.scheduler = AsyncioScheduler(2)
+
+    def teardown_method(self, method):
+        self.scheduler.close()
+
+    def test_create_scheduler(self):
+        assert isinstance(create_scheduler(0), ThreadScheduler)
+        scheduler = create_scheduler(3)
+        assert scheduler.max_workers == 3
+        scheduler.close()
+
+    def test_thread_scheduler_does_not_load_asyncio(self):
+        script = "import sys; import src.scheduler; sys.exit('asyncio' in sys.modules)"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        assert subprocess.run([sys.executable, '-c', script], cwd=root).returncode == 0
+
+    def test_call_later_runs_on_executor(self):
+        called = Event()
+        threads = []
+
+        def callback(value):
+            threads.append((value, threading.current_thread().name))
+            called.set()
+
+        self.scheduler.call_later(0.01, callback, 'flush')
+
+        assert called.wait(2)
+        value, thread_name = threads[0]
+        assert value == 'flush'
+        assert thread_name.startswith('metrics-worker')
+
+    def test_cancelled_call_does_not_run(self):
+        callback = MagicMock()
+        scheduled_call = self.scheduler.call_later(0.05, callback)
+        scheduled_call.cancel()
+
+        time.sleep(0.1)
+        callback.assert_not_called()
+
+    def test_thread_count_does_not_grow_with_timers(self):
+        threads_before = threading.active_count()
+        called = [Event() for _ in range(50)]
+        for event in called:
+            self.scheduler.call_later(0.01, event.set)
+
+        assert all(event.wait(2) for event in called)
+        # the event loop thread is already running, only the two executor threads are added
+        assert threading.active_count() <= threads_before + 2
+
+    def test_submit_runs_inline_once_closed(self):
+        self.scheduler.close()
+        callback = MagicMock(side_effect=ValueError('publish failed'))
+
+        self.scheduler.submit(callback, 'response')
+
+        callback.assert_called_once_with('response')
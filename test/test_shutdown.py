@@ -0,0 +1,37 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from mock import MagicMock
+from src.shutdown import (RESPONSE_FIELD_UNPUBLISHED_METRICS,
+                          ShutdownCoordinator)
+
+
+class TestShutdownCoordinator(object):
+
+    def setup_method(self, method):
+        self.connector = MagicMock()
+        self.connector.configuration.shutdown_timeout_sec = 5
+        self.connector.metrics_manager.rejected_after_close = 0
+
+    def test_shutdown_stops_ingest_before_flushing(self):
+        calls = []
+        self.connector.stop_ingest.side_effect = lambda: calls.append('stop_ingest')
+        self.connector.metrics_manager.flush_all.side_effect = lambda deadline: calls.append('flush_all') or {}
+        self.connector.emf_sink.close.side_effect = lambda: calls.append('close_emf_sink')
+        self.connector.error_aggregator.close.side_effect = lambda: calls.append('close_error_aggregator')
+        self.connector.scheduler.close.side_effect = lambda: calls.append('close_scheduler')
+
+        leftover = ShutdownCoordinator(self.connector).shutdown()
+
+        assert calls == ['stop_ingest', 'flush_all', 'close_emf_sink', 'close_error_aggregator',
+                         'close_scheduler']
+        assert leftover == {}
+        self.connector.status_publisher.publish_and_wait.assert_not_called()
+
+    def test_shutdown_reports_leftover_metrics(self):
+        self.connector.metrics_manager.flush_all.return_value = {'GG': 3}
+
+        ShutdownCoordinator(self.connector).shutdown()
+
+        response = self.connector.status_publisher.publish_and_wait.call_args[0][0]
+        assert response['response'][RESPONSE_FIELD_UNPUBLISHED_METRICS] == {'GG': 3}
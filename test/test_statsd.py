@@ -0,0 +1,116 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import socket
+import time
+
+from mock import MagicMock
+from src.scheduler import ThreadScheduler
+from src.statsd import StatsdAggregator, StatsdListener, parse_statsd_address
+
+NOW = 1600000000.0
+
+
+def get_by_name(metric_data):
+    return {metric_datum['MetricName']: metric_datum for metric_datum in metric_data}
+
+
+class TestStatsd(object):
+
+    def test_parse_statsd_address(self):
+        assert parse_statsd_address('8125') == (socket.AF_INET, ('127.0.0.1', 8125))
+        assert parse_statsd_address(':8125') == (socket.AF_INET, ('127.0.0.1', 8125))
+        assert parse_statsd_address('0.0.0.0:8125') == (socket.AF_INET, ('0.0.0.0', 8125))
+        assert parse_statsd_address('/run/statsd.sock') == (socket.AF_UNIX, '/run/statsd.sock')
+        assert parse_statsd_address('') is None
+        assert parse_statsd_address('localhost:statsd') is None
+        assert parse_statsd_address('localhost:0') is None
+
+    def test_counters_are_summed_with_their_sample_rate(self):
+        aggregator = StatsdAggregator(0.01)
+
+        aggregator.add_packets([b'Requests:1|c\nRequests:2|c|@0.5', b'Requests:1:1|c|#line:L1'], NOW)
+        metric_data, invalid_count, _ = aggregator.drain()
+
+        assert invalid_count == 0
+        assert len(metric_data) == 2
+        untagged, tagged = sorted(metric_data, key=lambda metric_datum: len(metric_datum['Dimensions']))
+        assert untagged['Value'] == 5.0
+        assert untagged['Unit'] == 'Count'
+        assert tagged['Value'] == 2.0
+        assert tagged['Dimensions'] == [{'Name': 'line', 'Value': 'L1'}]
+        assert aggregator.drain()[0] == []
+
+    def test_gauges_keep_their_value_for_signed_updates(self):
+        aggregator = StatsdAggregator(0.01)
+
+        aggregator.add_packets([b'Temperature:20|g\nTemperature:+5|g'], NOW)
+        assert get_by_name(aggregator.drain()[0])['Temperature']['Value'] == 25.0
+        # a gauge that was not updated is not reported again
+        assert aggregator.drain()[0] == []
+
+        aggregator.add_packets([b'Temperature:-10|g'], NOW + 1)
+        metric_datum = get_by_name(aggregator.drain()[0])['Temperature']
+        assert metric_datum['Value'] == 15.0
+        assert metric_datum['Timestamp'] == NOW + 1
+
+    def test_timers_are_sketched(self):
+        aggregator = StatsdAggregator(0.01)
+
+        aggregator.add_packets([b'RequestTime:10|ms\nRequestTime:10:20|ms|@0.5\nSize:3|h'], NOW)
+        metric_data = get_by_name(aggregator.drain()[0])
+
+        request_time = metric_data['RequestTime']
+        assert request_time['Unit'] == 'Milliseconds'
+        assert 'Value' not in request_time
+        assert sum(request_time['Counts']) == 5.0
+        assert abs(request_time['Values'][0] - 10) <= 0.1
+        assert metric_data['Size']['Unit'] == 'None'
+
+    def test_invalid_lines_are_counted(self):
+        aggregator = StatsdAggregator(0.01)
+
+        aggregator.add_packets([b'Requests:1|c\nUsers:alice|s\nRequests:x|c\nRequests:1|c|@2\nRequests:1'], NOW)
+        metric_data, invalid_count, first_error = aggregator.drain()
+
+        assert len(metric_data) == 1
+        assert invalid_count == 4
+        assert 'Users:alice|s' in first_error
+        assert aggregator.drain()[1:] == (0, None)
+
+    def test_listener_reads_datagrams(self, tmp_path):
+        path = str(tmp_path / 'statsd.sock')
+        connector = MagicMock()
+        listener = StatsdListener(parse_statsd_address(path), 'App', 60, 0.01, connector, ThreadScheduler())
+        listener.start()
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        for _ in range(10):
+            client.sendto(b'Requests:1|c|#line:L1', path)
+        client.sendto(b'Requests:x|c', path)
+        client.close()
+        deadline = time.time() + 2
+        while listener.aggregator.invalid_count == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        listener.stop()
+
+        metric_request = connector.put_metrics.call_args[0][0]
+        assert metric_request.namespace == 'App'
+        assert metric_request.metric_datum['Value'] == 10.0
+        assert 'Requests:x|c' in str(connector.report_error.call_args[0][0])
+
+    def test_listener_flushes_every_window(self, tmp_path):
+        scheduler = MagicMock()
+        connector = MagicMock()
+        listener = StatsdListener(
+            parse_statsd_address(str(tmp_path / 'statsd.sock')), 'App', 0, 0.01, connector, scheduler)
+        listener.start()
+        listener.aggregator.add_packets([b'Requests:1|c'], NOW)
+
+        delay, flush_timer = scheduler.call_later.call_args[0]
+        flush_timer()
+        listener.stop()
+
+        assert delay == 1
+        connector.put_metrics.assert_called_once()
+        assert scheduler.call_later.call_count == 2
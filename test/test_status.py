@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from mock import MagicMock
+from src import utils
+from src.status import (MAX_ERROR_GROUPS, MAX_ERROR_SAMPLE_CHARS, MAX_ERROR_SAMPLES, RESPONSE_FIELD_ERROR_COUNT,
+                        RESPONSE_FIELD_ERRORS, RESPONSE_FIELD_SAMPLES, RESPONSE_FIELD_TOPIC,
+                        RESPONSE_FIELD_UNGROUPED_COUNT, ErrorAggregator, format_sample)
+
+
+class TestErrorAggregator(object):
+
+    def setup_method(self, method):
+        self.status_publisher = MagicMock()
+        self.scheduler = MagicMock()
+        self.aggregator = ErrorAggregator(self.status_publisher, 5, self.scheduler)
+
+    def fire_timer(self):
+        delay, callback = self.scheduler.call_later.call_args[0]
+        assert delay == 5
+        callback()
+
+    def test_errors_are_grouped_by_class_and_topic(self):
+        for index in range(10):
+            self.aggregator.add(ValueError('bad value {}'.format(index)), 'sensors/a', {'value': index})
+        self.aggregator.add(KeyError('metricName'), 'sensors/a', b'{}')
+        self.aggregator.add(ValueError('bad value'), 'sensors/b')
+
+        self.status_publisher.publish.assert_not_called()
+        self.scheduler.call_later.assert_called_once()
+        self.fire_timer()
+
+        response = self.status_publisher.publish.call_args[0][0][utils.RESPONSE]
+        assert response[utils.RESPONSE_FIELD_ERROR_CLASS] == str(ValueError)
+        assert response[utils.RESPONSE_FIELD_ERROR_MSG] == 'bad value 0'
+        assert response[RESPONSE_FIELD_ERROR_COUNT] == 12
+        assert response[RESPONSE_FIELD_UNGROUPED_COUNT] == 0
+        errors = response[RESPONSE_FIELD_ERRORS]
+        assert [(error[RESPONSE_FIELD_TOPIC], error[RESPONSE_FIELD_ERROR_COUNT]) for error in errors] == \
+            [('sensors/a', 10), ('sensors/a', 1), ('sensors/b', 1)]
+        assert errors[0][RESPONSE_FIELD_SAMPLES] == ['{"value": 0}', '{"value": 1}', '{"value": 2}']
+        assert errors[1][RESPONSE_FIELD_SAMPLES] == ['{}']
+        assert errors[2][RESPONSE_FIELD_SAMPLES] == []
+
+        # The next error starts a new window
+        self.aggregator.add(ValueError('bad value'), 'sensors/a')
+        assert self.scheduler.call_later.call_count == 2
+
+    def test_groups_and_samples_are_bounded(self):
+        for index in range(MAX_ERROR_GROUPS + 10):
+            self.aggregator.add(ValueError('bad value'), 'sensors/{}'.format(index), 'x' * 2000)
+        self.fire_timer()
+
+        response = self.status_publisher.publish.call_args[0][0][utils.RESPONSE]
+        assert len(response[RESPONSE_FIELD_ERRORS]) == MAX_ERROR_GROUPS
+        assert response[RESPONSE_FIELD_UNGROUPED_COUNT] == 10
+        assert response[RESPONSE_FIELD_ERROR_COUNT] == MAX_ERROR_GROUPS + 10
+        assert len(response[RESPONSE_FIELD_ERRORS][0][RESPONSE_FIELD_SAMPLES][0]) == MAX_ERROR_SAMPLE_CHARS + 3
+        assert MAX_ERROR_SAMPLES == 3
+
+    def test_format_sample(self):
+        assert format_sample(b'Count=x') == 'Count=x'
+        assert format_sample(b'\xff') == '�'
+        assert format_sample({'value': 1}) == '{"value": 1}'
+
+    def test_zero_window_reports_each_error(self):
+        self.aggregator.update_settings(0)
+        self.aggregator.add(ValueError('bad value'), 'sensors/a', b'x')
+
+        self.scheduler.call_later.assert_not_called()
+        response = self.status_publisher.publish.call_args[0][0]
+        assert response == utils.generate_error_response(str(ValueError), 'bad value', "")
+
+    def test_close_publishes_pending_errors(self):
+        timer = self.scheduler.call_later.return_value
+        self.aggregator.add(ValueError('bad value'), 'sensors/a')
+
+        self.aggregator.close()
+
+        timer.cancel.assert_called_once()
+        response = self.status_publisher.publish_and_wait.call_args[0][0][utils.RESPONSE]
+        assert response[RESPONSE_FIELD_ERROR_COUNT] == 1
+
+        self.aggregator.add(ValueError('late value'), 'sensors/a')
+        assert self.scheduler.call_later.call_count == 1
+        self.status_publisher.publish.assert_called_once()
+
+    def test_flush_without_errors_publishes_nothing(self):
+        self.aggregator.close()
+
+        self.status_publisher.publish_and_wait.assert_not_called()
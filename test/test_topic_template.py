@@ -0,0 +1,57 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from src.metric.priority import PRIORITY_HIGH
+from src.request import PutMetricRequest
+from src.topic_template import TopicTemplate
+from src.utils import MAX_DIMENSIONS_PER_METRIC
+
+
+class TestTopicTemplate(object):
+
+    def test_subscription_topic(self):
+        assert TopicTemplate('metrics/{namespace}/{line}/{station}').topic == 'metrics/+/+/+'
+        assert TopicTemplate('{namespace}/factory/{line}').topic == '+/factory/+'
+
+    def test_invalid_templates(self):
+        for template in ('metrics/{line}', 'metrics/{namespace}/{namespace}', 'metrics/{namespace}/#',
+                         'metrics/ns-{namespace}', 'metrics/{namespace}/{}', '', None):
+            with pytest.raises(ValueError):
+                TopicTemplate(template)
+
+    def test_match(self):
+        topic_template = TopicTemplate('metrics/{line}/{namespace}/{station}')
+
+        namespace, dimensions = topic_template.match('metrics/L1/Factory/S4')
+
+        assert namespace == 'Factory'
+        assert dimensions == [{'Name': 'line', 'Value': 'L1'}, {'Name': 'station', 'Value': 'S4'}]
+        assert topic_template.match('metrics/L1/Factory/S4')[1] is dimensions
+        with pytest.raises(ValueError):
+            topic_template.match('metrics/L1/Factory')
+        with pytest.raises(ValueError):
+            topic_template.match('metrics/L1//S4')
+
+    def test_parse_templated_message(self):
+        topic_template = TopicTemplate('metrics/{namespace}/{line}')
+        namespace, dimensions = topic_template.match('metrics/Factory/L1')
+
+        metric_request = PutMetricRequest.from_template(namespace, dimensions, {
+            'metricName': 'Temperature', 'value': 21.5, 'unit': 'None', 'messageId': 'm1', 'cumulative': True,
+            'priority': 'high', 'dimensions': [{'name': 'station', 'value': 'S4'}]})
+
+        assert metric_request.namespace == 'Factory'
+        assert metric_request.message_id == 'm1'
+        assert metric_request.priority == PRIORITY_HIGH
+        assert metric_request.cumulative
+        assert metric_request.metric_datum['Dimensions'] == [{'Name': 'line', 'Value': 'L1'},
+                                                             {'Name': 'station', 'Value': 'S4'}]
+        assert dimensions == [{'Name': 'line', 'Value': 'L1'}]
+        invalid_messages = (['Temperature'], {'value': 1, 'dimensions': 'x'},
+                            {'metricName': 'T', 'value': 1, 'messageId': 1},
+                            {'metricName': 'T', 'value': 1,
+                             'dimensions': [{'name': 'd', 'value': 'v'}] * MAX_DIMENSIONS_PER_METRIC})
+        for message in invalid_messages:
+            with pytest.raises(ValueError):
+                PutMetricRequest.from_template(namespace, dimensions, message)